@@ -1,20 +1,185 @@
 # -*- coding: utf-8 -*-
 #
-# Copyright (C) 2024 ASXE  All Rights Reserved 
+# Copyright (C) 2024 ASXE  All Rights Reserved
 #
 # @Time    : 2024/8/10 上午11:24
 # @Author  : ASXE
 
+"""
+分级, 带缓冲的日志
+
+日志先写入内存缓冲, 满 64KB, 遇到 error, 调用 flush() 或进程退出时一次性写出.
+每次写出都是对文件描述符的一次 os.write, 只包含完整的行; 工作进程 (由 fork 或 spawn 创建) 中每条日志立即写出,
+多个进程同时输出时不会出现行内交错. 输出到控制台时改为经过 sys.stdout 一次写出,
+Windows 控制台需要按宽字符写入, 直接写 UTF-8 字节时中文会乱码.
+
+级别与格式保存在环境变量 DDCS_LOG_LEVEL / DDCS_LOG_FORMAT 中, 工作进程自动继承.
+JSON 模式下每条日志输出为一行 JSON, 便于 CI 解析.
+"""
+
+import argparse
+import atexit
+import json
+import multiprocessing
+import os
+import sys
 import time
 
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+_NAMES = {DEBUG: "debug", INFO: "info", WARN: "warn", ERROR: "error"}
+_COLORS = {DEBUG: "\033[90m", INFO: "\033[92m", WARN: "\033[33m", ERROR: "\033[91m"}
+_BUFFER_LIMIT = 64 << 10
+# 折叠输出时最多列出的条目数, 其余只给出数量
+GROUP_LIMIT = 20
+
+_level = int(os.environ.get("DDCS_LOG_LEVEL", INFO))
+_json = os.environ.get("DDCS_LOG_FORMAT") == "json"
+_fd = 1
+_tty = None
+_buffer = []
+_buffered = 0
+# 不是工作进程的进程号, 工作进程中的日志不缓冲
+_main_pid = os.getpid() if multiprocessing.parent_process() is None else None
+# 同一秒内的日志复用格式化好的时间
+_stamp_second = None
+_stamp = ""
+
+
+def configure(level: int | None = None, json_mode: bool | None = None, fd: int | None = None) -> None:
+    """设置级别, 输出格式和目标文件描述符, 并写入环境变量供之后创建的工作进程继承"""
+    global _level, _json, _fd, _tty
+    flush()
+    if level is not None:
+        _level = level
+        os.environ["DDCS_LOG_LEVEL"] = str(level)
+    if json_mode is not None:
+        _json = json_mode
+        os.environ["DDCS_LOG_FORMAT"] = "json" if json_mode else "text"
+    if fd is not None:
+        _fd = fd
+        _tty = None
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--quiet", action="store_true", help="只输出警告和错误")
+    parser.add_argument("--verbose", action="store_true", help="输出每条规则的替换情况等调试信息")
+    parser.add_argument("--log-json", action="store_true", help="每条日志输出为一行 JSON")
+
+
+def setup(args: argparse.Namespace) -> None:
+    """按 add_arguments 添加的命令行参数设置日志"""
+    level = WARN if args.quiet else DEBUG if args.verbose else INFO
+    configure(level, args.log_json)
+
+
+def enabled(level: int) -> bool:
+    return level >= _level
+
+
+def _timestamp() -> str:
+    global _stamp_second, _stamp
+    now = int(time.time())
+    if now != _stamp_second:
+        _stamp_second = now
+        _stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    return _stamp
+
+
+def _is_tty() -> bool:
+    global _tty
+    if _tty is None:
+        try:
+            _tty = os.isatty(_fd)
+        except OSError:
+            _tty = False
+    return _tty
+
+
+def _console_stream():
+    """_fd 是控制台且与 sys.stdout 是同一个文件描述符时返回 sys.stdout, 否则返回 None"""
+    if sys.stdout is None or not _is_tty():
+        return None
+    try:
+        return sys.stdout if sys.stdout.fileno() == _fd else None
+    except (OSError, ValueError):
+        return None
+
+
+def _emit(level: int, message: str, fields: dict) -> None:
+    global _buffered
+    if level < _level:
+        return
+    if _json:
+        line = json.dumps({"time": _timestamp(), "level": _NAMES[level], "pid": os.getpid(), "message": message,
+                           **fields}, ensure_ascii=False, default=str)
+    elif _is_tty():
+        line = f"{_COLORS[level]}\033[3m{_timestamp()} : {message}\033[0m"
+    else:
+        line = f"{_timestamp()} [{_NAMES[level]}] {message}"
+    _buffer.append(line + "\n")
+    _buffered += len(line) + 1
+    if level >= ERROR or _buffered >= _BUFFER_LIMIT or os.getpid() != _main_pid:
+        flush()
+
+
+def flush() -> None:
+    global _buffered
+    if not _buffer:
+        return
+    text = "".join(_buffer)
+    _buffer.clear()
+    _buffered = 0
+    # 先写出 print 等经过 sys.stdout 的内容, 保持先后顺序
+    if sys.stdout is not None:
+        sys.stdout.flush()
+    stream = _console_stream()
+    if stream is not None:
+        stream.write(text)
+        stream.flush()
+        return
+    view = memoryview(text.encode("utf-8", "replace"))
+    while view:
+        written = os.write(_fd, view)
+        view = view[written:]
+
+
+def debug(message, **fields) -> None:
+    _emit(DEBUG, str(message), fields)
+
+
+def info(message, **fields) -> None:
+    _emit(INFO, str(message), fields)
+
+
+def warn(message, **fields) -> None:
+    _emit(WARN, str(message), fields)
+
 
-def error(message):
-    print(f"\033[91m\033[3m{time.strftime('%Y-%m-%d %H:%M:%S')} : {message}\033[0m")
+def error(message, **fields) -> None:
+    _emit(ERROR, str(message), fields)
 
 
-def info(message):
-    print(f"\033[92m\033[3m{time.strftime('%Y-%m-%d %H:%M:%S')} : {message}\033[0m")
+def group(title: str, items: list[str], level: int = WARN, limit: int = GROUP_LIMIT) -> None:
+    """
+    把一组同类消息折叠为一条: 标题与数量, 之后列出前 limit 项 (调试级别时全部列出).
+    JSON 模式下输出一条带完整 items 列表的记录. items 为空时不输出
+    """
+    if not items or level < _level:
+        return
+    if _json:
+        _emit(level, f"{title} ({len(items)})", {"items": list(items)})
+        return
+    shown = items if _level <= DEBUG else items[:limit]
+    lines = [f"{title} ({len(items)}):"] + [f"    {item}" for item in shown]
+    if len(shown) < len(items):
+        lines.append(f"    ... 其余 {len(items) - len(shown)} 条, 使用 --verbose 查看全部")
+    _emit(level, "\n".join(lines), {})
 
 
-def warn(message):
-    print(f"\033[33m\033[3m{time.strftime('%Y-%m-%d %H:%M:%S')} : {message}\033[0m")
+if hasattr(os, "register_at_fork"):
+    # fork 前先写出缓冲, 子进程不会继承未写出的日志, 父进程之前的日志也不会排到子进程之后
+    os.register_at_fork(before=flush)
+atexit.register(flush)
@@ -5,12 +5,25 @@
 # @Time    : 2024/8/9 下午4:17
 # @Author  : ASXE
 import argparse
+import os
 import time
+from collections import Counter
 from pathlib import Path
 
 from common import log
+from lib.asar import patch_archive
+from lib.backup import BackupError, apply_backup, default_backup_path, save_backup
+from lib.catalog import collect_js_files, load_config
 from lib.extract import replace
+from lib.manifest import IncrementalRunner
+from lib.parallel import default_jobs, iter_archive_results, process_files_parallel
 from lib.processor import DDProcessor, FileProcessor
+from lib.profiler import Profiler
+from lib.report import report
+from lib.rulepack import load_rulepack
+from lib.splice import default_index_path, load_index, splice_tree
+from lib.walker import min_rule_size, walk_files
+from lib.watch import ArchiveDaemon
 
 
 def cost_time(func):
@@ -23,39 +36,168 @@ def cost_time(func):
     return fun
 
 
+def cache_dir(config_path: str) -> str:
+    # 规则包, 增量清单和差异备份都放在配置文件旁边
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), ".ddcs-cache")
+
+
 @cost_time
-def run(root_path: str, config_path: str, process_asar: bool):
+def run(root_path: str, config_path: str, process_asar: bool, jobs: int = 1, incremental: bool = False,
+        profile: str | None = None):
     log.info("脚本已启动...")
     time.sleep(1)
+    profiler = Profiler(profile is not None)
 
     if process_asar:
-        DDProcessor(True)
+        with profiler.phase("unpack"):
+            DDProcessor(True)
 
     fp = FileProcessor(root_path, config_path)
-    file_paths = fp.recursive_listdir()
     log.info("汉化开始")
-    for transformation in fp.get_transformations():
-        search = transformation["src"]
-        replacement = transformation["dest"]
-        replaced = fp.process_files(file_paths, search, replacement)
-        if not replaced:
-            log.warn(search)
+    with profiler.phase("config"):
+        # 所有规则编译为一个匹配器, 每个文件只读写一次; 配置未变化时直接使用缓存的规则包
+        pack = load_rulepack(config_path, fp.get_transformations)
+        if profiler.enabled:
+            # 规则包是懒加载的, 提前反序列化以免计入 replace 阶段
+            pack.load()
+    # 边遍历边处理, 代替 fp.recursive_listdir() 预先列出全部文件; 二进制资源和小于最短规则的文件不会交给工作进程
+    walk_stats = Counter()
+    file_paths = walk_files(root_path, min_rule_size(pack.transformations), stats=walk_stats)
+    with profiler.phase("replace"):
+        if incremental:
+            # 清单和内容存储放在配置文件旁边, 输入与相关规则都没变的文件直接复用上次的输出
+            runner = IncrementalRunner(pack, cache_dir(config_path))
+            hits = runner.run(file_paths, jobs, profiler)
+            log.info(f"增量汉化：复用 {runner.stats['reused']} 个文件，重新处理 {runner.stats['processed']} 个文件")
         else:
-            log.info(f"{search} -> {replacement}")
+            hits = process_files_parallel(pack, file_paths, jobs, profiler)
+    skipped = walk_stats["extension"] + walk_stats["magic"]
+    log.debug(f"遍历 {walk_stats['files']} 个文件，跳过二进制资源 {skipped} 个，大小不符 {walk_stats['size']} 个，"
+              f"处理 {walk_stats['bytes'] / 1048576:.1f} MB")
+    report(pack.transformations, hits, os.path.basename(config_path))
 
     if process_asar:
-        DDProcessor(False)
+        with profiler.phase("pack"):
+            DDProcessor(False)
+    if profiler.enabled:
+        profiler.write(profile, pack.transformations)
+        log.info(f"性能报告已写入 {profile}")
 
 
 @cost_time
-def run_v2(root_path: str, process_asar: bool):
+def run_asar(asar_path: str, output_path: str, config_path: str, jobs: int = 1, profile: str | None = None):
+    # 直接读写 asar 归档, 不需要 Node 的 asar extract / asar pack, 未修改的条目原样拷贝
+    log.info("脚本已启动...")
+    log.info("汉化开始")
+    profiler = Profiler(profile is not None)
+    with profiler.phase("config"):
+        pack = load_rulepack(config_path, FileProcessor(os.path.dirname(asar_path), config_path).get_transformations)
+        if profiler.enabled:
+            pack.load()
+    hits = Counter()
+    replacements = {}
+    with profiler.phase("replace"):
+        for name, result, file_hits, *stats in iter_archive_results(pack, asar_path, jobs, profiler.enabled):
+            if result is not None:
+                replacements[name] = result
+            hits.update(file_hits)
+            if profiler.enabled:
+                profiler.record_file(name, stats[0], stats[1], file_hits, result is not None)
+    with profiler.phase("pack"):
+        backup_path = default_backup_path(cache_dir(config_path), output_path)
+        backup = save_backup(backup_path, asar_path, replacements)
+        patch_archive(asar_path, output_path, replacements)
+    log.info(f"已修改 {len(replacements)} 个文件，写入 {output_path}")
+    log.info(f"差异备份已写入 {backup_path}（{backup['entries']} 个文件，{backup['edits']} 处修改，"
+             f"{backup['size'] / 1024:.1f} KB）")
+    report(pack.transformations, hits, os.path.basename(config_path))
+    if profiler.enabled:
+        profiler.write(profile, pack.transformations)
+        log.info(f"性能报告已写入 {profile}")
+
+
+@cost_time
+def run_restore(asar_path: str, output_path: str, config_path: str, state: str):
+    # 用差异备份把汉化后的归档还原为原始版本 (state 为 original), 或把原始版本重新汉化 (state 为 localized)
+    backup_path = default_backup_path(cache_dir(config_path), asar_path)
+    if not os.path.exists(backup_path):
+        log.error(f"没有找到 {asar_path} 的差异备份，请先使用 --asar 汉化一次")
+        raise SystemExit(1)
+    try:
+        changed = apply_backup(backup_path, asar_path, output_path, state)
+    except BackupError as e:
+        log.error(str(e))
+        raise SystemExit(1)
+    action = "还原" if state == "original" else "重新汉化"
+    if changed:
+        log.info(f"已{action} {changed} 个文件，写入 {output_path}")
+    else:
+        log.info(f"归档已是{'原始' if state == 'original' else '汉化后'}的版本，无需{action}")
+
+
+def run_watch(asar_path: str, config_path: str, jobs: int = 1):
+    # 常驻运行, Docker Desktop 自动更新覆盖 app.asar 后只重新汉化变化的文件, Ctrl+C 退出
+    pack = load_rulepack(config_path, FileProcessor(os.path.dirname(asar_path), config_path).get_transformations)
+    daemon = ArchiveDaemon(asar_path, pack, cache_dir(config_path), jobs)
+    log.info(f"开始监视 {daemon.asar_path}（{daemon.watcher.kind}）")
+    try:
+        if daemon.is_localized():
+            log.info("归档已是汉化后的版本，等待更新")
+        else:
+            localize_archive(daemon, config_path)
+        while True:
+            # 常驻进程的日志在等待前及时输出
+            log.flush()
+            daemon.wait_for_update()
+            log.info("检测到 app.asar 已更新")
+            localize_archive(daemon, config_path)
+    except KeyboardInterrupt:
+        log.info("已停止监视")
+    finally:
+        daemon.close()
+
+
+def localize_archive(daemon: ArchiveDaemon, config_path: str):
+    t = time.perf_counter()
+    hits, stats = daemon.localize()
+    log.info(f"复用 {stats['reused']} 个文件，重新处理 {stats['processed']} 个文件，修改 {stats['changed']} 个文件，"
+             f"耗时 {time.perf_counter() - t:.2f}s")
+    report(daemon.pack.transformations, hits, os.path.basename(config_path))
+
+
+def run_splice(root: Path, jobs: int):
+    # 与提取时内容相同的文件按偏移索引直接拼接译文, 其余文件重新词法分析定位, 都不做全文搜索
+    lib_dir = Path(__file__).parent / "lib"
+    index = load_index(default_index_path())
+    if index is None:
+        log.warn("没有找到偏移索引, 请先运行 ddcs_extract.py --lexer, 本次全部重新定位")
+    translations = {english: chinese for english, chinese in load_config(lib_dir / "extract_config.py") if chinese}
+    stats = splice_tree(root, translations, index, jobs)
+    log.info(f"按索引处理 {stats['indexed']} 个文件，重新定位 {stats['searched']} 个文件，替换 {stats['replaced']} 处")
+
+    # 手动补充的文本没有偏移信息, 仍按内容搜索替换
+    manual_path = lib_dir / "extract_config_manually.py"
+    if manual_path.exists():
+        pack = load_rulepack(str(manual_path), lambda: [
+            {"src": english, "dest": chinese} for english, chinese in load_config(manual_path) if chinese
+        ])
+        if pack.transformations:
+            hits = process_files_parallel(pack, collect_js_files(root), jobs)
+            report(pack.transformations, hits, manual_path.name)
+
+
+@cost_time
+def run_v2(root_path: str, process_asar: bool, splice: bool = False, jobs: int = 1):
     log.info("脚本已启动...")
     time.sleep(1)
 
     if process_asar:
         DDProcessor(True)
     log.info("汉化开始")
-    replace(Path(root_path))
+    if splice:
+        run_splice(Path(root_path), jobs)
+    else:
+        replace(Path(root_path))
     if process_asar:
         DDProcessor(False)
 
@@ -64,18 +206,47 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--v2", action="store_true")
     parser.add_argument("--root_path", type=str, default=None)
+    # 0 表示使用全部 CPU 核心
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--incremental", action="store_true", help="复用 .ddcs-cache 中未变化文件的汉化结果")
+    # 直接汉化 asar 归档, 不解包; 不指定 --output 时原地修改
+    parser.add_argument("--asar", type=str, default=None)
+    parser.add_argument("--output", type=str, default=None)
+    # 与 --asar 一起使用: 常驻运行, 监视归档, 被更新覆盖后自动重新汉化
+    parser.add_argument("--watch", action="store_true")
+    # 与 --asar 一起使用: 按差异备份还原为原始的英文归档, 或者在还原后的归档上直接重新应用汉化
+    parser.add_argument("--restore", action="store_true")
+    parser.add_argument("--reapply", action="store_true")
+    # v2 使用 ddcs_extract.py --lexer 生成的偏移索引拼接译文
+    parser.add_argument("--splice", action="store_true")
+    # 输出各阶段耗时, 每个文件的耗时与大小, 每条规则的命中与开销
+    parser.add_argument("--profile", type=str, nargs="?", const="ddcs-profile.json", default=None)
+    log.add_arguments(parser)
     args = parser.parse_args()
+    log.setup(args)
 
-    if not args.root_path:
-        # 没有传递 root_path, 认为需要从安装目录 cp
-        root_path = "./app/build/"
-        process_asar = True
-    else:
-        root_path = args.root_path
-        process_asar = False
-    print(root_path, process_asar)
     config_path = "./config.json"
-    if args.v2:
-        run_v2(root_path, process_asar)
+    if args.watch:
+        if not args.asar or (args.output and os.path.abspath(args.output) != os.path.abspath(args.asar)):
+            parser.error("--watch 需要通过 --asar 指定安装目录中的 app.asar, 且只能原地修改")
+        run_watch(args.asar, config_path, args.jobs or default_jobs())
+    elif args.restore or args.reapply:
+        if not args.asar or (args.restore and args.reapply):
+            parser.error("--restore / --reapply 需要通过 --asar 指定归档, 且不能同时使用")
+        run_restore(args.asar, args.output or args.asar, config_path, "original" if args.restore else "localized")
+    elif args.asar:
+        run_asar(args.asar, args.output or args.asar, config_path, args.jobs or default_jobs(), args.profile)
     else:
-        run(root_path, config_path, process_asar)
+        if not args.root_path:
+            # 没有传递 root_path, 认为需要从安装目录 cp
+            root_path = "./app/build/"
+            process_asar = True
+        else:
+            root_path = args.root_path
+            process_asar = False
+        log.debug(f"root_path: {root_path}, process_asar: {process_asar}")
+        if args.v2:
+            run_v2(root_path, process_asar, args.splice, args.jobs or default_jobs())
+        else:
+            run(root_path, config_path, process_asar, args.jobs or default_jobs(), args.incremental,
+                args.profile)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# 基准测试: 生成模拟 Docker Desktop 的合成目录, 对 v1 / v2 汉化流程的各阶段计时,
+# 结果写入 JSON 基线文件, 之后的运行可以与基线比较以发现性能退化. 不需要安装 Docker Desktop.
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from common import log
+from lib.bench import SCALES, compare, run_benchmark
+from lib.parallel import default_jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # 规模可以是 50M / 200M / 1G 或任意字节数, 如 10M
+    parser.add_argument("--scale", nargs="+", default=list(SCALES))
+    parser.add_argument("--config", type=str, default="./config.json")
+    # 0 表示使用全部 CPU 核心
+    parser.add_argument("--jobs", type=int, default=0)
+    # 同时测试 asar 打包和直接在归档中替换
+    parser.add_argument("--asar", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    # 每 MB JS 中插入的规则原文和界面文本条数
+    parser.add_argument("--density", type=float, default=50.0)
+    parser.add_argument("--workdir", type=str, default=None)
+    # 保留生成的目录, 便于手动检查或用 ddcs.py --profile 进一步分析
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--output", type=str, default="ddcs-bench.json")
+    parser.add_argument("--compare", type=str, default=None, help="与之前的基线文件比较")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    log.add_arguments(parser)
+    args = parser.parse_args()
+    log.setup(args)
+
+    # 只删除自己创建的临时目录, --workdir 指定的目录中只会删除各规模生成的子目录
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="ddcs-bench-"))
+    catalog_path = Path(__file__).parent / "lib" / "extract_config.py"
+    try:
+        result = run_benchmark(args.config, args.scale, workdir, args.jobs or default_jobs(), args.asar, args.seed,
+                               args.density, catalog_path, args.keep)
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for scale, scale_result in result["scales"].items():
+        phases = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in scale_result["phases"].items())
+        log.info(f"{scale}: {scale_result['files']} 个文件，命中 {scale_result['hits']} 处；{phases}")
+    log.info(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, result, args.threshold)
+        for row in rows:
+            message = f"{row['scale']} {row['phase']}: {row['baseline']:.3f}s -> {row['current']:.3f}s ({row['ratio']}x)"
+            if row["regressed"]:
+                log.error(message)
+            else:
+                log.info(message)
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
@@ -1,17 +1,36 @@
 import argparse
+import time
 from pathlib import Path
 
+from common import log
+from lib.catalog import extract_catalog, update_config
 from lib.extract import generate_config
+from lib.parallel import default_jobs
 from lib.processor import DDProcessor
+from lib.splice import build_index, default_index_path, save_index
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--path", type=str, default=None)
+    # 基于词法分析的提取: 只看界面相关上下文中的字符串和模板字面量, 误报更少
+    parser.add_argument("--lexer", action="store_true")
+    # 0 表示使用全部 CPU 核心, 仅 --lexer 时有效
+    parser.add_argument("--jobs", type=int, default=0)
+    log.add_arguments(parser)
     args = parser.parse_args()
+    log.setup(args)
 
     if args.path is None:
         DDProcessor(True)
         path = Path("./app/build")
     else:
         path = Path(args.path)
-    generate_config(path)
+    if args.lexer:
+        t = time.perf_counter()
+        texts, scanned = extract_catalog(path, args.jobs or default_jobs())
+        added = update_config(texts, Path(__file__).parent / "lib" / "extract_config.py")
+        # 记录每个文本在各文件中的偏移, 供 ddcs.py --v2 --splice 直接拼接译文
+        save_index(build_index(texts, scanned), default_index_path())
+        log.info(f"扫描 {len(scanned)} 个文件，提取 {len(texts)} 条文本，新增 {added} 条，耗时 {time.perf_counter() - t:.2f}s")
+    else:
+        generate_config(path)
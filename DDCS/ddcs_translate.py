@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# 机器翻译: 把 ddcs_extract.py 新增的空译文条目交给大模型批量翻译 (通过 Python_Bag 中的 ai_caller),
+# 通过校验的译文写入 extract_config.py, 其余条目写入复核文件, 由人工处理.
+import argparse
+from pathlib import Path
+
+from common import log
+from lib.catalog import fill_translations, load_config
+from lib.translate import (TranslationCache, Translator, default_ai_caller_path, default_cache_path, load_ai_caller,
+                           save_review)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--provider", type=str, default="deepseek")
+    parser.add_argument("--model", type=str, default="deepseek-chat")
+    # ai_caller 的配置文件 (API 密钥等), 默认使用 Python_Bag/ai_caller_config.yaml
+    parser.add_argument("--ai-config", type=str, default=None)
+    parser.add_argument("--ai-caller-path", type=str, default=str(default_ai_caller_path()))
+    # 每批请求 (含提示词) 的 Token 上限和并行请求数
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cache", type=str, default=str(default_cache_path()))
+    parser.add_argument("--review", type=str, default="translate-review.json")
+    # 只翻译并输出结果, 不修改 extract_config.py
+    parser.add_argument("--dry-run", action="store_true")
+    log.add_arguments(parser)
+    args = parser.parse_args()
+    log.setup(args)
+
+    config_file = Path(__file__).parent / "lib" / "extract_config.py"
+    texts = [english for english, chinese in load_config(config_file) if chinese == ""]
+    if not texts:
+        log.info("没有需要翻译的条目")
+    else:
+        ai_caller = load_ai_caller(Path(args.ai_caller_path))
+        provider = ai_caller.AICaller(args.ai_config).get_provider(args.provider)
+        cache = TranslationCache(Path(args.cache))
+        translator = Translator(provider, args.model, cache, args.max_tokens, args.workers)
+        accepted, review = translator.translate(texts)
+        cache.save()
+
+        filled = 0 if args.dry_run else fill_translations(accepted, config_file)
+        if args.dry_run:
+            log.group("译文", [f"{english} -> {chinese}" for english, chinese in accepted.items()], log.INFO)
+        log.info(f"待翻译 {len(texts)} 条，通过校验 {len(accepted)} 条，写入 {filled} 条，需要复核 {len(review)} 条")
+        if review:
+            save_review(review, Path(args.review))
+            log.group(f"需要人工复核的条目已写入 {args.review}",
+                      [f"{item['text']} -> {item['translation']} ({item['reason']})" for item in review])
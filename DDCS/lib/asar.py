@@ -0,0 +1,255 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+# asar 完整性校验的分块大小, 与 @electron/asar 一致
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class AsarError(Exception):
+    pass
+
+
+class AsarArchive:
+    """
+    只读的 asar 归档
+
+    文件布局为 Chromium Pickle 格式的头部加上按偏移排列的文件数据:
+
+        UInt32 4 | UInt32 头部 Pickle 长度 | UInt32 负载长度 | UInt32 JSON 长度 | JSON | 对齐填充 | 文件数据...
+
+    整个归档以 mmap 打开, 读取条目返回映射内存上的 memoryview 切片, 不会复制数据.
+    标记为 unpacked 的条目存放在同名的 .asar.unpacked 目录中.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise AsarError(f"{path} 不是有效的 asar 文件")
+        self._view = memoryview(self._map)
+        try:
+            self.header, self.data_offset = decode_header(self._view)
+        except AsarError:
+            self.close()
+            raise AsarError(f"{path} 的头部无法解析")
+        self.entries = dict(_walk(self.header, ""))
+
+    def close(self) -> None:
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def files(self) -> list[str]:
+        """按数据偏移排列的文件条目 (不含目录, 链接和 unpacked 条目)"""
+        names = [name for name, node in self.entries.items() if _is_packed(node)]
+        return sorted(names, key=lambda name: int(self.entries[name]["offset"]))
+
+    def read(self, name: str) -> memoryview | bytes:
+        """读取条目内容, 归档内的条目返回 memoryview, unpacked 条目从磁盘读取"""
+        node = self.entries.get(name)
+        if node is None or "size" not in node:
+            raise AsarError(f"{name} 不是归档中的文件")
+        if node.get("unpacked"):
+            with open(os.path.join(self.path + ".unpacked", *name.split("/")), "rb") as f:
+                return f.read()
+        start = self.data_offset + int(node["offset"])
+        return self._view[start:start + node["size"]]
+
+    def extract(self, dest: str) -> None:
+        """解包到 dest 目录, 等价于 asar extract"""
+        for name, node in self.entries.items():
+            path = os.path.join(dest, *name.split("/"))
+            if "files" in node:
+                os.makedirs(path, exist_ok=True)
+            elif "link" in node:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.lexists(path):
+                    os.remove(path)
+                os.symlink(os.path.relpath(os.path.join(dest, *node["link"].split("/")), os.path.dirname(path)), path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(self.read(name))
+                if node.get("executable"):
+                    os.chmod(path, 0o755)
+
+    def write(self, dest: str, replacements: dict[str, bytes]) -> None:
+        """
+        生成新的归档: replacements 中的条目替换为新内容并重新计算完整性校验,
+        其余条目从原归档的映射内存直接拷贝, 相邻的未修改条目合并为一次写入.
+        unpacked 条目保持原样, 使用时 dest 旁边需要有安装目录中原有的 .asar.unpacked 目录.
+        dest 不能是归档本身, 原地修改请使用 patch_archive.
+        """
+        if os.path.abspath(dest) == os.path.abspath(self.path):
+            raise AsarError("不能在归档打开时覆盖它本身, 请使用 patch_archive")
+        os.replace(self._write_temp(dest, *self._layout(replacements)), dest)
+
+    def _layout(self, replacements: dict[str, bytes]) -> tuple[bytes, list]:
+        # 按原偏移顺序重新排布数据, 返回新的头部和每段数据的来源 (原归档中的区间或新内容)
+        header = json.loads(json.dumps(self.header))
+        nodes = dict(_walk(header, ""))
+        for name in replacements:
+            if name not in nodes or not _is_packed(nodes[name]):
+                raise AsarError(f"{name} 不是归档中的文件")
+
+        segments = []
+        offset = 0
+        for name in self.files():
+            node = nodes[name]
+            if name in replacements:
+                content = replacements[name]
+                node["size"] = len(content)
+                node["integrity"] = integrity(content)
+                segments.append(content)
+            else:
+                start = self.data_offset + int(node["offset"])
+                if segments and isinstance(segments[-1], tuple) and segments[-1][1] == start:
+                    segments[-1] = (segments[-1][0], start + node["size"])
+                else:
+                    segments.append((start, start + node["size"]))
+            node["offset"] = str(offset)
+            offset += node["size"]
+        return encode_header(header), segments
+
+    def _write_temp(self, dest: str, header: bytes, segments: list) -> str:
+        # 写到 dest 同目录下的临时文件, 由调用方改名, 中途失败不会留下写了一半的归档
+        directory, name = os.path.split(os.path.abspath(dest))
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                for segment in segments:
+                    if isinstance(segment, tuple):
+                        with self._view[segment[0]:segment[1]] as chunk:
+                            f.write(chunk)
+                    else:
+                        f.write(segment)
+            if os.path.exists(dest):
+                shutil.copymode(dest, tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+
+def patch_archive(src: str, dest: str, replacements: dict[str, bytes]) -> None:
+    """用 replacements 替换 src 中的条目并写出 dest, dest 可以与 src 相同 (原地修改)"""
+    if os.path.abspath(dest) != os.path.abspath(src):
+        with AsarArchive(src) as archive:
+            archive.write(dest, replacements)
+        return
+    with AsarArchive(src) as archive:
+        tmp_path = archive._write_temp(dest, *archive._layout(replacements))
+    # 关闭映射后再改名, Windows 上无法替换仍被映射的文件
+    os.replace(tmp_path, dest)
+
+
+def pack_directory(src_dir: str, dest: str) -> int:
+    """
+    把目录打包为 asar 归档, 代替 asar pack (不支持 --unpack 规则, 符号链接会被跳过), 返回文件数.
+    文件按目录遍历顺序连续存放, 每个文件读取两次: 第一遍计算头部中的大小和完整性校验, 第二遍写入数据.
+    """
+    header = {"files": {}}
+    paths = []
+    offset = 0
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        node = header
+        rel = os.path.relpath(dirpath, src_dir)
+        if rel != ".":
+            for part in rel.split(os.sep):
+                node = node["files"][part]
+        for name in dirnames:
+            node["files"][name] = {"files": {}}
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                continue
+            with open(path, "rb") as f:
+                content = f.read()
+            entry = {"size": len(content), "offset": str(offset), "integrity": integrity(content)}
+            if os.name != "nt" and os.access(path, os.X_OK):
+                entry["executable"] = True
+            node["files"][name] = entry
+            offset += len(content)
+            paths.append(path)
+
+    directory, name = os.path.split(os.path.abspath(dest))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(encode_header(header))
+            for path in paths:
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, f, 1 << 20)
+        # mkstemp 创建的文件只有所有者可读写, 改为与普通新建文件相同的权限
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dest)
+    return len(paths)
+
+
+def _walk(node: dict, prefix: str):
+    for name, child in node.get("files", {}).items():
+        path = f"{prefix}/{name}" if prefix else name
+        yield path, child
+        if "files" in child:
+            yield from _walk(child, path)
+
+
+def _is_packed(node: dict) -> bool:
+    return "size" in node and "offset" in node and not node.get("unpacked")
+
+
+def integrity(content: bytes) -> dict:
+    """计算 asar 头部中的完整性校验信息"""
+    view = memoryview(content)
+    # 与 @electron/asar 一致, 最后一块总会参与计算, 长度恰好为块大小整数倍时末尾是一个空块
+    tail = len(view) - len(view) % BLOCK_SIZE
+    blocks = [hashlib.sha256(view[i:i + BLOCK_SIZE]).hexdigest() for i in range(0, tail, BLOCK_SIZE)]
+    blocks.append(hashlib.sha256(view[tail:]).hexdigest())
+    return {
+        "algorithm": "SHA256",
+        "hash": hashlib.sha256(view).hexdigest(),
+        "blockSize": BLOCK_SIZE,
+        "blocks": blocks,
+    }
+
+
+def decode_header(data) -> tuple[dict, int]:
+    """解析归档开头的 Pickle 头部, 返回 (头部 JSON, 文件数据的起始偏移)"""
+    try:
+        size_pickle, header_size = struct.unpack_from("<II", data, 0)
+        _, json_size = struct.unpack_from("<II", data, 8)
+        if size_pickle != 4 or 16 + json_size > 8 + header_size:
+            raise ValueError
+        return json.loads(bytes(data[16:16 + json_size]).decode("utf-8")), 8 + header_size
+    except (struct.error, ValueError):
+        raise AsarError("asar 头部无法解析")
+
+
+def encode_header(header: dict) -> bytes:
+    """把头部 JSON 编码为 Pickle 格式, 返回文件数据之前的全部字节"""
+    data = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    padding = -len(data) % 4
+    payload = struct.pack("<I", len(data)) + data + b"\0" * padding
+    header_pickle = struct.pack("<I", len(payload)) + payload
+    return struct.pack("<II", 4, len(header_pickle)) + header_pickle
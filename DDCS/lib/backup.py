@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+
+from lib.asar import AsarArchive, AsarError, _is_packed, _walk, decode_header
+from lib.engine import write_atomic
+
+BACKUP_VERSION = 1
+_MAGIC = b"DDCSDLT1"
+_EDIT = struct.Struct("<III")
+# 重新对齐时用作锚点的字节数, 以及依次尝试的搜索窗口
+_ANCHOR = 32
+_WINDOWS = (256, 4096, 64 << 10)
+
+
+class BackupError(Exception):
+    pass
+
+
+def diff_bytes(old, new) -> list[tuple[int, bytes, bytes]]:
+    """
+    计算两段内容之间的编辑列表 [(在 old 中的偏移, 原字节, 新字节), ...].
+
+    汉化只替换分散的文本片段, 两侧大部分内容相同: 先按块比较跳过相同的部分, 遇到不同时在附近的窗口中
+    寻找 old 之后的一段锚点在 new 中的位置, 对齐后继续比较. 窗口内找不到时把剩余部分作为一次编辑,
+    结果总是正确的, 只是不够紧凑.
+    """
+    old, new = memoryview(old), memoryview(new)
+    edits = []
+    i = j = 0
+    while True:
+        n = _common_length(old, new, i, j)
+        i += n
+        j += n
+        if i == len(old) and j == len(new):
+            return edits
+        found = _resync(old, new, i, j)
+        if found is None:
+            edits.append((i, bytes(old[i:]), bytes(new[j:])))
+            return edits
+        next_i, next_j = found
+        edits.append((i, bytes(old[i:next_i]), bytes(new[j:next_j])))
+        i, j = next_i, next_j
+
+
+def _common_length(old: memoryview, new: memoryview, i: int, j: int) -> int:
+    n = 0
+    limit = min(len(old) - i, len(new) - j)
+    for step in (4096, 64, 1):
+        while n + step <= limit and old[i + n:i + n + step] == new[j + n:j + n + step]:
+            n += step
+    return n
+
+
+def _resync(old: memoryview, new: memoryview, i: int, j: int) -> tuple[int, int] | None:
+    # 在窗口内找到使 old[i+d:i+d+_ANCHOR] == new[p:p+_ANCHOR] 且 d + (p - j) 最小的对齐位置.
+    # 压缩后的 JS 中重复片段很多, 只取第一个能找到的锚点容易错位, 所以比较两侧跳过的总长度
+    new_bytes = new.obj if isinstance(new.obj, bytes) else bytes(new)
+    for window in _WINDOWS:
+        best = None
+        best_cost = window
+        for d in range(window):
+            if d >= best_cost:
+                break
+            anchor = old[i + d:i + d + _ANCHOR]
+            if len(anchor) < _ANCHOR:
+                break
+            pos = new_bytes.find(anchor, j, j + best_cost - d + _ANCHOR)
+            if pos >= 0 and d + pos - j < best_cost:
+                best = i + d, pos
+                best_cost = d + pos - j
+        if best is not None:
+            return best
+    return None
+
+
+def apply_edits(data, edits: list[tuple[int, bytes, bytes]], reverse: bool = False) -> bytes:
+    """把编辑列表应用到 data 上, reverse 为 True 时从新内容还原出原内容"""
+    data = memoryview(data)
+    parts = []
+    pos = 0
+    shift = 0
+    for offset, old, new in edits:
+        start = offset + shift if reverse else offset
+        src, dest = (new, old) if reverse else (old, new)
+        if start < pos or data[start:start + len(src)] != src:
+            raise BackupError("条目内容与备份中记录的不一致")
+        parts.append(data[pos:start])
+        parts.append(dest)
+        pos = start + len(src)
+        shift += len(new) - len(old)
+    parts.append(data[pos:])
+    return b"".join(parts)
+
+
+def _encode_edits(edits: list[tuple[int, bytes, bytes]]) -> bytes:
+    parts = []
+    for offset, old, new in edits:
+        parts += [_EDIT.pack(offset, len(old), len(new)), old, new]
+    return zlib.compress(b"".join(parts))
+
+
+def _decode_edits(blob: bytes) -> list[tuple[int, bytes, bytes]]:
+    data = zlib.decompress(blob)
+    edits = []
+    pos = 0
+    while pos < len(data):
+        offset, old_size, new_size = _EDIT.unpack_from(data, pos)
+        pos += _EDIT.size
+        edits.append((offset, data[pos:pos + old_size], data[pos + old_size:pos + old_size + new_size]))
+        pos += old_size + new_size
+    return edits
+
+
+class DeltaBackup:
+    """
+    原始归档与汉化后归档之间的差异备份, 代替保留一份完整的 app.asar.
+
+    文件布局为 魔数 | UInt32 索引长度 | 索引 JSON | 数据块..., 数据块均以 zlib 压缩:
+    两个版本的归档头部各一块, 每个有变化的条目一块编辑列表 (偏移, 原字节, 新字节).
+    索引按条目路径记录数据块的位置和两侧内容的 SHA256, 读取时只加载用到的条目.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(_MAGIC)) != _MAGIC:
+                    raise ValueError
+                size, = struct.unpack("<I", f.read(4))
+                self.index = json.loads(f.read(size).decode("utf-8"))
+            if self.index.get("version") != BACKUP_VERSION:
+                raise ValueError
+        except (OSError, ValueError, struct.error) as e:
+            raise BackupError(f"无法读取备份 {path}: {e}")
+        self._data_offset = len(_MAGIC) + 4 + size
+        self.entries = self.index["entries"]
+        self._headers = {}
+
+    def _read(self, block: list[int]) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset + block[0])
+            return zlib.decompress(f.read(block[1])) if block[1] else b""
+
+    def header(self, state: str) -> bytes:
+        """state 为 original 或 localized, 返回该版本归档文件数据之前的全部字节"""
+        if state not in self._headers:
+            self._headers[state] = self._read(self.index[state]["header"])
+        return self._headers[state]
+
+    def edits(self, name: str) -> list[tuple[int, bytes, bytes]]:
+        block = self.entries[name]["block"]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset + block[0])
+            return _decode_edits(f.read(block[1]))
+
+    def state_of(self, archive: AsarArchive) -> str | None:
+        """归档是备份中的哪个版本, 都不是时返回 None"""
+        with archive._view[:archive.data_offset] as current:
+            for state in ("localized", "original"):
+                if current == self.header(state):
+                    return state
+        return None
+
+
+def save_backup(path: str, archive_path: str, replacements: dict[str, bytes]) -> dict:
+    """
+    在用 replacements 修改 archive_path 之前调用, 记录修改前后的差异, 返回统计信息.
+    如果 path 中已有的备份表明 archive_path 本身就是汉化后的版本 (重复汉化), 新的备份仍以最初的原始版本为基准.
+    """
+    previous = None
+    if os.path.exists(path):
+        try:
+            previous = DeltaBackup(path)
+        except BackupError:
+            pass
+
+    with AsarArchive(archive_path) as archive:
+        if previous is not None and previous.state_of(archive) != "localized":
+            previous = None
+        if previous is None:
+            original_header = bytes(archive._view[:archive.data_offset])
+            names = set(replacements)
+        else:
+            original_header = previous.header("original")
+            names = set(replacements) | set(previous.entries)
+        localized_header = archive._layout(replacements)[0]
+
+        entries = {}
+        blocks = [zlib.compress(original_header), zlib.compress(localized_header)]
+        edit_count = 0
+        for name in archive.files():
+            if name not in names:
+                continue
+            with archive.read(name) as data:
+                current = bytes(data)
+            original = current
+            if previous is not None and name in previous.entries:
+                original = apply_edits(current, previous.edits(name), reverse=True)
+            localized = replacements.get(name, current)
+            if original == localized:
+                continue
+            edits = diff_bytes(original, localized)
+            edit_count += len(edits)
+            blocks.append(_encode_edits(edits))
+            entries[name] = {"edits": len(edits), "original": hashlib.sha256(original).hexdigest(),
+                             "localized": hashlib.sha256(localized).hexdigest()}
+
+    offset = 0
+    positions = []
+    for block in blocks:
+        positions.append([offset, len(block)])
+        offset += len(block)
+    for name, position in zip(entries, positions[2:]):
+        entries[name]["block"] = position
+    index = {
+        "version": BACKUP_VERSION,
+        "archive": os.path.abspath(archive_path),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "original": {"header": positions[0]},
+        "localized": {"header": positions[1]},
+        "entries": entries,
+    }
+    data = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    write_atomic(path, b"".join([_MAGIC, struct.pack("<I", len(data)), data] + blocks))
+    return {"entries": len(entries), "edits": edit_count, "size": len(_MAGIC) + 4 + len(data) + offset}
+
+
+def apply_backup(path: str, archive_path: str, dest: str, state: str) -> int:
+    """
+    把 archive_path 转换为备份中的 state 版本 (original 为还原, localized 为重新汉化) 并写出 dest, dest 可以与
+    archive_path 相同. 只有记录了编辑的条目需要解码和校验, 其余条目从映射内存中成段拷贝. 返回修改的条目数.
+    """
+    backup = DeltaBackup(path)
+    source = "localized" if state == "original" else "original"
+    with AsarArchive(archive_path) as archive:
+        current = backup.state_of(archive)
+        if current == state and os.path.abspath(dest) == os.path.abspath(archive_path):
+            return 0
+        if current not in (source, state):
+            raise BackupError(f"{archive_path} 与备份中记录的版本都不一致, 可能已被更新覆盖")
+        header = backup.header(state)
+        try:
+            nodes = dict(_walk(decode_header(header)[0], ""))
+        except AsarError:
+            raise BackupError(f"备份 {path} 中的归档头部已损坏")
+
+        segments = []
+        for name in sorted((name for name, node in nodes.items() if _is_packed(node)),
+                           key=lambda name: int(nodes[name]["offset"])):
+            if name in backup.entries and current != state:
+                with archive.read(name) as data:
+                    content = apply_edits(data, backup.edits(name), reverse=state == "original")
+                if hashlib.sha256(content).hexdigest() != backup.entries[name][state]:
+                    raise BackupError(f"{name} 还原后的内容校验失败")
+                segments.append(content)
+                continue
+            node = archive.entries[name]
+            start = archive.data_offset + int(node["offset"])
+            if segments and isinstance(segments[-1], tuple) and segments[-1][1] == start:
+                segments[-1] = (segments[-1][0], start + node["size"])
+            else:
+                segments.append((start, start + node["size"]))
+        tmp_path = archive._write_temp(dest, header, segments)
+    os.replace(tmp_path, dest)
+    return len(backup.entries) if current != state else 0
+
+
+def default_backup_path(cache_dir: str, archive_path: str) -> str:
+    # 以归档的绝对路径区分不同的安装, 文件名保留归档名便于辨认
+    key = hashlib.sha256(os.path.abspath(archive_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, "backups", f"{os.path.basename(archive_path)}-{key}.ddcsdelta")
@@ -0,0 +1,319 @@
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from lib.asar import pack_directory, patch_archive
+from lib.catalog import collect_js_files, extract_catalog, load_config
+from lib.parallel import iter_archive_results, process_files_parallel
+from lib.rulepack import RulePack, compile_rulepack
+from lib.splice import build_index, splice_tree
+
+BENCH_VERSION = 1
+SCALES = {"50M": 50 << 20, "200M": 200 << 20, "1G": 1 << 30}
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+# key:"text" 形式的规则, 用于从 config.json 推导出界面文本目录
+_re_key_text = re.compile(r'^([A-Za-z]+):"([^"\\]*)"$')
+# 比较基线时小于这个差值的变化视为噪声
+_NOISE_SECONDS = 0.05
+
+_IDENT = "abcdefghijklmnopqrstuvwxyz"
+_CODE_WORDS = ["div", "span", "button", "root", "container", "primary", "small", "flex", "onClick", "value",
+               "disabled", "MuiBox-root", "data-testid", "aria-hidden", "default", "inherit", "center"]
+
+
+def parse_size(text: str) -> int:
+    """把 50M, 1G, 512K 或字节数转换为字节数"""
+    text = text.strip().upper().removesuffix("B")
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def load_catalog(transformations: list[dict], catalog_path: Path | None = None) -> dict[str, str]:
+    """
+    返回用于生成和 v2 拼接的 {原文: 译文}: 从 config.json 中 label:"…" 形式的规则推导,
+    再合并 extract_config.py 中已翻译的条目
+    """
+    catalog = {}
+    for transformation in transformations:
+        src = _re_key_text.match(transformation["src"])
+        dest = _re_key_text.match(transformation["dest"])
+        if src and dest and src.group(2):
+            catalog[src.group(2)] = dest.group(2)
+    if catalog_path is not None:
+        for english, chinese in load_config(catalog_path):
+            if chinese:
+                catalog[english] = chinese
+    return catalog
+
+
+class BundleGenerator:
+    """
+    生成模拟 Docker Desktop app/build 目录的合成数据, 同样的参数与种子总是生成完全相同的目录.
+
+    目录中约 70% 为压缩后的 JS bundle (一个较大的主 bundle 和若干大小不一的 chunk, 以及不参与汉化的 node_modules),
+    其余为带有真实文件头的图片和字体. JS 由随机拼接的代码片段组成, 按 density (每 MB 的条数) 插入
+    config.json 中规则的 src 原文和文本目录中处于 label: / title: / children 上下文的界面文本,
+    另外混入同样上下文中不需要翻译的近似字符串.
+    """
+
+    def __init__(self, transformations: list[dict], catalog: dict[str, str], seed: int = 0, density: float = 50.0):
+        self.seed = seed
+        self.density = density
+        self.snippets = [_embed_rule(t["src"]) for t in transformations if t["src"]]
+        for text in sorted(catalog):
+            quoted = json.dumps(text, ensure_ascii=False)
+            self.snippets.append(f"{{title:{quoted},size:\"small\"}}".encode("utf-8"))
+            self.snippets.append(f"(0,r.createElement)(o.Z,null,{quoted})".encode("utf-8"))
+        if not self.snippets:
+            raise ValueError("没有可以插入的规则或文本")
+
+    def generate(self, root: Path, size: int) -> dict:
+        """在 root 下生成总大小约为 size 字节的目录, 返回统计信息"""
+        rng = random.Random(self.seed)
+        pool = [_code_block(rng) for _ in range(512)]
+        shutil.rmtree(root, ignore_errors=True)
+        stats = Counter()
+
+        js_budget = size * 7 // 10
+        # node_modules 与 electron 主进程代码各占一小部分, 其余为渲染进程的 bundle
+        self._write_js(root / "electron" / "main.js", js_budget // 50, rng, pool, stats)
+        vendor = js_budget // 10
+        for i in range(max(1, vendor // (256 << 10))):
+            self._write_js(root / "node_modules" / f"pkg{i}" / "index.js", 256 << 10, rng, pool, stats, seeded=False)
+        remaining = js_budget - stats["js_bytes"]
+        main_size = min(remaining // 4, 40 << 20)
+        self._write_js(root / "static" / "js" / f"main.{rng.getrandbits(32):08x}.js", main_size, rng, pool, stats)
+        remaining -= main_size
+        index = 0
+        while remaining > 0:
+            chunk = min(remaining, max(4 << 10, min(int(rng.lognormvariate(12.2, 1.2)), 8 << 20)))
+            self._write_js(root / "static" / "js" / f"{index}.{rng.getrandbits(32):08x}.chunk.js", chunk, rng, pool, stats)
+            remaining -= chunk
+            index += 1
+
+        remaining = size - stats["js_bytes"]
+        index = 0
+        while remaining > 0:
+            kind = rng.choice(_ASSETS)
+            asset = min(remaining, max(1 << 10, min(int(rng.lognormvariate(11.5, 1.5)), 16 << 20)))
+            path = root / "static" / "media" / f"asset{index}.{rng.getrandbits(32):08x}.{kind[0]}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(kind[1] + rng.randbytes(max(0, asset - len(kind[1]))))
+            stats["files"] += 1
+            stats["asset_bytes"] += asset
+            remaining -= asset
+            index += 1
+
+        (root / "package.json").write_text('{"name":"docker-desktop","main":"electron/main.js"}\n')
+        stats["files"] += 1
+        return dict(stats)
+
+    def _write_js(self, path: Path, size: int, rng: random.Random, pool: list[bytes], stats: Counter,
+                  seeded: bool = True) -> None:
+        pieces = []
+        written = 0
+        # 每个代码块之后插入界面文本的概率, 使整体密度约为每 MB density 条
+        average = sum(len(block) for block in pool) / len(pool)
+        probability = self.density * average / (1 << 20) if seeded else 0.0
+        while written < size:
+            block = rng.choice(pool)
+            pieces.append(block)
+            written += len(block)
+            if rng.random() < probability:
+                snippet = rng.choice(self.snippets)
+                pieces.append(b"," + snippet + b";")
+                written += len(snippet) + 2
+                stats["seeded"] += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"".join(pieces))
+        stats["files"] += 1
+        stats["js_files"] += 1
+        stats["js_bytes"] += written
+
+
+# 文件头与真实资源一致, 便于按魔数识别类型
+_ASSETS = [
+    ("png", b"\x89PNG\r\n\x1a\n"),
+    ("woff2", b"wOF2"),
+    ("jpg", b"\xff\xd8\xff\xe0"),
+    ("wasm", b"\x00asm\x01\x00\x00\x00"),
+]
+
+
+def _embed_rule(src: str) -> bytes:
+    # 规则 src 是从 bundle 中截取的片段, 放回与其形式相符的上下文中
+    data = src.encode("utf-8")
+    if _re_key_text.match(src.split(",")[0]):
+        return b"(0,n.jsx)(s.Z,{" + data + b"})"
+    if src.startswith('"'):
+        return b"(0,r.createElement)(o.Z,null," + data + b")"
+    return b"e=`" + data + b"`"
+
+
+def _code_block(rng: random.Random) -> bytes:
+    # 一段 1~3KB 的压缩风格代码, 包含字符串, 正则, 模板和嵌套括号
+    parts = []
+    length = 0
+    target = rng.randint(1 << 10, 3 << 10)
+    while length < target:
+        a, b, c = ("".join(rng.choices(_IDENT, k=rng.randint(1, 2))) for _ in range(3))
+        word = rng.choice(_CODE_WORDS)
+        part = rng.choice([
+            f"function {a}({b},{c}){{return {b}.{word}({c},\"{word}\")}}",
+            f"var {a}={b}({rng.randint(1, 99999)}),{c}={b}.n({a})",
+            f"{a}.default=function({b}){{return{{className:\"{word}\",{word}:{b}.{word}||!1}}}}",
+            f"{a}=({b},{c})=>{b}.replace(/\\s+/g,\" \").split(\",\").map({c})",
+            f"{a}=`${{{b}}}-{word}-${{{c}.id}}`",
+            f"(0,{a}.jsx)({b}.Z,{{variant:\"{word}\",label:\"{word}-{rng.randint(0, 999)}\",onClick:{c}}})",
+            f"if({a}&&{b}[{rng.randint(0, 9)}]!=={c}){{{a}={a}/{rng.randint(2, 9)}}}",
+        ])
+        parts.append(part)
+        length += len(part) + 1
+    return (";".join(parts) + ";").encode("utf-8")
+
+
+def _timed(phases: dict, name: str, func, *args):
+    t = time.perf_counter()
+    result = func(*args)
+    phases[name] = round(time.perf_counter() - t, 6)
+    return result
+
+
+def _load_pack(path: str) -> RulePack:
+    # 与缓存命中时的 ddcs.py 相同, 从磁盘映射规则包并反序列化引擎
+    return RulePack(path).load()
+
+
+def _fresh_copy(src: Path, dest: Path) -> Path:
+    shutil.rmtree(dest, ignore_errors=True)
+    shutil.copytree(src, dest)
+    return dest
+
+
+def run_scale(config_path: str, size: int, workdir: Path, jobs: int, asar: bool = False, seed: int = 0,
+              density: float = 50.0, catalog_path: Path | None = None) -> dict:
+    """
+    生成 size 字节的合成目录并依次计时: 文件列表, 规则编译与加载, v1 替换, v2 词法提取与按偏移拼接,
+    以及可选的 asar 打包与归档内替换. 会修改内容的阶段都在原始目录的副本上进行, 复制不计入耗时
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        transformations = json.load(f)["all"]
+    catalog = load_catalog(transformations, catalog_path)
+    pristine = workdir / "pristine"
+    phases = {}
+    t = time.perf_counter()
+    stats = BundleGenerator(transformations, catalog, seed, density).generate(pristine, size)
+    generate_seconds = time.perf_counter() - t
+
+    _timed(phases, "listdir", collect_js_files, pristine)
+    pack_path = str(workdir / "bench.pack")
+    _timed(phases, "config_compile", compile_rulepack, transformations, pack_path)
+    pack = _timed(phases, "config_load", _load_pack, pack_path)
+
+    v1 = _fresh_copy(pristine, workdir / "v1")
+    hits = _timed(phases, "replace_v1", lambda: process_files_parallel(pack, collect_js_files(v1), jobs))
+
+    texts, scanned = _timed(phases, "extract_v2", extract_catalog, pristine, jobs)
+    index = build_index(texts, scanned)
+    v2 = _fresh_copy(pristine, workdir / "v2")
+    splice_stats = _timed(phases, "splice_v2", splice_tree, v2, catalog, index, jobs)
+
+    if asar:
+        archive = str(workdir / "app.asar")
+        _timed(phases, "asar_pack", pack_directory, str(pristine), archive)
+
+        def replace_archive():
+            replacements = {}
+            for name, result, _ in iter_archive_results(pack, archive, jobs):
+                if result is not None:
+                    replacements[name] = result
+            patch_archive(archive, str(workdir / "app-cn.asar"), replacements)
+
+        _timed(phases, "asar_replace", replace_archive)
+
+    return {
+        "bytes": size,
+        "files": stats["files"],
+        "js_files": stats["js_files"],
+        "js_bytes": stats["js_bytes"],
+        "seeded": stats.get("seeded", 0),
+        "generate_seconds": round(generate_seconds, 6),
+        "phases": phases,
+        "throughput_mb_s": {
+            "replace_v1": round(stats["js_bytes"] / 1048576 / phases["replace_v1"], 2) if phases["replace_v1"] else None,
+        },
+        "hits": sum(hits.values()),
+        "rules_hit": len(hits),
+        "extracted": len(texts),
+        "spliced": splice_stats["replaced"],
+    }
+
+
+def run_benchmark(config_path: str, scales: list[str], workdir: Path, jobs: int, asar: bool = False, seed: int = 0,
+                  density: float = 50.0, catalog_path: Path | None = None, keep: bool = False) -> dict:
+    """
+    依次运行各个规模的基准测试, 返回可写入基线文件的结果.
+    每个规模的数据生成在 workdir 下以规模命名的子目录中, 不指定 keep 时测完即删除; workdir 本身由调用方负责清理
+    """
+    results = {}
+    for scale in scales:
+        scale_dir = workdir / scale
+        scale_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            results[scale] = run_scale(config_path, SCALES.get(scale) or parse_size(scale), scale_dir, jobs, asar,
+                                       seed, density, catalog_path)
+        finally:
+            if not keep:
+                shutil.rmtree(scale_dir, ignore_errors=True)
+    return {
+        "version": BENCH_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "jobs": jobs,
+        "seed": seed,
+        "density": density,
+        "scales": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    逐个规模, 逐个阶段比较耗时. 新耗时比基线慢 threshold 以上且差值超过噪声下限时标记为退化.
+    生成参数 (种子, 密度) 不同时两次结果不可比, 抛出 ValueError
+    """
+    if baseline.get("version") != BENCH_VERSION:
+        raise ValueError("基线文件版本不兼容")
+    for key in ("seed", "density"):
+        if baseline.get(key) != current.get(key):
+            raise ValueError(f"基线与本次的 {key} 不同, 结果不可比")
+    rows = []
+    for scale, result in current["scales"].items():
+        old = baseline["scales"].get(scale)
+        if old is None:
+            continue
+        for phase, seconds in result["phases"].items():
+            before = old["phases"].get(phase)
+            if before is None:
+                continue
+            rows.append({
+                "scale": scale,
+                "phase": phase,
+                "baseline": before,
+                "current": seconds,
+                "ratio": round(seconds / before, 3) if before else None,
+                "regressed": seconds > before * (1 + threshold) and seconds - before > _NOISE_SECONDS,
+            })
+    return rows
@@ -0,0 +1,102 @@
+import ast
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from lib.js_lexer import extract_ui_strings
+
+# 第三方依赖中的文本不属于 Docker Desktop 界面
+_SKIP_DIRS = {"node_modules", ".git"}
+
+
+def collect_js_files(root: Path) -> list[str]:
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIP_DIRS)
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.endswith(".js"))
+    return paths
+
+
+def scan_file(file_path: str) -> tuple[str, str, list[tuple[str, int, int]]]:
+    """返回 (文件路径, 内容哈希, 文件中的界面文本列表)"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return file_path, hashlib.sha256(data).hexdigest(), extract_ui_strings(data)
+
+
+def extract_catalog(root: Path, jobs: int) -> tuple[list[str], list[tuple[str, str, list[tuple[str, int, int]]]]]:
+    """
+    并行扫描 root 下所有 js 文件, 返回 (去重排序后的文本目录, 每个文件的扫描结果).
+    结果只取决于文件内容, 与进程数和完成顺序无关.
+    """
+    paths = collect_js_files(root)
+    if jobs <= 1:
+        scanned = [scan_file(path) for path in paths]
+    else:
+        # 文件大小差别很大 (主 bundle 可达数十 MB), 每次只分一个文件, 避免大文件扎堆
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            scanned = list(pool.map(scan_file, paths))
+    texts = sorted({text for _, _, strings in scanned for text, _, _ in strings})
+    return texts, scanned
+
+
+def _find_config(source: str) -> ast.Assign | None:
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "config" for t in node.targets):
+            return node
+    return None
+
+
+def load_config(config_file: Path) -> list[tuple]:
+    if not config_file.exists():
+        return []
+    node = _find_config(config_file.read_text(encoding="utf-8"))
+    return [] if node is None else [tuple(item) for item in ast.literal_eval(node.value)]
+
+
+def update_config(texts: list[str], config_file: Path) -> int:
+    """
+    把新提取的文本追加到 config_file 的 config 列表, 已有条目 (包括已翻译和标记为 None 的) 保持原样和原顺序,
+    新条目按文本排序后以空译文追加. 文件中 config 以外的内容不变. 返回新增条目数.
+    """
+    source = config_file.read_text(encoding="utf-8") if config_file.exists() else ""
+    node = _find_config(source)
+    config = [] if node is None else [tuple(item) for item in ast.literal_eval(node.value)]
+    known = {item[0] for item in config}
+    added = [(text, "") for text in texts if text not in known]
+    _write_config(config_file, source, node, config + added)
+    return len(added)
+
+
+def fill_translations(translations: dict[str, str], config_file: Path) -> int:
+    """把 translations 中的译文填入 config_file 中译文为空字符串的条目, 其余条目不变. 返回填入的条目数"""
+    source = config_file.read_text(encoding="utf-8")
+    node = _find_config(source)
+    if node is None:
+        return 0
+    config = []
+    filled = 0
+    for english, chinese in (tuple(item) for item in ast.literal_eval(node.value)):
+        if chinese == "" and translations.get(english):
+            chinese = translations[english]
+            filled += 1
+        config.append((english, chinese))
+    if filled:
+        _write_config(config_file, source, node, config)
+    return filled
+
+
+def _write_config(config_file: Path, source: str, node: ast.Assign | None, config: list[tuple]) -> None:
+    lines = ["config = ["]
+    for english, chinese in config:
+        value = "None" if chinese is None else json.dumps(chinese, ensure_ascii=False)
+        lines.append(f"    ({json.dumps(english, ensure_ascii=False)}, {value}),")
+    lines.append("]")
+    source_lines = source.splitlines()
+    if node is None:
+        source_lines += lines
+    else:
+        source_lines[node.lineno - 1:node.end_lineno] = lines
+    config_file.write_text("\n".join(source_lines) + "\n", encoding="utf-8")
@@ -0,0 +1,308 @@
+import bisect
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+# 候选起点正则使用的前缀长度, 越长误报的候选越少, 过长会使正则嵌套过深
+_ANCHOR_PREFIX_LEN = 32
+
+
+def _trie_pattern(strings: set[bytes]) -> bytes:
+    # 把一组字面量按公共前缀嵌套成正则, 每个位置只需尝试一个字节的分支, 比平铺的 a|b|c 快得多
+    trie = {}
+    for string in strings:
+        node = trie
+        for byte in string:
+            node = node.setdefault(byte, {})
+        node[-1] = None
+
+    def emit(node: dict) -> bytes:
+        branches = [re.escape(bytes([byte])) + emit(child) for byte, child in sorted(node.items()) if byte >= 0]
+        if not branches:
+            return b""
+        if len(branches) == 1 and -1 not in node:
+            return branches[0]
+        return b"(?:" + b"|".join(branches) + b")" + (b"?" if -1 in node else b"")
+
+    return emit(trie)
+
+
+class ReplaceEngine:
+    """
+    单遍多模式替换引擎
+
+    把所有 src 编译成一棵字典树, 先用由各 src 前缀嵌套而成的正则 (在 C 层跳过不可能匹配的位置)
+    找出候选起点, 再沿字典树一次性找出该位置上所有规则的匹配. 每个文件只扫描一遍,
+    替换结果与按配置顺序逐条 str.replace 完全一致.
+
+    匹配直接在 UTF-8 字节上进行 (UTF-8 是自同步编码, 合法文本中的字节匹配一定落在字符边界上),
+    文件通过 mmap 读取, 没有命中的文件既不解码也不复制.
+    """
+
+    def __init__(self, transformations: list[dict]):
+        self.rules = [(t["src"].encode("utf-8"), t["dest"].encode("utf-8")) for t in transformations]
+
+        self._children = [{}]
+        self._outputs = [[]]
+        prefixes = set()
+        for index, (src, _) in enumerate(self.rules):
+            # 空的 src 会在每个字符之间插入 dest, 不参与匹配
+            if not src:
+                continue
+            node = 0
+            for byte in src:
+                child = self._children[node].get(byte)
+                if child is None:
+                    child = len(self._children)
+                    self._children[node][byte] = child
+                    self._children.append({})
+                    self._outputs.append([])
+                node = child
+            self._outputs[node].append(index)
+            prefixes.add(src[:_ANCHOR_PREFIX_LEN])
+
+        self.max_src_len = max((len(src) for src, _ in self.rules), default=0)
+        pattern = _trie_pattern(prefixes)
+        self._anchor = re.compile(pattern) if pattern else None
+
+    def has_match(self, data) -> bool:
+        """快速预筛: data 中是否存在任意规则的匹配, data 可以是 bytes 或 mmap"""
+        if self._anchor is None:
+            return False
+        children, outputs = self._children, self._outputs
+        search = self._anchor.search
+        end = len(data)
+        pos = 0
+        while True:
+            m = search(data, pos)
+            if m is None:
+                return False
+            node = 0
+            i = m.start()
+            while i < end:
+                node = children[node].get(data[i])
+                if node is None:
+                    break
+                if outputs[node]:
+                    return True
+                i += 1
+            pos = m.start() + 1
+
+    def find(self, text: bytes) -> list[tuple[int, int]]:
+        """找出 text 中所有规则的所有出现位置 (允许重叠), 返回按起点排序的 (start, rule_index)"""
+        matches = []
+        if self._anchor is None:
+            return matches
+        children, outputs = self._children, self._outputs
+        search = self._anchor.search
+        end = len(text)
+        pos = 0
+        while True:
+            m = search(text, pos)
+            if m is None:
+                break
+            start = m.start()
+            node = 0
+            i = start
+            while i < end:
+                node = children[node].get(text[i])
+                if node is None:
+                    break
+                i += 1
+                for rule in outputs[node]:
+                    matches.append((start, rule))
+            pos = start + 1
+        return matches
+
+    def apply(self, text: bytes) -> tuple[bytes, Counter]:
+        """对 text 应用全部规则, 返回 (新文本, 每条规则的替换次数)"""
+        matches = self.find(text)
+        if not matches:
+            return text, Counter()
+
+        by_rule = {}
+        for start, rule in matches:
+            by_rule.setdefault(rule, []).append(start)
+
+        # 按规则顺序选取出现位置: 与前面规则已替换的片段重叠的位置在逐条替换时已被破坏,
+        # 同一规则内部与 str.replace 一样从左到右取不重叠的位置
+        span_starts, span_ends, span_rules = [], [], []
+        for rule in sorted(by_rule):
+            src_len = len(self.rules[rule][0])
+            last_end = -1
+            for start in by_rule[rule]:
+                if start < last_end:
+                    continue
+                end = start + src_len
+                i = bisect.bisect_left(span_starts, end) - 1
+                if i >= 0 and span_ends[i] > start:
+                    continue
+                span_starts.insert(i + 1, start)
+                span_ends.insert(i + 1, end)
+                span_rules.insert(i + 1, rule)
+                last_end = end
+
+        # 后面规则的 src 可能由前面规则的 dest 与相邻文本拼出, 这种情况逐条替换会继续命中,
+        # 单遍结果不再等价, 回退到逐条替换
+        if self._creates_new_match(text, span_starts, span_ends, span_rules):
+            return self.apply_sequential(text)
+
+        pieces = []
+        hits = Counter()
+        cursor = 0
+        for start, end, rule in zip(span_starts, span_ends, span_rules):
+            pieces.append(text[cursor:start])
+            pieces.append(self.rules[rule][1])
+            cursor = end
+            hits[rule] += 1
+        pieces.append(text[cursor:])
+        return b"".join(pieces), hits
+
+    def _creates_new_match(self, text: bytes, span_starts: list[int], span_ends: list[int], span_rules: list[int]) -> bool:
+        """
+        检查逐条替换到第 j 条规则时, 是否会出现与某个已替换片段相交的 src_j.
+        第 j 条规则执行时, 规则号小于 j 的片段已是 dest, 其余仍是原文, 因此按邻近片段的规则号
+        把 j 分成若干区间, 每个区间内窗口内容固定, 分别检查即可.
+        """
+        reach = self.max_src_len - 1
+        for k, rule in enumerate(span_rules):
+            dest = self.rules[rule][1]
+            neighbor_rules = self._neighbor_rules(text, span_starts, span_ends, span_rules, k, reach)
+            bounds = sorted(r for r in neighbor_rules if r > rule)
+            low = rule
+            for high in bounds + [None]:
+                replaced = low
+                left = self._side(text, span_starts, span_ends, span_rules, k, reach, replaced, -1)
+                right = self._side(text, span_starts, span_ends, span_rules, k, reach, replaced, 1)
+                window = left + dest + right
+                a, b = len(left), len(left) + len(dest)
+                for start, other in self.find(window):
+                    if other <= low or (high is not None and other > high):
+                        continue
+                    end = start + len(self.rules[other][0])
+                    if (start < a < end) if a == b else (start < b and end > a):
+                        return True
+                low = high
+        return False
+
+    def _neighbor_rules(self, text, span_starts, span_ends, span_rules, k, reach) -> set[int]:
+        # 以 src/dest 中较短者计算长度向两侧扩展, 得到任意替换状态下窗口可能覆盖到的片段
+        rules = set()
+        for direction in (-1, 1):
+            length = 0
+            cursor = span_starts[k] if direction < 0 else span_ends[k]
+            idx = k + direction
+            while length < reach and (cursor > 0 if direction < 0 else cursor < len(text)):
+                if 0 <= idx < len(span_rules) and (span_ends[idx] if direction < 0 else span_starts[idx]) == cursor:
+                    src, dest = self.rules[span_rules[idx]]
+                    rules.add(span_rules[idx])
+                    length += min(len(src), len(dest))
+                    cursor = span_starts[idx] if direction < 0 else span_ends[idx]
+                    idx += direction
+                elif direction < 0:
+                    low = span_ends[idx] if idx >= 0 else 0
+                    low = max(low, cursor - (reach - length))
+                    length += cursor - low
+                    cursor = low
+                else:
+                    high = span_starts[idx] if idx < len(span_rules) else len(text)
+                    high = min(high, cursor + (reach - length))
+                    length += high - cursor
+                    cursor = high
+        return rules
+
+    def _side(self, text, span_starts, span_ends, span_rules, k, reach, replaced, direction) -> bytes:
+        # 构造第 k 个片段一侧的窗口文本, 规则号不大于 replaced 的片段视为已替换
+        parts = []
+        length = 0
+        cursor = span_starts[k] if direction < 0 else span_ends[k]
+        idx = k + direction
+        while length < reach and (cursor > 0 if direction < 0 else cursor < len(text)):
+            if 0 <= idx < len(span_rules) and (span_ends[idx] if direction < 0 else span_starts[idx]) == cursor:
+                rule = span_rules[idx]
+                piece = self.rules[rule][1] if rule <= replaced else text[span_starts[idx]:span_ends[idx]]
+                cursor = span_starts[idx] if direction < 0 else span_ends[idx]
+                idx += direction
+            elif direction < 0:
+                low = span_ends[idx] if idx >= 0 else 0
+                low = max(low, cursor - (reach - length))
+                piece = text[low:cursor]
+                cursor = low
+            else:
+                high = span_starts[idx] if idx < len(span_rules) else len(text)
+                high = min(high, cursor + (reach - length))
+                piece = text[cursor:high]
+                cursor = high
+            parts.append(piece)
+            length += len(piece)
+        if direction < 0:
+            parts.reverse()
+        return b"".join(parts)
+
+    def apply_sequential(self, text: bytes) -> tuple[bytes, Counter]:
+        """按配置顺序逐条 replace, 与旧的逐规则处理方式相同"""
+        text = bytes(text)
+        hits = Counter()
+        for index, (src, dest) in enumerate(self.rules):
+            if src and src in text:
+                hits[index] = text.count(src)
+                text = text.replace(src, dest)
+        return text, hits
+
+    def process_data(self, data) -> tuple[bytes | None, Counter]:
+        """对一段内容 (bytes, mmap 或 memoryview) 应用全部规则, 返回 (新内容, 替换次数), 内容未变化时新内容为 None"""
+        # 绝大多数文件没有命中, 预筛直接在原始内存上进行
+        if not len(data) or not self.has_match(data):
+            return None, Counter()
+        content = bytes(data)
+
+        # 只改写合法的 UTF-8 文本, 图片, .node 等二进制文件里碰巧出现的 src 不做替换
+        try:
+            content.decode("utf-8")
+        except UnicodeDecodeError:
+            return None, Counter()
+
+        result, hits = self.apply(content)
+        if not hits or result == content:
+            return None, hits
+        return result, hits
+
+    def process_file(self, file_path: str) -> tuple[bytes | None, Counter]:
+        """对单个文件应用全部规则, 返回 (新内容, 替换次数), 内容未变化时新内容为 None"""
+        try:
+            with open(file_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None, Counter()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self.process_data(data)
+        except OSError:
+            return None, Counter()
+
+    def process_files(self, file_paths: list[str]) -> Counter:
+        """对每个文件应用全部规则, 只改写内容发生变化的文件, 返回所有文件累计的每条规则替换次数"""
+        hits = Counter()
+        for file_path in file_paths:
+            result, file_hits = self.process_file(file_path)
+            if result is not None:
+                write_atomic(file_path, result)
+            hits.update(file_hits)
+        return hits
+
+
+def write_atomic(file_path: str, content: bytes) -> None:
+    # 先写同目录下的临时文件再改名, 中途失败不会留下写了一半的文件
+    directory, name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
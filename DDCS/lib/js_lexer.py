@@ -0,0 +1,208 @@
+import re
+from typing import Iterator, NamedTuple
+
+# 值通常是界面文本的属性名, 字符串出现在这些属性的值位置时才会被提取
+UI_KEYS = frozenset({
+    "label", "title", "subtitle", "tooltip", "placeholder", "description", "text", "message", "helperText",
+    "header", "heading", "subheader", "caption", "alt", "ariaLabel", "aria-label", "children", "content",
+    "primary", "secondary", "hint", "emptyText", "confirmText", "cancelText", "buttonText", "errorMessage",
+    "successMessage", "primaryText", "secondaryText", "actionLabel", "confirmLabel", "cancelLabel",
+})
+
+# 词法分析只需要在这些字符处停下, 其余的标识符, 数字, 运算符整段跳过
+_re_stop = re.compile(rb"[\"'`/{}()\[\],]")
+_re_string = {
+    ord('"'): re.compile(rb'"(?:[^"\\\r\n]|\\(?s:.))*"'),
+    ord("'"): re.compile(rb"'(?:[^'\\\r\n]|\\(?s:.))*'"),
+}
+_re_template_chunk = re.compile(rb"(?:[^`\\$]|\\(?s:.)|\$(?!\{))*")
+_re_regex = re.compile(rb"/(?:[^/\\\r\n\[]|\\.|\[(?:[^\]\\\r\n]|\\.)*\])+/[\w$]*")
+_re_block_comment = re.compile(rb"/\*.*?\*/", re.S)
+# 这些关键字之后的 / 是正则字面量而不是除号
+_re_keyword_before = re.compile(rb"(?<![\w$])(?:return|typeof|case|do|else|in|of|new|delete|void|throw|instanceof|yield|await)\s*$")
+# label:cond?"A":"B" 与 label:x||"B" 这类三元/默认值表达式中的字符串
+_re_key_expr_before = re.compile(rb"""(?<![\w$])([A-Za-z_$][\w$]*)\s*:[^,;{}()\[\]]*[?:|]\s*$""")
+_IDENT_BYTES = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+_re_text = re.compile(r"[A-Za-z]")
+# 看起来像代码而不是文本: 单个小写标识符, 路径, 类名, 事件名等
+_re_code_like = re.compile(r"^[a-z0-9_$.\-/:#@*]+$|^[A-Za-z0-9_]+(?:[.\-/:][A-Za-z0-9_]+)+$")
+
+_LOOKBACK = 200
+
+
+class Literal(NamedTuple):
+    start: int          # 内容 (不含引号) 的起始字节偏移
+    end: int            # 内容的结束字节偏移
+    kind: str           # "string" 或 "template"
+    ui: bool            # 是否处于界面文本的上下文中
+
+
+def iter_literals(data: bytes) -> Iterator[Literal]:
+    """
+    流式扫描 JavaScript 源码 (UTF-8 字节), 产出其中的字符串与模板字面量.
+
+    只在引号, 斜杠, 括号, 逗号处停下, 其余内容整段跳过; 维护括号栈以识别模板中的 ${...},
+    createElement 调用的参数序号和 children 数组, 并通过前一个有效字符区分正则字面量和除号.
+    """
+    # 栈中每一项为 [类型, 附加信息]: "(" 附带 [是否 createElement, 参数序号], "[" 附带是否 children 数组,
+    # "${" 附带所在模板的 (起点, 是否界面文本)
+    stack = []
+    end = len(data)
+    pos = 0
+    while True:
+        m = _re_stop.search(data, pos)
+        if m is None:
+            return
+        i = m.start()
+        c = data[i]
+        if c in _re_string:
+            s = _re_string[c].match(data, i)
+            if s is None:
+                # 未闭合的引号, 跳过这个字符继续
+                pos = i + 1
+                continue
+            yield Literal(i + 1, s.end() - 1, "string", _is_ui_context(data, i, stack))
+            pos = s.end()
+        elif c == 0x60:
+            pos = yield from _template(data, i + 1, i + 1, _is_ui_context(data, i, stack), stack)
+        elif c == 0x2F:
+            nxt = data[i + 1:i + 2]
+            if nxt == b"/":
+                newline = data.find(b"\n", i)
+                pos = end if newline < 0 else newline + 1
+            elif nxt == b"*":
+                cm = _re_block_comment.match(data, i)
+                pos = end if cm is None else cm.end()
+            elif _regex_allowed(data, i):
+                r = _re_regex.match(data, i)
+                pos = i + 1 if r is None else r.end()
+            else:
+                pos = i + 1
+        elif c == 0x28:
+            # createElement( 或 (0,r.createElement)(
+            c, j = _previous_char(data, i)
+            if c == 0x29:
+                c, j = _previous_char(data, j)
+            stack.append(["(", [_word_before(data, j) == b"createElement", 0]])
+            pos = i + 1
+        elif c == 0x5B:
+            c, j = _previous_char(data, i)
+            stack.append(["[", c == 0x3A and _key_before(data, j) == "children"])
+            pos = i + 1
+        elif c == 0x7B:
+            stack.append(["{", None])
+            pos = i + 1
+        elif c == 0x2C:
+            if stack and stack[-1][0] == "(":
+                stack[-1][1][1] += 1
+            pos = i + 1
+        elif c == 0x7D and stack and stack[-1][0] == "${":
+            _, (start, ui) = stack.pop()
+            pos = yield from _template(data, i + 1, start, ui, stack)
+        else:
+            if stack:
+                stack.pop()
+            pos = i + 1
+
+
+def _template(data: bytes, pos: int, start: int, ui: bool, stack: list):
+    # 扫描模板字面量的一段文本, 遇到 ${ 时压栈返回主循环, 遇到反引号时产出整个模板
+    chunk = _re_template_chunk.match(data, pos)
+    pos = chunk.end()
+    if data[pos:pos + 2] == b"${":
+        stack.append(["${", (start, ui)])
+        return pos + 2
+    if pos < len(data):
+        yield Literal(start, pos, "template", ui)
+        return pos + 1
+    return pos
+
+
+def _previous_char(data: bytes, i: int) -> tuple[int, int]:
+    # 返回 i 之前第一个非空白字符及其位置, 没有时返回 (-1, -1)
+    j = i - 1
+    while j >= 0 and data[j] in b" \t\r\n":
+        j -= 1
+    return (data[j], j) if j >= 0 else (-1, -1)
+
+
+def _word_before(data: bytes, j: int) -> bytes:
+    # 以 j 结尾的标识符
+    k = j
+    while k >= 0 and (data[k] in _IDENT_BYTES or data[k] >= 0x80):
+        k -= 1
+    return data[k + 1:j + 1]
+
+
+def _key_before(data: bytes, colon: int) -> str | None:
+    # 冒号前的属性名, 支持标识符和带引号的属性名
+    c, j = _previous_char(data, colon)
+    if c in b"\"'":
+        start = data.rfind(bytes([c]), max(0, j - _LOOKBACK), j)
+        if start < 0:
+            return None
+        key = data[start + 1:j]
+    else:
+        key = _word_before(data, j)
+    try:
+        return key.decode("utf-8") if key else None
+    except UnicodeDecodeError:
+        return None
+
+
+def _regex_allowed(data: bytes, i: int) -> bool:
+    c, j = _previous_char(data, i)
+    if c < 0:
+        return True
+    if chr(c) in ")]}\"'`" or chr(c).isalnum() or c in b"_$" or c >= 0x80:
+        return bool(_re_keyword_before.search(data, max(0, j - 16), j + 1))
+    return True
+
+
+def _is_ui_context(data: bytes, i: int, stack: list) -> bool:
+    c, j = _previous_char(data, i)
+    if c < 0:
+        return False
+    if c == 0x3A and _key_before(data, j) in UI_KEYS:
+        return True
+    if c in b"?:|":
+        m = _re_key_expr_before.search(data, max(0, j - _LOOKBACK), j + 1)
+        return bool(m) and m.group(1).decode("utf-8", "replace") in UI_KEYS
+    if c in b"(,[" and stack:
+        kind, info = stack[-1]
+        if kind == "(":
+            # createElement(type, props, ...children)
+            return info[0] and info[1] >= 2
+        if kind == "[":
+            return info
+    return False
+
+
+def is_ui_text(text: str) -> bool:
+    """粗略判断字面量内容是否像需要翻译的界面文本"""
+    stripped = text.strip()
+    if len(stripped) < 2 or not _re_text.search(stripped) or "\n" in stripped or "://" in stripped:
+        return False
+    # 两端带空格的是被插值拆开的句子片段, 如 ["Running ", n, " containers"]
+    padded = text != stripped
+    if not padded and _re_code_like.search(stripped):
+        return False
+    # 模板中只有插值没有文字
+    if not _re_text.search(re.sub(r"\$\{[^}]*\}", "", stripped)):
+        return False
+    return padded or stripped[0].isupper() or " " in stripped
+
+
+def extract_ui_strings(data: bytes) -> list[tuple[str, int, int]]:
+    """返回 data 中处于界面上下文且像界面文本的字面量, 每项为 (内容, 起始偏移, 结束偏移)"""
+    results = []
+    for literal in iter_literals(data):
+        if not literal.ui:
+            continue
+        try:
+            text = data[literal.start:literal.end].decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        if is_ui_text(text):
+            results.append((text, literal.start, literal.end))
+    return results
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from typing import Callable, Iterable
+
+from lib.engine import ReplaceEngine, write_atomic
+from lib.parallel import iter_results
+from lib.rulepack import RulePack
+
+MANIFEST_VERSION = 1
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rule_hash(transformation: dict) -> str:
+    # 规则以 src 和 dest 共同标识, 修改任意一侧都视为新规则
+    data = transformation["src"].encode("utf-8") + b"\0" + transformation["dest"].encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    增量汉化的清单与内容寻址存储, 位于 cache_dir 下:
+
+        manifest.json       以输入内容哈希为键, 记录输出哈希, 规则集哈希和各规则的命中次数
+        objects/ab/abcd...  以 SHA256 命名的文件内容 (汉化后的输出)
+
+    以内容而不是路径为键, 同一份文件在不同架构, 不同目录下都能复用.
+    在已汉化过的目录上重复运行时, 文件内容就是上次的输出, 会像原来一样被当作新的输入处理.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, "manifest.json")
+        self.entries = {}
+        self.rulesets = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["entries"]
+                self.rulesets = data["rulesets"]
+        except (OSError, ValueError, KeyError):
+            # 清单缺失或损坏时当作首次运行
+            pass
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def get_object(self, digest: str) -> bytes | None:
+        try:
+            with open(self.object_path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # 存储被意外改动时不能拿来复用
+        return data if sha256_bytes(data) == digest else None
+
+    def put_object(self, digest: str, data: bytes) -> None:
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_new(path, data)
+
+    def record(self, input_hash: str, output_hash: str, ruleset: str, hits: dict[str, int]) -> None:
+        self.entries[input_hash] = {"output": output_hash, "ruleset": ruleset, "hits": hits}
+
+    def save(self) -> None:
+        # 只保留仍被引用的规则集, 避免反复修改配置后清单无限增长
+        used = {entry["ruleset"] for entry in self.entries.values()}
+        rulesets = {key: value for key, value in self.rulesets.items() if key in used}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        content = json.dumps({"version": MANIFEST_VERSION, "rulesets": rulesets, "entries": self.entries})
+        _write_new(self.path, content.encode("utf-8"))
+
+
+class IncrementalRunner:
+    """
+    增量汉化: 输入内容与相关规则都没有变化的文件直接复用存储中的输出, 只重新处理其余文件.
+
+    规则集变化时, 某个文件的旧结果仍然有效的条件是:
+      1. 该文件命中过的规则都还在, 且相互之间的先后顺序不变;
+      2. 新增的, 或者相对命中规则换了位置的规则, 在它执行时看到的中间文本里仍然没有匹配.
+    被删除但从未命中过该文件的规则与它无关. 满足条件时逐条替换的每一步都与上次相同, 输出和命中次数可直接复用.
+    """
+
+    def __init__(self, rules: list[dict] | RulePack, cache_dir: str):
+        self.rules = rules
+        self.transformations = rules.transformations if isinstance(rules, RulePack) else rules
+        self.manifest = Manifest(cache_dir)
+        # 完全相同的重复规则按出现次序区分, 后一条可能命中前面规则的 dest 新拼出的文本
+        self.rule_hashes = []
+        occurrences = Counter()
+        for transformation in self.transformations:
+            digest = rule_hash(transformation)
+            occurrences[digest] += 1
+            self.rule_hashes.append(digest if occurrences[digest] == 1 else f"{digest}.{occurrences[digest]}")
+        self.rule_index = {digest: index for index, digest in enumerate(self.rule_hashes)}
+        self.ruleset = hashlib.sha256("".join(self.rule_hashes).encode("ascii")).hexdigest()[:16]
+        self.manifest.rulesets[self.ruleset] = self.rule_hashes
+        self._engines = {}
+        self.stats = Counter()
+
+    def _engine_for(self, rules: list[int]) -> ReplaceEngine:
+        # 同一组待检查的规则编译一次, 在所有文件间共享
+        key = tuple(rules)
+        if key not in self._engines:
+            self._engines[key] = ReplaceEngine([self.transformations[index] for index in rules])
+        return self._engines[key]
+
+    def _still_valid(self, entry: dict, input_data: bytes) -> bool:
+        if entry["ruleset"] == self.ruleset:
+            return True
+        previous = self.manifest.rulesets.get(entry["ruleset"])
+        if previous is None:
+            return False
+
+        # 命中过的规则必须都还在, 且先后顺序不变
+        hit = set(entry["hits"])
+        order = [digest for digest in self.rule_hashes if digest in hit]
+        if order != [digest for digest in previous if digest in hit]:
+            return False
+
+        # 未命中的规则按其前面有几条命中规则分槽, 同一槽内的规则执行时看到的文本相同.
+        # 新增或换了槽的规则需要在对应的中间文本上确认仍然不会命中
+        previous_slots = {}
+        slot = 0
+        for digest in previous:
+            if digest in hit:
+                slot += 1
+            else:
+                previous_slots[digest] = slot
+        changed = {}
+        slot = 0
+        for index, digest in enumerate(self.rule_hashes):
+            if digest in hit:
+                slot += 1
+            elif previous_slots.get(digest) != slot:
+                changed.setdefault(slot, []).append(index)
+        if not changed:
+            return True
+
+        text = input_data
+        for slot in range(len(order) + 1):
+            if slot in changed and self._engine_for(changed[slot]).has_match(text):
+                return False
+            if slot < len(order):
+                rule = self.transformations[self.rule_index[order[slot]]]
+                text = text.replace(rule["src"].encode("utf-8"), rule["dest"].encode("utf-8"))
+        return True
+
+    def lookup(self, input_hash: str, read: Callable[[], bytes]) -> tuple[bytes | None, Counter] | None:
+        """
+        查找内容为 input_hash 的输入可以复用的结果, 返回 (输出, 每条规则的替换次数), 输出与输入相同时为 None;
+        不能复用时返回 None. 只有规则集变化, 需要确认旧结果是否仍然有效时才调用 read 读取输入内容
+        """
+        entry = self.manifest.entries.get(input_hash)
+        if entry is None:
+            return None
+        if entry["ruleset"] != self.ruleset and not self._still_valid(entry, read()):
+            return None
+        output = None
+        if entry["output"] != input_hash:
+            output = self.manifest.get_object(entry["output"])
+            if output is None:
+                return None
+        entry["ruleset"] = self.ruleset
+        return output, Counter({self.rule_index[digest]: count for digest, count in entry["hits"].items()})
+
+    def store(self, input_hash: str, result: bytes | None, hits: Counter) -> None:
+        """记录一次完整处理的结果, result 为 None 表示内容没有变化"""
+        output_hash = input_hash
+        if result is not None:
+            output_hash = sha256_bytes(result)
+            self.manifest.put_object(output_hash, result)
+        self.manifest.record(input_hash, output_hash, self.ruleset,
+                             {self.rule_hashes[index]: count for index, count in hits.items()})
+
+    def _reuse(self, file_path: str, input_hash: str, hits: Counter) -> bool:
+        """尝试复用清单中的结果, 成功时写入输出并累加命中次数"""
+        found = self.lookup(input_hash, lambda: _read(file_path))
+        if found is None:
+            return False
+        output, file_hits = found
+        if output is not None:
+            write_atomic(file_path, output)
+        hits.update(file_hits)
+        return True
+
+    def run(self, file_paths: Iterable[str], jobs: int, profiler=None) -> Counter:
+        """
+        处理 file_paths, 返回与完整处理相同的每条规则替换次数.
+        传入 profiler 时记录每个重新处理的文件的耗时, 复用的文件只计数 (没有匹配开销)
+        """
+        hits = Counter()
+        timed = profiler is not None and profiler.enabled
+        reused = 0
+        pending = {}
+        for file_path in file_paths:
+            try:
+                input_hash = sha256_file(file_path)
+            except OSError:
+                continue
+            if self._reuse(file_path, input_hash, hits):
+                reused += 1
+            else:
+                pending[file_path] = input_hash
+
+        for file_path, result, file_hits, *stats in iter_results(self.rules, list(pending), jobs, timed):
+            self.store(pending[file_path], result, file_hits)
+            if result is not None:
+                write_atomic(file_path, result)
+            hits.update(file_hits)
+            self.stats["processed"] += 1
+            if timed:
+                profiler.record_file(file_path, stats[0], stats[1], file_hits, result is not None)
+        self.stats["reused"] += reused
+        if timed:
+            profiler.reused_files += reused
+
+        self.manifest.save()
+        return hits
+
+
+def _read(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def _write_new(path: str, data: bytes) -> None:
+    # 写临时文件再改名, 中断时不会在存储里留下不完整的对象
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp.", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,150 @@
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable
+
+from lib.asar import AsarArchive
+from lib.engine import ReplaceEngine, write_atomic
+from lib.rulepack import RulePack
+
+# 每个工作进程持有一份编译好的引擎, 由 initializer 构建, 避免每个任务重复编译规则
+_engine = None
+# 处理 asar 归档时, 每个工作进程各自映射一份归档
+_archive = None
+
+
+def make_engine(rules: list[dict] | RulePack) -> ReplaceEngine:
+    # 规则包直接映射已编译的引擎, 规则列表则现场编译
+    return rules.engine if isinstance(rules, RulePack) else ReplaceEngine(rules)
+
+
+def _init_worker(rules: list[dict] | RulePack) -> None:
+    global _engine
+    _engine = make_engine(rules)
+
+
+def _process_file(file_path: str) -> tuple[str, bytes | None, Counter]:
+    result, hits = _engine.process_file(file_path)
+    return file_path, result, hits
+
+
+def _process_file_timed(file_path: str) -> tuple[str, bytes | None, Counter, float, int]:
+    # --profile 时额外返回处理耗时和文件大小
+    t = time.perf_counter()
+    result, hits = _engine.process_file(file_path)
+    return file_path, result, hits, time.perf_counter() - t, _file_size(file_path)
+
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _init_archive_worker(rules: list[dict] | RulePack, archive_path: str) -> None:
+    global _engine, _archive
+    _engine = make_engine(rules)
+    _archive = AsarArchive(archive_path)
+
+
+def _process_entry(name: str) -> tuple[str, bytes | None, Counter]:
+    result, hits = _engine.process_data(_archive.read(name))
+    return name, result, hits
+
+
+def _process_entry_timed(name: str) -> tuple[str, bytes | None, Counter, float, int]:
+    t = time.perf_counter()
+    result, hits = _engine.process_data(_archive.read(name))
+    return name, result, hits, time.perf_counter() - t, _archive.entries[name]["size"]
+
+
+def _run_chunk(task, items: list[str]) -> list[tuple]:
+    return [task(item) for item in items]
+
+
+def _lazy_map(pool: ProcessPoolExecutor, task, items: Iterable[str], chunksize: int, jobs: int):
+    """
+    与 pool.map 相同, 按输入顺序产出结果, 但 pool.map 会先取完整个输入再提交.
+    这里最多保留 jobs * 4 批任务在途, 输入可以是边遍历边产出的生成器, 内存占用与输入总数无关.
+    """
+    items = iter(items)
+    pending = deque()
+    while True:
+        while len(pending) < jobs * 4 and (chunk := list(islice(items, chunksize))):
+            pending.append(pool.submit(_run_chunk, task, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
+
+
+def iter_results(rules: list[dict] | RulePack, file_paths: Iterable[str], jobs: int, timed: bool = False):
+    """
+    逐个产出 (文件路径, 新内容, 每条规则的替换次数), 内容未变化时新内容为 None.
+    jobs 大于 1 时用进程池并行处理, 每个工作进程对分到的文件应用全部规则, 写回由调用方负责.
+    rules 可以是规则列表或编译好的规则包. timed 为 True 时每项末尾再附加 (耗时, 文件大小).
+    file_paths 可以是生成器 (如 walk_files), 遍历与处理同时进行.
+    """
+    task = _process_file_timed if timed else _process_file
+    if jobs <= 1:
+        _init_worker(rules)
+        for file_path in file_paths:
+            yield task(file_path)
+        return
+
+    # 适当合并小任务, 降低进程间通信开销; 数量未知时每批 8 个文件
+    chunksize = max(1, len(file_paths) // (jobs * 8)) if isinstance(file_paths, list) else 8
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(rules,)) as pool:
+        yield from _lazy_map(pool, task, file_paths, chunksize, jobs)
+
+
+def process_files_parallel(rules: list[dict] | RulePack, file_paths: Iterable[str], jobs: int,
+                           profiler=None) -> Counter:
+    """
+    用进程池并行处理文件, 父进程汇总每条规则的替换次数, 并负责以原子方式写回有变化的文件.
+    结果与串行的 ReplaceEngine.process_files 逐字节一致. 传入 profiler 时记录每个文件的耗时.
+    """
+    hits = Counter()
+    timed = profiler is not None and profiler.enabled
+    for file_path, result, file_hits, *stats in iter_results(rules, file_paths, jobs, timed):
+        if result is not None:
+            write_atomic(file_path, result)
+        hits.update(file_hits)
+        if timed:
+            profiler.record_file(file_path, stats[0], stats[1], file_hits, result is not None)
+    return hits
+
+
+def iter_archive_results(rules: list[dict] | RulePack, archive_path: str, jobs: int, timed: bool = False,
+                         names: list[str] | None = None):
+    """
+    与 iter_results 相同, 但直接处理 asar 归档中的条目, 产出 (条目路径, 新内容, 每条规则的替换次数).
+    条目内容是映射内存上的切片, 不需要先解包. names 为 None 时处理全部条目.
+    """
+    global _archive
+    task = _process_entry_timed if timed else _process_entry
+    if jobs <= 1:
+        _init_archive_worker(rules, archive_path)
+        try:
+            for name in _archive.files() if names is None else names:
+                yield task(name)
+        finally:
+            _archive.close()
+            _archive = None
+        return
+
+    if names is None:
+        with AsarArchive(archive_path) as archive:
+            names = archive.files()
+    if not names:
+        return
+    chunksize = max(1, len(names) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_archive_worker,
+                             initargs=(rules, archive_path)) as pool:
+        yield from _lazy_map(pool, task, names, chunksize, jobs)
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
@@ -0,0 +1,97 @@
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_VERSION = 1
+
+
+class Profiler:
+    """
+    收集一次运行的性能数据并输出 JSON 报告: 各阶段耗时, 每个文件的耗时与大小, 每条规则的命中与开销.
+
+    单遍引擎同时匹配所有规则, 无法直接测出某条规则的耗时, 规则开销按命中文件的处理时间
+    以替换掉的字节数 (len(src) * 命中次数) 为权重分摊; 没有命中的文件的耗时计入 scan_seconds.
+    enabled 为 False 时所有记录操作都是空操作.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = time.time()
+        self.phases = {}
+        self.files = []
+        # 增量模式下直接复用上次结果的文件数, 这些文件不在 files 中
+        self.reused_files = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t
+
+    def record_file(self, path: str, seconds: float, size: int, hits: Counter, changed: bool) -> None:
+        if self.enabled:
+            self.files.append((path, seconds, size, hits, changed))
+
+    def report(self, transformations: list[dict], top: int = 20) -> dict:
+        rule_hits = Counter()
+        rule_files = Counter()
+        rule_cost = Counter()
+        scan_seconds = 0.0
+        files = []
+        for path, seconds, size, hits, changed in self.files:
+            files.append({"path": path, "bytes": size, "seconds": round(seconds, 6), "hits": sum(hits.values()),
+                          "changed": changed})
+            if not hits:
+                scan_seconds += seconds
+                continue
+            weights = {rule: len(transformations[rule]["src"]) * count for rule, count in hits.items()}
+            total = sum(weights.values()) or 1
+            for rule, count in hits.items():
+                rule_hits[rule] += count
+                rule_files[rule] += 1
+                rule_cost[rule] += seconds * weights[rule] / total
+
+        rules = [{
+            "index": index,
+            "src": transformation["src"],
+            "dest": transformation["dest"],
+            "hits": rule_hits[index],
+            "files": rule_files[index],
+            "attributed_seconds": round(rule_cost[index], 6),
+        } for index, transformation in enumerate(transformations)]
+
+        total_bytes = sum(size for _, _, size, _, _ in self.files)
+        replace_seconds = self.phases.get("replace", 0.0)
+        return {
+            "version": PROFILE_VERSION,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "command": sys.argv,
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "total_seconds": round(sum(self.phases.values()), 6),
+            "totals": {
+                "files": len(self.files),
+                "changed_files": sum(1 for f in self.files if f[4]),
+                "reused_files": self.reused_files,
+                "bytes": total_bytes,
+                "scan_seconds": round(scan_seconds, 6),
+                "throughput_mb_s": round(total_bytes / 1048576 / replace_seconds, 2) if replace_seconds else None,
+                "unused_rules": sum(1 for rule in rules if not rule["hits"]),
+            },
+            "slowest_files": sorted(files, key=lambda f: f["seconds"], reverse=True)[:top],
+            "slowest_rules": sorted(rules, key=lambda r: r["attributed_seconds"], reverse=True)[:top],
+            "files": files,
+            "rules": rules,
+        }
+
+    def write(self, path: str, transformations: list[dict]) -> None:
+        if not self.enabled:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(transformations), f, ensure_ascii=False, indent=2)
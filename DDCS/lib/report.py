@@ -0,0 +1,18 @@
+from collections import Counter
+
+from common import log
+
+
+def report(transformations: list[dict], hits: Counter, source: str = "config.json"):
+    # 每条规则的替换情况只在 --verbose 时逐条输出, 默认输出汇总和按配置文件分组的未命中规则
+    missing = []
+    for index, transformation in enumerate(transformations):
+        search = transformation["src"]
+        replacement = transformation["dest"]
+        if not hits[index]:
+            missing.append(search)
+        elif log.enabled(log.DEBUG):
+            log.debug(f"{search} -> {replacement} ({hits[index]})")
+    log.info(f"{source}：命中 {len(transformations) - len(missing)}/{len(transformations)} 条规则，"
+             f"共替换 {sum(hits.values())} 处", source=source, rules=len(transformations), missing=len(missing))
+    log.group(f"{source} 中未命中的规则", missing)
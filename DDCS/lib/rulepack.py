@@ -0,0 +1,144 @@
+import hashlib
+import inspect
+import mmap
+import os
+import pickle
+import struct
+from typing import Callable
+
+from common import log
+from lib.engine import ReplaceEngine, write_atomic
+
+# 文件布局变化时需要递增, 旧的规则包会自动失效. 引擎与读取规则的代码变化由 code_digest 自动反映在缓存键中
+RULEPACK_VERSION = 1
+
+
+class RulePack:
+    """
+    编译好的规则包, 以配置文件内容与相关代码的哈希命名, 缓存在配置文件旁边的 .ddcs-cache/rulepacks/ 中.
+
+    文件布局为 UInt64 元数据长度 | 元数据 pickle (规则列表与校验结果) | 引擎 pickle.
+    文件以 mmap 读取, 元数据和引擎分别在第一次访问时才反序列化, 需要提前付出这部分开销时调用 load();
+    传给工作进程时只传路径, 各进程自行映射同一个文件.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._meta = None
+        self._engine = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _load(self, part: str):
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            meta_size, = struct.unpack_from("<Q", data, 0)
+            with memoryview(data) as view:
+                if part == "meta":
+                    return pickle.loads(view[8:8 + meta_size])
+                return pickle.loads(view[8 + meta_size:])
+
+    def load(self) -> "RulePack":
+        """立即反序列化元数据和引擎, 返回自身"""
+        if self._meta is None:
+            self._meta = self._load("meta")
+        if self._engine is None:
+            self._engine = self._load("engine")
+        return self
+
+    @property
+    def transformations(self) -> list[dict]:
+        if self._meta is None:
+            self._meta = self._load("meta")
+        return self._meta["transformations"]
+
+    @property
+    def warnings(self) -> list[str]:
+        if self._meta is None:
+            self._meta = self._load("meta")
+        return self._meta["warnings"]
+
+    @property
+    def engine(self) -> ReplaceEngine:
+        if self._engine is None:
+            self._engine = self._load("engine")
+        return self._engine
+
+
+def validate(transformations: list[dict], engine: ReplaceEngine) -> list[str]:
+    """
+    检查规则之间的冲突: 重复的 src, 以及 src 中包含前面某条规则 src 的规则
+    (逐条替换时前面的规则先改掉了这段文本, 后面这条很可能永远不会命中)
+    """
+    warnings = []
+    seen = {}
+    for index, (src, _) in enumerate(engine.rules):
+        if not src:
+            warnings.append(f"第 {index + 1} 条规则的 src 为空")
+            continue
+        if src in seen:
+            warnings.append(f"第 {index + 1} 条规则与第 {seen[src] + 1} 条的 src 重复: {transformations[index]['src']}")
+            continue
+        seen[src] = index
+        shadowed = sorted({rule for _, rule in engine.find(src) if rule < index and engine.rules[rule][0] != src})
+        for rule in shadowed:
+            warnings.append(f"第 {index + 1} 条规则的 src 包含第 {rule + 1} 条的 src, 可能被其提前替换: "
+                            f"{transformations[index]['src']} / {transformations[rule]['src']}")
+    return warnings
+
+
+def compile_rulepack(transformations: list[dict], path: str) -> RulePack:
+    """校验并编译规则, 写入 path"""
+    engine = ReplaceEngine(transformations)
+    warnings = validate(transformations, engine)
+    meta = pickle.dumps({"version": RULEPACK_VERSION, "transformations": transformations, "warnings": warnings},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    content = struct.pack("<Q", len(meta)) + meta + pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, content)
+
+    pack = RulePack(path)
+    pack._meta = {"transformations": transformations, "warnings": warnings}
+    pack._engine = engine
+    return pack
+
+
+def code_digest(loader: Callable[[], list[dict]]) -> bytes:
+    """
+    规则包依赖的代码的哈希: 引擎 (lib/engine.py), 本模块, 以及 loader 所在的源文件 (如 FileProcessor).
+    这些代码修改后缓存的引擎 pickle 或解析出的规则可能已经过时, 缓存键随之变化
+    """
+    files = {inspect.getsourcefile(ReplaceEngine), os.path.abspath(__file__)}
+    try:
+        files.add(inspect.getsourcefile(loader))
+    except TypeError:
+        pass
+    digest = hashlib.sha256()
+    for path in sorted(path for path in files if path):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(path.encode("utf-8"))
+    return digest.digest()
+
+
+def load_rulepack(config_path: str, loader: Callable[[], list[dict]]) -> RulePack:
+    """
+    返回 config_path 对应的规则包. 配置内容和相关代码都未变化时直接使用缓存, 不解析配置也不重建匹配结构;
+    否则调用 loader 读取规则并重新编译, 校验发现的问题只在编译时输出一次
+    """
+    with open(config_path, "rb") as f:
+        digest = hashlib.sha256(f.read() + code_digest(loader)).hexdigest()
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(config_path)), ".ddcs-cache", "rulepacks")
+    path = os.path.join(cache_dir, f"{digest[:32]}-v{RULEPACK_VERSION}.pack")
+    if os.path.exists(path):
+        return RulePack(path)
+
+    pack = compile_rulepack(loader(), path)
+    for warning in pack.warnings:
+        log.warn(warning)
+    return pack
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from common import log
+from lib.catalog import collect_js_files
+from lib.engine import write_atomic
+from lib.js_lexer import extract_ui_strings
+
+INDEX_VERSION = 1
+# ${...} 插值与 {0} 替换字段, 译文中必须原样保留
+_re_placeholder = re.compile(r"\$\{[^}]*\}|\{\d+\}")
+
+# 工作进程中的索引与译文, 由 initializer 设置
+_index = None
+_translations = None
+
+
+def build_index(texts: list[str], scanned: list[tuple[str, str, list[tuple[str, int, int]]]]) -> dict:
+    """
+    由提取结果生成偏移索引: 以文件内容哈希为键, 值为 [起始偏移, 结束偏移, 文本序号] 列表,
+    文本序号指向 texts, 避免在索引中重复保存同一段文本
+    """
+    ids = {text: i for i, text in enumerate(texts)}
+    files = {}
+    for _, digest, strings in scanned:
+        if strings:
+            files[digest] = [[start, end, ids[text]] for text, start, end in strings]
+    return {"version": INDEX_VERSION, "texts": texts, "files": files}
+
+
+def save_index(index: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_atomic(str(path), content)
+
+
+def load_index(path: Path) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def check_translation(english: str, chinese: str) -> bool:
+    return sorted(_re_placeholder.findall(english)) == sorted(_re_placeholder.findall(chinese))
+
+
+def _escape(text: str, quote: int) -> bytes:
+    # 译文写入原字面量的引号之间, 未转义的同种引号和换行需要转义
+    data = text.encode("utf-8")
+    if quote == 0x60:
+        return re.sub(rb"(?<!\\)`", rb"\\`", data)
+    data = re.sub(rb"(?<!\\)" + re.escape(bytes([quote])), b"\\\\" + bytes([quote]), data)
+    return data.replace(b"\n", b"\\n")
+
+
+def splice(data: bytes, spans: list[tuple[str, int, int]], translations: dict[str, str]) -> tuple[bytes, int]:
+    """按偏移从前到后拼接译文, 不做任何搜索, 返回 (新内容, 替换数)"""
+    pieces = []
+    cursor = 0
+    count = 0
+    for text, start, end in sorted(spans, key=lambda span: span[1]):
+        chinese = translations.get(text)
+        if not chinese or start < cursor:
+            continue
+        pieces.append(data[cursor:start])
+        pieces.append(_escape(chinese, data[start - 1]))
+        cursor = end
+        count += 1
+    pieces.append(data[cursor:])
+    return b"".join(pieces), count
+
+
+def _init_worker(index: dict | None, translations: dict[str, str]) -> None:
+    global _index, _translations
+    _index = index
+    _translations = translations
+
+
+def _splice_file(file_path: str) -> tuple[str, bytes | None, int, bool]:
+    with open(file_path, "rb") as f:
+        data = f.read()
+    entry = _index["files"].get(hashlib.sha256(data).hexdigest()) if _index else None
+    if entry is not None:
+        texts = _index["texts"]
+        spans = [(texts[i], start, end) for start, end, i in entry]
+        indexed = True
+    else:
+        # 文件与提取时不同, 重新扫描得到偏移
+        spans = extract_ui_strings(data)
+        indexed = False
+    result, count = splice(data, spans, _translations)
+    return file_path, (result if count else None), count, indexed
+
+
+def splice_tree(root: Path, translations: dict[str, str], index: dict | None, jobs: int) -> Counter:
+    """
+    对 root 下的 js 文件应用译文: 内容哈希命中索引的文件直接按偏移拼接,
+    其余文件用词法分析重新定位. 返回统计信息
+    """
+    valid = {}
+    for english, chinese in translations.items():
+        if check_translation(english, chinese):
+            valid[english] = chinese
+        else:
+            log.warn(f"译文缺少替换字段, 已跳过: {english} -> {chinese}")
+
+    paths = collect_js_files(root)
+    stats = Counter()
+    if jobs <= 1:
+        _init_worker(index, valid)
+        results = map(_splice_file, paths)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(index, valid))
+        results = pool.map(_splice_file, paths)
+    try:
+        for file_path, result, count, indexed in results:
+            stats["indexed" if indexed else "searched"] += 1
+            stats["replaced"] += count
+            if result is not None:
+                write_atomic(file_path, result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return stats
+
+
+def default_index_path() -> Path:
+    return Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / ".ddcs-cache" / "offset-index.json"
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from lib.engine import write_atomic
+from lib.splice import check_translation
+
+CACHE_VERSION = 1
+PROMPT_ID = "ddcs_translate"
+# 配置文件中没有同名提示词时使用, {data} 为 [[序号, 英文], ...] 形式的 JSON 列表
+PROMPT = """你是 Docker Desktop 界面的简体中文本地化译者. 下面是一个 JSON 列表, 每一项为 [序号, 英文界面文本].
+请逐项翻译为简体中文, 只输出一个 JSON 列表, 每一项为 [序号, 中文译文], 序号与输入一致, 不要输出任何其他内容.
+要求:
+- ${...} 插值和 {0}, {1} 等替换字段必须原样保留
+- 保留原文首尾的空格
+- Docker, Kubernetes, WSL, Docker Scout 等产品名, 命令和参数不翻译
+- 不要在译文中添加换行
+
+{data}"""
+
+_re_cjk = re.compile(r"[一-鿿]")
+
+
+def default_ai_caller_path() -> Path:
+    return Path(__file__).resolve().parent.parent.parent / "Python_Bag"
+
+
+def load_ai_caller(path: Path | None = None):
+    """从 Python_Bag 目录导入 ai_caller 模块, 依赖 (pyyaml, requests) 只在翻译时需要"""
+    path = str(path or default_ai_caller_path())
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    import ai_caller
+    return ai_caller
+
+
+class TranslationCache:
+    """
+    以英文原文为键的译文缓存, 通过校验的机器译文都会记录, 之后的版本中同样的文本不再重复请求.
+    需要人工复核的结果不进入缓存.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def get(self, text: str) -> str | None:
+        entry = self.entries.get(text)
+        return entry["translation"] if entry else None
+
+    def put(self, text: str, translation: str, model: str) -> None:
+        self.entries[text] = {"translation": translation, "model": model, "time": time.strftime("%Y-%m-%d")}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        content = json.dumps({"version": CACHE_VERSION, "entries": self.entries}, ensure_ascii=False, indent=1)
+        write_atomic(str(self.path), content.encode("utf-8"))
+
+
+def validate_translation(english: str, chinese) -> str | None:
+    """检查机器译文, 有问题时返回原因, 没有问题返回 None"""
+    if not isinstance(chinese, str) or not chinese.strip():
+        return "译文为空或不是字符串"
+    if not check_translation(english, chinese):
+        return "插值或替换字段与原文不一致"
+    if "\n" in chinese and "\n" not in english:
+        return "译文包含换行"
+    if len(chinese) - len(chinese.lstrip()) != len(english) - len(english.lstrip()) \
+            or len(chinese) - len(chinese.rstrip()) != len(english) - len(english.rstrip()):
+        return "首尾空白与原文不一致"
+    if not _re_cjk.search(chinese):
+        return "译文不含中文, 可能没有翻译"
+    return None
+
+
+class Translator:
+    """
+    用 ai_caller 的提供商批量翻译界面文本.
+
+    待翻译的文本编号后组成 [[序号, 英文], ...] 列表, 按提供商的 Token 估算切分为多个批次并行请求,
+    每批以 JSON 列表往返 (由 _get_output_with_matching_type 解析). 返回结果按序号对应回原文,
+    缺失, 格式错误或未通过校验的条目以及请求失败的整批条目都交给人工复核, 不写入配置.
+    """
+
+    def __init__(self, provider, model: str, cache: TranslationCache, max_chunk_tokens: int = 2000,
+                 max_workers: int = 4):
+        self.provider = provider
+        self.model = model
+        self.cache = cache
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_workers = max_workers
+        prompts = provider.config_manager.config.setdefault("prompts", {})
+        prompts.setdefault(PROMPT_ID, {"content": PROMPT})
+
+    def translate(self, texts: list[str]) -> tuple[dict[str, str], list[dict]]:
+        """返回 (可以直接写入的译文, 需要人工复核的条目)"""
+        accepted = {}
+        review = []
+        pending = []
+        for text in dict.fromkeys(texts):
+            cached = self.cache.get(text)
+            if cached is not None and validate_translation(text, cached) is None:
+                accepted[text] = cached
+            else:
+                pending.append(text)
+        if not pending:
+            return accepted, review
+
+        items = [[index, text] for index, text in enumerate(pending)]
+        batches = self.provider._split_into_chunks(PROMPT_ID, items, self.max_chunk_tokens)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+            results = list(executor.map(self._run_batch, batches))
+
+        for batch, (output, error) in zip(batches, results):
+            for index, english in batch:
+                if error is not None:
+                    review.append({"text": english, "translation": None, "reason": error})
+                    continue
+                chinese = output.get(index)
+                reason = "模型没有返回这一项" if index not in output else validate_translation(english, chinese)
+                if reason is None:
+                    accepted[english] = chinese
+                    self.cache.put(english, chinese, self.model)
+                else:
+                    review.append({"text": english, "translation": chinese, "reason": reason})
+        return accepted, review
+
+    def _run_batch(self, batch: list[list]) -> tuple[dict[int, str], str | None]:
+        # 返回 (序号 -> 译文, 整批失败的原因)
+        try:
+            output, _, _ = self.provider.invoke(self.model, PROMPT_ID, "single_response", batch)
+        except Exception as e:
+            return {}, f"请求失败: {e}"
+        if isinstance(output, str):
+            output = _parse_list(output)
+        if not isinstance(output, list):
+            return {}, "模型输出不是 JSON 列表"
+        ids = {index for index, _ in batch}
+        translations = {}
+        for item in output:
+            if isinstance(item, list) and len(item) == 2 and item[0] in ids and item[0] not in translations:
+                translations[item[0]] = item[1]
+        return translations, None
+
+
+def _parse_list(text: str) -> list | None:
+    # _get_output_with_matching_type 无法解析时 (如整段输出包在 ```json 代码块中) 返回原文, 取第一个 [ 到最后一个 ] 再试
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        output = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return output if isinstance(output, list) else None
+
+
+def save_review(review: list[dict], path: Path) -> None:
+    content = json.dumps(review, ensure_ascii=False, indent=2)
+    write_atomic(str(path), content.encode("utf-8"))
+
+
+def default_cache_path() -> Path:
+    return Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / ".ddcs-cache" / "translations.json"
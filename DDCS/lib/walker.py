@@ -0,0 +1,87 @@
+import os
+from collections import Counter
+
+# 不可能包含界面文本的二进制资源, 按扩展名直接跳过, 不打开文件
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".ico", ".icns", ".avif",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".node", ".wasm", ".map", ".dll", ".so", ".dylib", ".exe", ".bin", ".dat", ".pak",
+    ".mp3", ".mp4", ".wav", ".ogg", ".webm",
+    ".zip", ".gz", ".br", ".tgz", ".asar", ".pdf",
+}
+# 文本文件, 不需要检查文件头
+TEXT_EXTENSIONS = {".js", ".mjs", ".cjs", ".json", ".html", ".htm", ".css", ".svg", ".txt", ".xml", ".md", ".yml",
+                   ".yaml"}
+# 扩展名未知时按文件头识别的二进制格式
+MAGIC_NUMBERS = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"RIFF", b"\x00\x00\x01\x00",
+    b"wOFF", b"wOF2", b"\x00\x01\x00\x00", b"OTTO",
+    b"\x00asm", b"MZ", b"\x7fELF", b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe", b"\xca\xfe\xba\xbe",
+    b"PK\x03\x04", b"\x1f\x8b", b"%PDF",
+)
+_MAGIC_SIZE = max(len(magic) for magic in MAGIC_NUMBERS)
+
+
+def min_rule_size(transformations: list[dict]) -> int:
+    """最短的规则原文的字节数, 比它小的文件不可能命中任何规则"""
+    sizes = [len(t["src"].encode("utf-8")) for t in transformations if t["src"]]
+    return min(sizes) if sizes else 1
+
+
+def classify(name: str, path: str) -> str | None:
+    """返回跳过的原因 (extension / magic), 需要处理时返回 None"""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        return None
+    if ext in BINARY_EXTENSIONS:
+        return "extension"
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_MAGIC_SIZE)
+    except OSError:
+        return "magic"
+    return "magic" if head.startswith(MAGIC_NUMBERS) else None
+
+
+def walk_files(root: str, min_size: int = 1, max_size: int | None = None, stats: Counter | None = None):
+    """
+    用 os.scandir 逐个产出 root 下需要处理的文件路径, 代替先列出整棵目录树.
+
+    目录用显式栈深度优先遍历, 每个目录内按名称排序, 输出顺序与 os.walk 一致且稳定.
+    二进制资源 (按扩展名或文件头识别) 和大小不在 [min_size, max_size] 内的文件直接跳过,
+    跳过的原因计入 stats. 不跟随符号链接. 内存占用只与目录深度和单个目录的大小有关.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                size = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            if stats is not None:
+                stats["files"] += 1
+            if size < min_size or (max_size is not None and size > max_size):
+                reason = "size"
+            else:
+                reason = classify(entry.name, entry.path)
+            if reason is not None:
+                if stats is not None:
+                    stats[reason] += 1
+                continue
+            if stats is not None:
+                stats["bytes"] += size
+            yield entry.path
+        # 逆序入栈, 先处理名称靠前的子目录
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,241 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from collections import Counter
+
+from common import log
+from lib.asar import AsarArchive, AsarError, patch_archive
+from lib.backup import default_backup_path, save_backup
+from lib.manifest import IncrementalRunner, sha256_bytes, sha256_file
+from lib.parallel import iter_archive_results
+from lib.rulepack import RulePack
+
+# inotify 事件, 见 <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+# 安装程序通常写临时文件再改名, 或者删除后重新创建, 所以监视所在目录而不是文件本身
+_IN_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+            | _IN_MOVE_SELF)
+_EVENT = struct.Struct("iIII")
+
+
+def _signature(path: str) -> tuple[int, int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class InotifyWatcher:
+    """通过 ctypes 调用 libc 的 inotify 监视文件所在目录, 只在 Linux 上可用"""
+
+    kind = "inotify"
+
+    def __init__(self, path: str):
+        self.directory, self.filename = os.path.split(os.path.abspath(path))
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._wd = None
+        try:
+            self._add_watch()
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(self.directory), _IN_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), self.directory)
+        self._wd = wd
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """阻塞直到目标文件可能发生变化, 超时返回 False"""
+        if self._wd is None:
+            # 所在目录被删除 (如卸载重装), 等它重新出现后重新监视
+            time.sleep(1)
+            if not os.path.isdir(self.directory):
+                return False
+            self._add_watch()
+            return True
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        data = os.read(self._fd, 64 << 10)
+        changed = False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                self._wd = None
+                changed = True
+            elif mask & _IN_Q_OVERFLOW or os.fsdecode(name) == self.filename:
+                changed = True
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """定期比较文件的大小, 修改时间和 inode, 用于没有 inotify 的平台"""
+
+    kind = "polling"
+
+    def __init__(self, path: str, interval: float = 2.0):
+        self.path = path
+        self.interval = interval
+        self._last = _signature(path)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(self.interval)
+            signature = _signature(self.path)
+            if signature != self._last:
+                self._last = signature
+                return True
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(path: str, interval: float = 2.0) -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            log.warn(f"inotify 不可用, 改为轮询: {e}")
+    return PollingWatcher(path, interval)
+
+
+class ArchiveDaemon:
+    """
+    常驻汉化: 规则包和增量清单留在内存中, 监视 app.asar, Docker Desktop 更新覆盖归档后自动重新汉化.
+
+    归档条目按内容哈希在增量清单 (与 --incremental 共用 .ddcs-cache) 中查找, 与之前处理过的内容相同的条目
+    直接复用输出, 只有更新中真正变化的条目才重新处理. 汉化后写回的归档签名记录在 watch.json 中,
+    监视到的是自己写回的归档, 或者重启后归档仍是上次汉化的结果时都不会重复汉化.
+    """
+
+    def __init__(self, asar_path: str, pack: RulePack, cache_dir: str, jobs: int = 1, settle: float = 2.0,
+                 interval: float = 2.0):
+        self.asar_path = os.path.abspath(asar_path)
+        self.pack = pack
+        self.jobs = jobs
+        self.settle = settle
+        self.runner = IncrementalRunner(pack, cache_dir)
+        # 提前反序列化引擎, 之后每次更新都直接使用
+        pack.load()
+        self.state_path = os.path.join(cache_dir, "watch.json")
+        self.backup_path = default_backup_path(cache_dir, self.asar_path)
+        self.watcher = make_watcher(self.asar_path, interval)
+        self._written = None
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self) -> None:
+        self._written = _signature(self.asar_path)
+        state = self._load_state()
+        state[self.asar_path] = {"size": self._written[0], "mtime_ns": self._written[1],
+                                 "sha256": sha256_file(self.asar_path)}
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+
+    def is_localized(self) -> bool:
+        """归档是否仍是上次汉化写回的内容"""
+        signature = _signature(self.asar_path)
+        recorded = self._load_state().get(self.asar_path)
+        if signature is None or recorded is None or (recorded["size"], recorded["mtime_ns"]) != signature[:2]:
+            return False
+        if sha256_file(self.asar_path) != recorded["sha256"]:
+            return False
+        self._written = signature
+        return True
+
+    def localize(self) -> tuple[Counter, Counter]:
+        """汉化当前的归档并原地写回, 返回 (每条规则的替换次数, 统计信息)"""
+        hits = Counter()
+        stats = Counter()
+        replacements = {}
+        pending = {}
+        with AsarArchive(self.asar_path) as archive:
+            for name in archive.files():
+                with archive.read(name) as data:
+                    digest = sha256_bytes(data)
+                    found = self.runner.lookup(digest, lambda: bytes(data))
+                if found is None:
+                    pending[name] = digest
+                    continue
+                output, file_hits = found
+                if output is not None:
+                    replacements[name] = output
+                hits.update(file_hits)
+                stats["reused"] += 1
+
+        for name, result, file_hits in iter_archive_results(self.pack, self.asar_path, self.jobs,
+                                                            names=list(pending)):
+            self.runner.store(pending[name], result, file_hits)
+            if result is not None:
+                replacements[name] = result
+            hits.update(file_hits)
+            stats["processed"] += 1
+        self.runner.manifest.save()
+
+        if replacements:
+            # 每次更新后的新归档都重新记录差异备份, 可以随时用 --restore 还原为这个版本的原始归档
+            save_backup(self.backup_path, self.asar_path, replacements)
+            patch_archive(self.asar_path, self.asar_path, replacements)
+        stats["changed"] = len(replacements)
+        self._save_state()
+        return hits, stats
+
+    def wait_for_update(self) -> None:
+        """阻塞直到归档被替换为一个新的, 完整可读的版本 (不包括自己写回的归档)"""
+        while True:
+            if not self.watcher.wait():
+                continue
+            # 安装程序可能分多次写入, 等大小和修改时间在 settle 秒内不再变化
+            signature = _signature(self.asar_path)
+            while True:
+                time.sleep(self.settle)
+                current = _signature(self.asar_path)
+                if current == signature:
+                    break
+                signature = current
+            if signature is None or signature == self._written:
+                continue
+            try:
+                AsarArchive(self.asar_path).close()
+            except (OSError, AsarError):
+                # 还没有写完, 等下一次事件
+                continue
+            return
+
+    def close(self) -> None:
+        self.watcher.close()
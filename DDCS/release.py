@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+# 多架构并行构建: 从 dist 目录中已下载的安装包生成各架构的 v1 / v2beta 汉化包
+#
+# 每个安装包只解压一次, 各架构 app.asar 中内容相同的文件按哈希去重, 每份内容只汉化一次,
+# v1 与 v2 的结果都从同一次解压得到. 不会下载任何文件, 下载由 release.sh 负责.
+import argparse
+import hashlib
+import re
+import shutil
+import subprocess
+import tarfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from common import log
+from lib.asar import AsarArchive, patch_archive
+from lib.parallel import default_jobs, make_engine
+from lib.processor import FileProcessor
+from lib.report import report
+from lib.rulepack import RulePack, load_rulepack
+
+# 各架构安装包中 app.asar 所在的目录
+RESOURCES = {
+    "Windows": "frontend/resources",
+    "Mac": "Docker/Docker.app/Contents/MacOS/Docker Desktop.app/Contents/Resources",
+    "Debian": "opt/docker-desktop/resources",
+}
+_re_installer = re.compile(r"DockerDesktop-(.+)-(\w+-\w+)\.(exe|dmg|deb)$")
+
+# 工作进程中的引擎和已打开的归档
+_engine = None
+_archives = {}
+
+
+def find_installers(dist: str, version: str | None) -> dict[str, Path]:
+    installers = {}
+    for path in sorted(Path(dist).iterdir()):
+        m = _re_installer.match(path.name)
+        if m and (version is None or m.group(1) == version):
+            installers[m.group(2)] = path
+    return installers
+
+
+def unpack(installer: Path, arch: str, tmp: Path, sevenzip: str) -> Path:
+    """解压安装包, 把 app.asar 和 app.asar.unpacked 移到 tmp/app-<arch>.asar, 返回归档路径"""
+    family = arch.split("-")[0]
+    if family not in RESOURCES:
+        raise ValueError(f"unknown arch: {arch}")
+    out = tmp / arch
+    shutil.rmtree(out, ignore_errors=True)
+    # 7zz 对安装包中的部分条目会报警告, 与 release.sh 一样不以返回值判断, 以是否找到 app.asar 为准
+    subprocess.run([sevenzip, "x", str(installer), "-y", f"-o{out}", "-bso0", "-bd"], check=False)
+    if family == "Debian":
+        prefix = RESOURCES[family] + "/app.asar"
+        with tarfile.open(out / "data.tar") as tar:
+            members = [m for m in tar.getmembers() if m.name.lstrip("./").startswith(prefix)]
+            if hasattr(tarfile, "data_filter"):
+                # data 过滤器拒绝绝对路径, 跳出目标目录的路径和链接, 以及设备文件
+                tar.extractall(out, members=members, filter="data")
+            else:
+                # 没有 filter 参数的旧版本 (3.10.12 之前): 只解压普通文件和目录, 并拒绝跳出目标目录的路径
+                root = out.resolve()
+                for member in members:
+                    if not (member.isfile() or member.isdir()) or not (out / member.name).resolve().is_relative_to(root):
+                        raise ValueError(f"{installer.name} 中的条目不安全: {member.name}")
+                tar.extractall(out, members=members)
+
+    resources = out / RESOURCES[family]
+    archive = tmp / f"app-{arch}.asar"
+    if not (resources / "app.asar").exists():
+        raise FileNotFoundError(f"{installer.name} 中没有找到 app.asar")
+    for suffix in ("", ".unpacked"):
+        target = Path(f"{archive}{suffix}")
+        if target.is_dir():
+            shutil.rmtree(target)
+        elif target.exists():
+            target.unlink()
+        if (resources / f"app.asar{suffix}").exists():
+            shutil.move(resources / f"app.asar{suffix}", target)
+    shutil.rmtree(out, ignore_errors=True)
+    return archive
+
+
+def _init_worker(pack: RulePack) -> None:
+    global _engine
+    _engine = make_engine(pack)
+
+
+def _localize(task: tuple[str, str, str]) -> tuple[str, bytes | None, Counter]:
+    digest, archive_path, name = task
+    if archive_path not in _archives:
+        _archives[archive_path] = AsarArchive(archive_path)
+    result, hits = _engine.process_data(_archives[archive_path].read(name))
+    return digest, result, hits
+
+
+def _localize_v2(root: str) -> None:
+    # v2 的替换依赖 black 等额外模块, 只在需要时导入
+    from lib.extract import replace
+    replace(Path(root))
+
+
+class ReleaseBuilder:
+    def __init__(self, pack: RulePack, dist: str, tmp: str, jobs: int):
+        self.pack = pack
+        self.dist = Path(dist)
+        self.tmp = Path(tmp)
+        self.jobs = jobs
+        # 内容哈希 -> (归档路径, 条目路径), 每份内容只记录第一次出现的位置
+        self.unique = {}
+        # 架构 -> {条目路径: 内容哈希}
+        self.layouts = {}
+
+    def index(self, arch: str, archive_path: Path) -> None:
+        layout = {}
+        with AsarArchive(str(archive_path)) as archive:
+            for name in archive.files():
+                with archive.read(name) as data:
+                    digest = hashlib.sha256(data).hexdigest()
+                layout[name] = digest
+                self.unique.setdefault(digest, (str(archive_path), name))
+        self.layouts[arch] = layout
+
+    def localize_v1(self) -> tuple[dict[str, bytes], Counter]:
+        results = {}
+        hits = Counter()
+        tasks = [(digest, path, name) for digest, (path, name) in self.unique.items()]
+        chunksize = max(1, len(tasks) // (self.jobs * 8))
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                 initargs=(self.pack,)) as pool:
+            for digest, result, file_hits in pool.map(_localize, tasks, chunksize=chunksize):
+                if result is not None:
+                    results[digest] = result
+                hits.update(file_hits)
+        return results, hits
+
+    def localize_v2(self) -> dict[str, bytes]:
+        """
+        把去重后的内容按原路径写入若干个暂存目录 (同一路径在不同架构中内容不同时放入不同目录),
+        对每个目录运行 v2 替换, 再读回有变化的内容
+        """
+        staging = self.tmp / "v2-staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        roots = []
+        placed = {}
+        opened = {}
+        try:
+            for digest, (archive_path, name) in self.unique.items():
+                slot = 0
+                while slot < len(roots) and name in roots[slot]:
+                    slot += 1
+                if slot == len(roots):
+                    roots.append(set())
+                roots[slot].add(name)
+                path = staging / str(slot) / name
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if archive_path not in opened:
+                    opened[archive_path] = AsarArchive(archive_path)
+                with opened[archive_path].read(name) as data:
+                    path.write_bytes(data)
+                placed[digest] = path
+        finally:
+            for archive in opened.values():
+                archive.close()
+
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(roots)) or 1) as pool:
+            list(pool.map(_localize_v2, [str(staging / str(slot)) for slot in range(len(roots))]))
+
+        results = {}
+        for digest, path in placed.items():
+            content = path.read_bytes()
+            if hashlib.sha256(content).hexdigest() != digest:
+                results[digest] = content
+        shutil.rmtree(staging, ignore_errors=True)
+        return results
+
+    def write(self, arch: str, archive_path: Path, results: dict[str, bytes], suffix: str) -> int:
+        replacements = {name: results[digest] for name, digest in self.layouts[arch].items() if digest in results}
+        patch_archive(str(archive_path), str(self.dist / f"app-{arch}{suffix}.asar"), replacements)
+        return len(replacements)
+
+
+def build(installers: dict[str, Path], pack: RulePack, dist: str, tmp: str, sevenzip: str, jobs: int,
+          v2: bool) -> None:
+    Path(tmp).mkdir(parents=True, exist_ok=True)
+    builder = ReleaseBuilder(pack, dist, tmp, jobs)
+
+    # 解压是外部进程, 各架构同时进行
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(installers) or 1) as pool:
+        futures = {arch: pool.submit(unpack, path, arch, Path(tmp), sevenzip) for arch, path in installers.items()}
+        archives = {arch: future.result() for arch, future in futures.items()}
+    for arch, archive_path in archives.items():
+        builder.index(arch, archive_path)
+    total = sum(len(layout) for layout in builder.layouts.values())
+    log.info(f"解压完成：{len(archives)} 个架构，{total} 个文件，去重后 {len(builder.unique)} 个，耗时 {time.perf_counter() - t:.2f}s")
+
+    t = time.perf_counter()
+    results, hits = builder.localize_v1()
+    for arch, archive_path in archives.items():
+        count = builder.write(arch, archive_path, results, "")
+        log.info(f"app-{arch}.asar：修改 {count} 个文件")
+    log.info(f"v1 汉化耗时 {time.perf_counter() - t:.2f}s")
+    report(pack.transformations, hits)
+
+    if v2:
+        t = time.perf_counter()
+        results = builder.localize_v2()
+        for arch, archive_path in archives.items():
+            count = builder.write(arch, archive_path, results, "-v2beta")
+            log.info(f"app-{arch}-v2beta.asar：修改 {count} 个文件")
+        log.info(f"v2 汉化耗时 {time.perf_counter() - t:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dist", type=str, default="dist", help="安装包所在目录, 汉化包也输出到这里")
+    parser.add_argument("--tmp", type=str, default="tmp")
+    parser.add_argument("--version", type=str, default=None, help="只处理指定版本的安装包")
+    parser.add_argument("--arch", action="append", default=None, help="只处理指定架构, 可重复, 如 Windows-x86")
+    parser.add_argument("--7zz", dest="sevenzip", type=str, default="./7z/7zz")
+    # 0 表示使用全部 CPU 核心
+    parser.add_argument("--jobs", type=int, default=0)
+    parser.add_argument("--no-v2", action="store_true")
+    log.add_arguments(parser)
+    args = parser.parse_args()
+    log.setup(args)
+
+    found = find_installers(args.dist, args.version)
+    if args.arch:
+        found = {arch: path for arch, path in found.items() if arch in args.arch}
+    # 两个汉化包都已存在的架构跳过
+    found = {arch: path for arch, path in found.items()
+             if not (Path(args.dist, f"app-{arch}.asar").exists()
+                     and (args.no_v2 or Path(args.dist, f"app-{arch}-v2beta.asar").exists()))}
+    if not found:
+        log.warn("没有需要处理的安装包")
+    else:
+        log.info(f"待处理：{', '.join(f'{arch} ({path.name})' for arch, path in found.items())}")
+        pack = load_rulepack("./config.json", FileProcessor(args.tmp, "./config.json").get_transformations)
+        build(found, pack, args.dist, args.tmp, args.sevenzip, args.jobs or default_jobs(), not args.no_v2)
@@ -22,11 +22,6 @@ if [ ! -e "./7z/7zz" ]; then
   tar -xf 7z/7z.tar.xz -C 7z
 fi
 
-# install asar
-if ! command -v "7zz" >/dev/null; then
-  npm install -g asar
-fi
-
 # install requirements
 pip install black
 
@@ -48,46 +43,8 @@ if [ ! -e "dist/DockerDesktop-${version}-Debian-x86.deb" ]; then
     wget -q -O "dist/DockerDesktop-${version}-Debian-x86.deb" "https://desktop.docker.com/linux/main/amd64${build_path}docker-desktop-amd64.deb"
 fi
 
-# unzip, extract, replace, pack
-function ddcs() {
-    pkg_name=$1
-    # Windows-x86, Windows-arm, Mac-apple, Mac-intel, Debian-x86
-    arch=$(echo "$pkg_name" | sed -nr 's/DockerDesktop-.+-(.+-.+)\..+/\1/p')
-
-    if [ -e "app-${arch}.asar" ]; then
-        return
-    fi
-
-    ./7z/7zz x "dist/${pkg_name}" -y -o"tmp/${arch}" -bso0 -bd || true
-    if [[ $arch == Windows* ]]; then
-        src="frontend/resources"
-    elif [[ $arch == Mac* ]]; then
-        src="Docker/Docker.app/Contents/MacOS/Docker Desktop.app/Contents/Resources"
-    elif [[ $arch == Debian* ]]; then
-        tar -xf "tmp/${arch}/data.tar" -C "tmp/${arch}"
-        src="opt/docker-desktop/resources"
-    else
-       echo "unknown arch"
-       exit 1
-    fi
-    rm -rf "tmp/app-${arch}.asar" "tmp/app-${arch}.asar.unpacked"
-    mv "tmp/${arch}/${src}/app.asar" "tmp/app-${arch}.asar"
-    mv "tmp/${arch}/${src}/app.asar.unpacked" "tmp/app-${arch}.asar.unpacked"
-
-    asar extract "tmp/app-${arch}.asar" "tmp/app-${arch}"
-    python ddcs.py --root_path "tmp/app-${arch}" > /dev/null
-    asar pack "tmp/app-${arch}" "dist/app-${arch}.asar"
-
-    asar extract "tmp/app-${arch}.asar" "tmp/app-${arch}"
-    python ddcs.py --root_path "tmp/app-${arch}" --v2 > /dev/null
-    asar pack "tmp/app-${arch}" "dist/app-${arch}-v2beta.asar"
-}
-
-ddcs "DockerDesktop-${version}-Windows-x86.exe"
-ddcs "DockerDesktop-${version}-Windows-arm.exe"
-ddcs "DockerDesktop-${version}-Mac-apple.dmg"
-ddcs "DockerDesktop-${version}-Mac-intel.dmg"
-ddcs "DockerDesktop-${version}-Debian-x86.deb"
+# unzip, replace, pack: 各架构并行处理, 相同的文件只汉化一次
+python release.py --version "${version}" --dist dist --tmp tmp --7zz ./7z/7zz --jobs 0 --quiet
 
 
 notes="DockerDesktop ${version} 版本安装程序及汉化包.
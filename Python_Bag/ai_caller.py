@@ -1,11 +1,21 @@
 import os
+import re
 import yaml
 import json
 import uuid
 import time
+import random
+import heapq
+import hashlib
+import threading
+import contextlib
+import contextvars
+import unicodedata
 import requests
 from typing import Union, Dict, List, Tuple, Any
 import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 class AICallerConfigError(Exception):
     """配置文件相关错误"""
@@ -134,11 +144,954 @@ class ConfigManager:
             List[str]: 所有提示词ID的列表
         """
         return list(self.config.get('prompts', {}).keys())
+    
+    def is_prompt_reusable(self, prompt_id: str) -> bool:
+        """
+        判断提示词的响应是否允许被近似缓存复用（配置中cache_reuse为true）
+        
+        Args:
+            prompt_id: 提示词模板ID
+            
+        Returns:
+            bool: 是否允许复用
+        """
+        prompt = self.config.get('prompts', {}).get(prompt_id) or {}
+        return bool(prompt.get('cache_reuse', False))
+
+
+class NearDuplicateCache:
+    """
+    近似重复响应缓存，基于SimHash指纹和局部敏感（分段）索引，完全在本地运行
+    
+    只对提示词中的数据部分计算，模板是固定的，由命名空间中的提示词ID区分，否则较长的模板会掩盖数据的差异。
+    查找时先按规范化数据（列表和字典为sort_keys的JSON）的SHA256做精确匹配；阈值为1时只做精确匹配。
+    阈值小于1时再做近似匹配：数据先归一化（大小写、空白、可配置的样板文字，字符串数据还会去掉标点），
+    再按字符3-gram计算64位SimHash指纹。指纹被切分为若干段建立索引，任意一段相同即作为候选，
+    只要相似度（1 - 汉明距离/64）不低于阈值即视为命中。近似匹配是有损的：归一化后相同或指纹接近的不同数据
+    会复用彼此的响应，应配合抽样审计使用。
+    """
+    
+    FINGERPRINT_BITS = 64
+    
+    def __init__(self, threshold: float = 1.0, max_entries: int = 10000, audit_rate: float = 0.0,
+                 ignore_patterns: List[str] = None, max_audit_samples: int = 100):
+        """
+        初始化近似缓存
+        
+        Args:
+            threshold: 相似度阈值，取值(0, 1]，默认1只接受完全相同的数据，小于1时启用有损的近似匹配
+            max_entries: 最多缓存的响应条数，超出后淘汰最早写入的条目
+            audit_rate: 近似命中时抽样审计的比例，被抽中的请求仍会真实调用模型并与缓存结果比对
+            ignore_patterns: 近似匹配归一化时需要删除的样板文字正则表达式列表
+            max_audit_samples: 保留的审计样本条数
+        """
+        if not 0 < threshold <= 1:
+            raise AICallerInputError(f"相似度阈值必须在(0, 1]之间: {threshold}")
+        
+        self.threshold = threshold
+        self.max_distance = int((1 - threshold) * self.FINGERPRINT_BITS)
+        # 汉明距离不超过max_distance时，按鸽巢原理切分为max_distance+1段，至少有一段完全相同
+        self.bands = min(self.max_distance + 1, self.FINGERPRINT_BITS)
+        self.band_bits = self.FINGERPRINT_BITS // self.bands
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self.ignore_patterns = [re.compile(pattern) for pattern in (ignore_patterns or [])]
+        
+        self._entries = OrderedDict()  # 条目ID -> (命名空间, 指纹, 响应文本, 数据的SHA256)
+        self._exact = {}  # (命名空间, 数据的SHA256) -> 条目ID
+        self._buckets = {}  # (命名空间, 段序号, 段值) -> 条目ID集合
+        self._next_id = 0
+        self._lock = threading.Lock()
+        
+        self.stats = {"lookups": 0, "hits": 0, "exact_hits": 0, "near_hits": 0, "audits": 0, "false_positives": 0}
+        self.audit_samples = deque(maxlen=max_audit_samples)
+    
+    def normalize(self, text: str, structured: bool = False) -> str:
+        """
+        归一化数据：删除样板文字，统一大小写和空白，字符串数据还会删除标点
+        
+        Args:
+            text: 数据文本
+            structured: 是否为列表或字典的JSON，为True时保留标点，否则["a b", "c"]和["a", "b c"]会变得相同
+            
+        Returns:
+            str: 归一化后的文本
+        """
+        for pattern in self.ignore_patterns:
+            text = pattern.sub(' ', text)
+        text = unicodedata.normalize('NFKC', text).lower()
+        if not structured:
+            text = ''.join(' ' if unicodedata.category(ch).startswith('P') else ch for ch in text)
+        return ' '.join(text.split())
+    
+    def fingerprint(self, normalized_text: str) -> int:
+        """
+        计算归一化文本的64位SimHash指纹
+        
+        Args:
+            normalized_text: 归一化后的文本
+            
+        Returns:
+            int: 指纹
+        """
+        weights = [0] * self.FINGERPRINT_BITS
+        shingles = {}
+        for i in range(max(len(normalized_text) - 2, 1)):
+            shingle = normalized_text[i:i + 3]
+            shingles[shingle] = shingles.get(shingle, 0) + 1
+        
+        for shingle, count in shingles.items():
+            value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for bit in range(self.FINGERPRINT_BITS):
+                weights[bit] += count if value >> bit & 1 else -count
+        
+        return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    
+    def _band_keys(self, namespace: str, fingerprint: int) -> List[Tuple[str, int, int]]:
+        """将指纹切分为若干段，生成索引键"""
+        mask = (1 << self.band_bits) - 1
+        keys = []
+        for band in range(self.bands):
+            # 最后一段包含除不尽时剩余的所有位
+            if band == self.bands - 1:
+                value = fingerprint >> (band * self.band_bits)
+            else:
+                value = fingerprint >> (band * self.band_bits) & mask
+            keys.append((namespace, band, value))
+        return keys
+    
+    def _digest(self, namespace: str, text: str) -> str:
+        """计算命名空间和规范化数据的SHA256，用于精确匹配"""
+        return hashlib.sha256(f"{namespace}\n{text}".encode('utf-8')).hexdigest()
+    
+    def lookup(self, namespace: str, text: str, structured: bool = False) -> Union[Dict, None]:
+        """
+        查找与提示词近似的已缓存响应，先精确匹配，阈值小于1时再近似匹配
+        
+        Args:
+            namespace: 命名空间，不同提供商/模型/提示词ID之间互不复用
+            text: 提示词中的数据部分，列表和字典应为sort_keys的JSON
+            structured: 数据是否为列表或字典
+            
+        Returns:
+            Dict: 命中时返回{'content', 'similarity', 'audit', 'namespace', 'text'}，audit为True表示需要真实调用以审计；
+                  未命中返回None
+        """
+        digest = self._digest(namespace, text)
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry_id = self._exact.get(digest)
+            if entry_id is not None:
+                self.stats["hits"] += 1
+                self.stats["exact_hits"] += 1
+                return {
+                    "content": self._entries[entry_id][2],
+                    "similarity": 1.0,
+                    "audit": False,
+                    "namespace": namespace,
+                    "text": text
+                }
+            if self.threshold >= 1:
+                return None
+        
+        fingerprint = self.fingerprint(self.normalize(text, structured))
+        with self._lock:
+            best_id, best_distance = None, self.max_distance + 1
+            for key in self._band_keys(namespace, fingerprint):
+                for entry_id in self._buckets.get(key, ()):
+                    distance = bin(self._entries[entry_id][1] ^ fingerprint).count('1')
+                    if distance < best_distance:
+                        best_id, best_distance = entry_id, distance
+            if best_id is None:
+                return None
+            
+            # 数据并不完全相同，指纹相同也可能是误命中，同样参与审计
+            self.stats["hits"] += 1
+            self.stats["near_hits"] += 1
+            audit = random.random() < self.audit_rate
+            return {
+                "content": self._entries[best_id][2],
+                "similarity": 1 - best_distance / self.FINGERPRINT_BITS,
+                "audit": audit,
+                "namespace": namespace,
+                "text": text
+            }
+    
+    def store(self, namespace: str, text: str, content: str, structured: bool = False) -> None:
+        """
+        缓存一条响应
+        
+        Args:
+            namespace: 命名空间
+            text: 提示词中的数据部分，列表和字典应为sort_keys的JSON
+            content: 模型返回的文本内容
+            structured: 数据是否为列表或字典
+        """
+        digest = self._digest(namespace, text)
+        # 阈值为1时只做精确匹配，不需要指纹
+        fingerprint = self.fingerprint(self.normalize(text, structured)) if self.threshold < 1 else None
+        with self._lock:
+            old_id = self._exact.pop(digest, None)
+            if old_id is not None:
+                self._remove(old_id)
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, fingerprint, content, digest)
+            self._exact[digest] = entry_id
+            if fingerprint is not None:
+                for key in self._band_keys(namespace, fingerprint):
+                    self._buckets.setdefault(key, set()).add(entry_id)
+            
+            # 超出容量时淘汰最早写入的条目
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def _remove(self, entry_id: int) -> None:
+        """删除一个条目及其索引，调用方需持有锁"""
+        namespace, fingerprint, _, digest = self._entries.pop(entry_id)
+        if self._exact.get(digest) == entry_id:
+            del self._exact[digest]
+        if fingerprint is None:
+            return
+        for key in self._band_keys(namespace, fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+    
+    def record_audit(self, hit: Dict, fresh_content: str) -> None:
+        """
+        记录一次审计结果：比对缓存响应与真实调用的响应，不一致即计为误命中
+        
+        Args:
+            hit: lookup返回的命中信息
+            fresh_content: 真实调用得到的响应文本
+        """
+        false_positive = self.normalize(hit["content"]) != self.normalize(fresh_content)
+        with self._lock:
+            self.stats["audits"] += 1
+            if false_positive:
+                self.stats["false_positives"] += 1
+            self.audit_samples.append({
+                "namespace": hit["namespace"],
+                "prompt": hit["text"],
+                "similarity": hit["similarity"],
+                "cached_content": hit["content"],
+                "fresh_content": fresh_content,
+                "false_positive": false_positive
+            })
+    
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        """
+        获取缓存统计信息
+        
+        Returns:
+            Dict: 包含查询次数、命中次数、命中率、审计次数和误命中率等
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["false_positive_rate"] = stats["false_positives"] / stats["audits"] if stats["audits"] else 0.0
+        return stats
+
+
+class EmbeddingCache:
+    """
+    向量缓存，以(提供商, 模型, 文本)的哈希为键保存float32向量的字节，超出容量后淘汰最久未使用的条目
+    """
+    
+    def __init__(self, max_entries: int = 100000):
+        """
+        初始化向量缓存
+        
+        Args:
+            max_entries: 最多缓存的向量条数
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 哈希 -> float32向量的字节
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0}
+    
+    @staticmethod
+    def key(namespace: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{namespace}\0{text}".encode('utf-8'), digest_size=16).digest()
+    
+    def get_many(self, keys: List[bytes]) -> List[Union[bytes, None]]:
+        """批量查询，未命中的位置为None"""
+        with self._lock:
+            vectors = []
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                vectors.append(vector)
+            self.stats["lookups"] += len(keys)
+            self.stats["hits"] += sum(1 for vector in vectors if vector is not None)
+        return vectors
+    
+    def put_many(self, keys: List[bytes], vectors: List[bytes]) -> None:
+        """批量写入"""
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        """
+        获取缓存统计信息
+        
+        Returns:
+            Dict: 包含查询次数、命中次数、命中率和缓存条数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+class Cassette:
+    """
+    录制/回放磁带，以归一化后的请求为键保存_make_api_call的请求与响应，用于离线、可重复的集成测试和性能回归
+    
+    数据文件每条记录一行，格式为 元数据JSON + 制表符 + 响应JSON，只追加不修改；旁边的.idx索引文件按请求键
+    记录各条响应在数据文件中的偏移、长度和录制耗时，打开时直接按偏移截取响应，不需要解析整个文件。索引缺失或与
+    数据文件大小不一致时扫描数据文件重建。同一请求录制了多次时，回放按录制顺序依次返回（循环使用）。
+    同一个磁带文件不要由多个进程同时录制。
+    
+    模式：
+        record: 总是真实调用并追加录制
+        replay: 只回放，没有匹配的录制时抛出AICallerAPIError
+        auto: 有匹配的录制时回放，否则真实调用并录制
+    """
+    
+    MODES = ('record', 'replay', 'auto')
+    VERSION = 1
+    
+    def __init__(self, path: str, mode: str = 'replay', simulate_latency: bool = False, latency_scale: float = 1.0,
+                 ignore_patterns: List[str] = None):
+        """
+        初始化并加载磁带
+        
+        Args:
+            path: 数据文件路径，索引保存在path + '.idx'
+            mode: record、replay或auto
+            simulate_latency: 回放时是否按录制时的耗时等待，用于容量估算
+            latency_scale: 模拟耗时的缩放比例
+            ignore_patterns: 计算请求键时需要替换掉的可变内容（如时间戳、随机ID）的正则表达式列表
+            
+        Raises:
+            AICallerInputError: 模式不正确
+            AICallerConfigError: replay模式下磁带文件不存在
+        """
+        if mode not in self.MODES:
+            raise AICallerInputError(f"磁带模式必须是{'、'.join(self.MODES)}之一: {mode}")
+        if mode == 'replay' and not os.path.exists(path):
+            raise AICallerConfigError(f"磁带文件不存在: {path}")
+        
+        self.path = path
+        self.index_path = path + '.idx'
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.ignore_patterns = [re.compile(pattern) for pattern in (ignore_patterns or [])]
+        
+        self._index = {}  # 请求键 -> [[偏移, 长度, 录制耗时], ...]
+        self._responses = {}  # 请求键 -> [(响应JSON字节, 录制耗时), ...]
+        self._cursors = {}  # 请求键 -> 下一次回放的序号
+        self._size = 0  # 数据文件中已索引的字节数
+        self._index_dirty = False
+        self._lock = threading.Lock()
+        self.stats = {"replayed": 0, "recorded": 0, "misses": 0}
+        
+        if os.path.exists(path):
+            self._load()
+    
+    def _load(self) -> None:
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != self.VERSION or index.get('size') != len(data):
+                raise ValueError
+            self._index = index['entries']
+            self._size = index['size']
+        except (OSError, ValueError, KeyError):
+            self._rebuild_index(data)
+        
+        for key, positions in self._index.items():
+            self._responses[key] = [(data[offset:offset + length], latency) for offset, length, latency in positions]
+    
+    def _rebuild_index(self, data: bytes) -> None:
+        self._index = {}
+        pos = 0
+        while pos < len(data):
+            end = data.find(b'\n', pos)
+            if end < 0:
+                # 末尾写了一半的记录（如进程被中断）直接丢弃
+                break
+            tab = data.find(b'\t', pos, end)
+            if tab >= 0:
+                try:
+                    meta = json.loads(data[pos:tab])
+                    self._index.setdefault(meta['key'], []).append([tab + 1, end - tab - 1, meta.get('latency', 0.0)])
+                except (ValueError, KeyError):
+                    pass
+            pos = end + 1
+        self._size = pos
+        self._index_dirty = True
+    
+    def normalize(self, messages: List[Dict[str, str]]) -> List[List[str]]:
+        """
+        归一化消息列表：只保留角色和内容，统一换行和Unicode形式，去掉每行末尾和首尾的空白，替换可变内容
+        
+        Args:
+            messages: 消息列表
+            
+        Returns:
+            List[List[str]]: [[角色, 内容], ...]
+        """
+        normalized = []
+        for message in messages:
+            content = message.get('content', '')
+            if not isinstance(content, str):
+                content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+            for pattern in self.ignore_patterns:
+                content = pattern.sub('<*>', content)
+            content = unicodedata.normalize('NFC', content.replace('\r\n', '\n'))
+            content = '\n'.join(line.rstrip() for line in content.split('\n')).strip()
+            normalized.append([message.get('role', ''), content])
+        return normalized
+    
+    def key(self, provider: str, model_type: str, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """计算请求键，生成参数不同的请求互不匹配"""
+        request = [provider, model_type, self.normalize(messages)] + ([options] if options else [])
+        request = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+    
+    def play(self, provider: str, model_type: str, messages: List[Dict[str, str]], call,
+             options: Dict[str, Any] = None) -> Dict:
+        """
+        回放或录制一次API调用
+        
+        Args:
+            provider: 提供商名称
+            model_type: AI模型型号
+            messages: 消息列表
+            call: 无参数的函数，真实调用API并返回响应
+            options: 请求的生成参数
+            
+        Returns:
+            Dict: API响应
+            
+        Raises:
+            AICallerAPIError: replay模式下没有匹配的录制
+        """
+        key = self.key(provider, model_type, messages, options)
+        if self.mode != 'record':
+            with self._lock:
+                recorded = self._responses.get(key)
+                if recorded:
+                    cursor = self._cursors.get(key, 0)
+                    self._cursors[key] = cursor + 1
+                    self.stats["replayed"] += 1
+                    content, latency = recorded[cursor % len(recorded)]
+                elif self.mode == 'replay':
+                    self.stats["misses"] += 1
+            if recorded:
+                if self.simulate_latency and latency > 0:
+                    time.sleep(latency * self.latency_scale)
+                return json.loads(content)
+            if self.mode == 'replay':
+                raise AICallerAPIError(f"磁带{self.path}中没有匹配的请求: {provider} {model_type}")
+        
+        start = time.perf_counter()
+        response = call()
+        self._record(key, provider, model_type, messages, options, response, time.perf_counter() - start)
+        return response
+    
+    def _record(self, key: str, provider: str, model_type: str, messages: List[Dict[str, str]],
+                options: Dict[str, Any], response: Dict, latency: float) -> None:
+        meta = json.dumps({"key": key, "provider": provider, "model": model_type, "messages": messages,
+                           "options": options or {}, "latency": round(latency, 6),
+                           "time": datetime.datetime.now().isoformat()}, ensure_ascii=False).encode('utf-8')
+        content = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        latency = round(latency, 6)
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                offset = f.tell() + len(meta) + 1
+                f.write(meta + b'\t' + content + b'\n')
+            self._index.setdefault(key, []).append([offset, len(content), latency])
+            self._responses.setdefault(key, []).append((content, latency))
+            self._size = offset + len(content) + 1
+            self._index_dirty = True
+            self.stats["recorded"] += 1
+    
+    def save_index(self) -> None:
+        """把索引写入.idx文件，录制结束后调用；没有保存索引时下次打开会扫描数据文件重建"""
+        with self._lock:
+            if not self._index_dirty:
+                return
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": self.VERSION, "size": self._size, "entries": self._index}, f)
+            os.replace(tmp_path, self.index_path)
+            self._index_dirty = False
+    
+    def close(self) -> None:
+        """保存索引"""
+        self.save_index()
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取磁带统计信息
+        
+        Returns:
+            Dict: 回放次数、录制次数、未命中次数和已录制的不同请求数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["requests"] = len(self._responses)
+        return stats
+
+
+class TransportResponse:
+    """
+    传输层返回的HTTP响应，提供各提供商用到的requests.Response接口（status_code、text、json()、raise_for_status()）
+    """
+    
+    def __init__(self, status_code: int, content: bytes, headers: Dict[str, str] = None, url: str = ''):
+        """
+        初始化响应
+        
+        Args:
+            status_code: HTTP状态码
+            content: 响应体
+            headers: 响应头
+            url: 请求地址
+        """
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.url = url
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+    
+    def json(self) -> Any:
+        return json.loads(self.content)
+    
+    def raise_for_status(self) -> None:
+        """状态码为4xx或5xx时抛出requests.HTTPError，与requests一致，各提供商的重试逻辑不需要区分传输层"""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class HTTPTransport:
+    """HTTP传输层接口，各提供商通过它发送请求，替换实现即可改变连接方式，或完全脱离网络运行"""
+    
+    def post(self, url: str, **kwargs) -> Union[requests.Response, TransportResponse]:
+        """
+        发送POST请求 (需要子类实现)
+        
+        Args:
+            url: 请求地址
+            **kwargs: 与requests.post相同的参数，如headers、json、params、timeout
+            
+        Returns:
+            requests.Response或TransportResponse: HTTP响应
+            
+        Raises:
+            requests.RequestException: 网络错误或超时
+        """
+        raise NotImplementedError("子类必须实现post方法")
+    
+    def close(self) -> None:
+        """释放连接等资源"""
+        pass
+
+
+class RequestsTransport(HTTPTransport):
+    """基于requests的传输层，pool_size大于0时通过会话和连接池复用到上游的TCP/TLS连接"""
+    
+    def __init__(self, pool_size: int = 0):
+        """
+        初始化传输层
+        
+        Args:
+            pool_size: 连接池中每个主机保持的最大连接数，0表示每次请求新建连接
+        """
+        self.session = None
+        if pool_size > 0:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.session = session
+    
+    def post(self, url: str, **kwargs) -> requests.Response:
+        if self.session is not None:
+            return self.session.post(url, **kwargs)
+        return requests.post(url, **kwargs)
+    
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+
+
+class HTTPXTransport(HTTPTransport):
+    """
+    基于httpx的传输层，启用HTTP/2时到同一主机的并发请求在一条连接上多路复用
+    
+    httpx是可选依赖，只在创建该传输层时导入（HTTP/2还需要h2: pip install 'httpx[http2]'）。
+    httpx的网络异常会转换为对应的requests异常，各提供商的重试逻辑保持不变。
+    """
+    
+    def __init__(self, http2: bool = True, pool_size: int = 20, timeout: float = 60.0):
+        """
+        初始化传输层
+        
+        Args:
+            http2: 是否启用HTTP/2
+            pool_size: 最大连接数
+            timeout: 请求未指定timeout时的默认超时秒数
+            
+        Raises:
+            AICallerConfigError: 未安装httpx或h2
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise AICallerConfigError("HTTPXTransport需要安装httpx: pip install 'httpx[http2]'")
+        self._httpx = httpx
+        try:
+            self.client = httpx.Client(http2=http2, timeout=timeout,
+                                       limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        except ImportError:
+            raise AICallerConfigError("启用HTTP/2需要安装h2: pip install 'httpx[http2]'")
+    
+    def post(self, url: str, **kwargs) -> TransportResponse:
+        options = {key: kwargs[key] for key in ('headers', 'json', 'params', 'timeout') if key in kwargs}
+        try:
+            response = self.client.post(url, **options)
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except self._httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        return TransportResponse(response.status_code, response.content, dict(response.headers), str(response.url))
+    
+    def close(self) -> None:
+        self.client.close()
+
+
+class FakeTransport(HTTPTransport):
+    """
+    内存中的假传输层，不建立任何连接，按请求地址对应的提供商格式返回预设的响应
+    
+    响应同样经过JSON序列化和解析，可用于离线测试，以及单独测量提示词格式化、JSON处理和输出解析等纯Python开销。
+    向量接口返回由文本哈希生成的EMBEDDING_DIM维向量。
+    """
+    
+    EMBEDDING_DIM = 8
+    
+    def __init__(self, reply: str = None, handler=None, latency: float = 0.0, max_records: int = 100):
+        """
+        初始化假传输层
+        
+        Args:
+            reply: 模型回复的文本，为None时原样返回最后一条消息的内容
+            handler: 可选的自定义响应函数，接收(url, 请求参数字典)，返回响应字典或(状态码, 响应字典)
+            latency: 每个请求模拟的延迟秒数
+            max_records: 保留最近请求的条数，供测试检查
+        """
+        self.reply = reply
+        self.handler = handler
+        self.latency = latency
+        self.requests = deque(maxlen=max_records)
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def post(self, url: str, **kwargs) -> TransportResponse:
+        with self._lock:
+            self.count += 1
+            self.requests.append((url, kwargs))
+        if self.latency:
+            time.sleep(self.latency)
+        
+        status_code = 200
+        if self.handler is not None:
+            result = self.handler(url, kwargs)
+            payload = result[1] if isinstance(result, tuple) else result
+            status_code = result[0] if isinstance(result, tuple) else 200
+        else:
+            payload = self._default_payload(url, kwargs.get('json') or {})
+        content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        return TransportResponse(status_code, content, {"Content-Type": "application/json"}, url)
+    
+    def _default_payload(self, url: str, payload: Dict) -> Dict:
+        # 按请求地址返回对应提供商格式的响应
+        if 'oauth' in url:
+            return {"access_token": "fake-access-token", "expires_in": 2592000}
+        if 'embedding' in url:
+            return self._embedding_payload(url, payload)
+        messages = payload.get('messages') or (payload.get('input') or {}).get('messages') or []
+        content = self.reply if self.reply is not None else (messages[-1]['content'] if messages else '')
+        prompt_tokens = sum(len(message['content']) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if 'dashscope' in url:
+            return {
+                "output": {"choices": [{"finish_reason": "stop", "message": {"role": "assistant", "content": content}}]},
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}
+            }
+        if 'baidubce' in url:
+            return {"id": "as-fake", "result": content, "usage": usage}
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": payload.get('model', ''),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+    
+    def _embedding_payload(self, url: str, payload: Dict) -> Dict:
+        # 向量由文本的哈希生成，同一文本总是得到相同的向量
+        texts = payload['input']['texts'] if isinstance(payload.get('input'), dict) else payload.get('input') or []
+        vectors = [[byte / 255 for byte in hashlib.sha256(text.encode('utf-8')).digest()[:self.EMBEDDING_DIM]]
+                   for text in texts]
+        tokens = sum(len(text) for text in texts) // 4
+        if 'dashscope' in url:
+            return {"output": {"embeddings": [{"text_index": index, "embedding": vector}
+                                              for index, vector in enumerate(vectors)]},
+                    "usage": {"total_tokens": tokens}}
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": index, "embedding": vector} for index, vector in enumerate(vectors)],
+            "model": payload.get('model', ''),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+
+def create_transport(options: Dict = None) -> HTTPTransport:
+    """
+    按配置创建传输层
+    
+    Args:
+        options: 配置文件中的transport字段，type为'requests'（默认）、'pooled'、'httpx'或'fake'
+        
+    Returns:
+        HTTPTransport: 传输层实例
+        
+    Raises:
+        AICallerConfigError: 未知的传输层类型
+    """
+    options = options or {}
+    transport_type = options.get('type', 'requests')
+    if transport_type == 'requests':
+        return RequestsTransport()
+    if transport_type == 'pooled':
+        return RequestsTransport(pool_size=options.get('pool_size', 10))
+    if transport_type == 'httpx':
+        return HTTPXTransport(http2=options.get('http2', True), pool_size=options.get('pool_size', 20),
+                              timeout=options.get('timeout', 60.0))
+    if transport_type == 'fake':
+        return FakeTransport(reply=options.get('reply'), latency=options.get('latency', 0.0))
+    raise AICallerConfigError(f"未知的传输层类型: {transport_type}，仅支持requests、pooled、httpx或fake")
+
+
+# 当前上下文中API调用的调度属性（优先级、调用方、代价），由request_context设置
+_request_context = contextvars.ContextVar('ai_caller_request_context', default=None)
+
+
+@contextlib.contextmanager
+def request_context(priority: str = 'normal', caller: str = 'default', cost: float = 1.0):
+    """
+    设置上下文中API调用的调度属性，作用于其中经过调度器的所有请求（包括invoke_chunked的各个块）
+    
+    Args:
+        priority: 优先级类别，'high'、'normal'或'low'
+        caller: 调用方标识，同一优先级内按调用方的权重公平分配名额
+        cost: 每个请求在公平队列中的代价，可按预估Token数设置
+        
+    Raises:
+        AICallerInputError: 无效的优先级
+    """
+    if priority not in RequestScheduler.PRIORITIES:
+        raise AICallerInputError(f"无效的优先级: {priority}，仅支持{'、'.join(RequestScheduler.PRIORITIES)}")
+    token = _request_context.set({"priority": priority, "caller": caller, "cost": cost})
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+class RequestScheduler:
+    """
+    请求调度器，位于invoke与_make_api_call之间，限制每个提供商同时进行的请求数并决定排队请求的放行顺序
+    
+    不同优先级之间严格按优先级放行：有名额空出时，排队中的高优先级请求总是先于低优先级请求，
+    批量任务只能使用交互请求剩下的名额。同一优先级内按调用方加权公平排队（WFQ）：
+    请求的虚拟开始时间为max(当前虚拟时间, 该调用方上一个请求的虚拟完成时间)，
+    虚拟完成时间为开始时间加上代价/权重，完成时间最小的先放行。
+    """
+    
+    PRIORITIES = ('high', 'normal', 'low')
+    
+    def __init__(self, max_in_flight: Union[int, Dict[str, int]] = 8, weights: Dict[str, float] = None,
+                 history_size: int = 1000):
+        """
+        初始化调度器
+        
+        Args:
+            max_in_flight: 每个提供商同时进行的最大请求数，可以是整数，或以提供商名称为键的字典（'default'为其余提供商的上限）
+            weights: 调用方的权重，未列出的调用方权重为1
+            history_size: 每个提供商、每个优先级保留的排队等待时间样本数，用于计算分位数
+        """
+        if isinstance(max_in_flight, dict):
+            self.limits = dict(max_in_flight)
+            self.default_limit = self.limits.pop('default', 8)
+        else:
+            self.limits = {}
+            self.default_limit = max_in_flight
+        self.weights = dict(weights or {})
+        self.history_size = history_size
+        
+        self._lock = threading.Lock()
+        self._providers = {}  # 提供商名称 -> 排队与统计状态
+        self._sequence = 0
+    
+    def _state(self, provider: str) -> Dict:
+        state = self._providers.get(provider)
+        if state is None:
+            state = {
+                "in_flight": 0,
+                "queues": {priority: [] for priority in self.PRIORITIES},  # 堆: (完成时间, 序号, 开始时间, 等待者)
+                "virtual_time": {priority: 0.0 for priority in self.PRIORITIES},
+                "finish": {priority: {} for priority in self.PRIORITIES},  # 调用方 -> 上一个请求的虚拟完成时间
+                "stats": {priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0,
+                                     "waits": deque(maxlen=self.history_size)} for priority in self.PRIORITIES}
+            }
+            self._providers[provider] = state
+        return state
+    
+    def _dispatch(self, provider: str, state: Dict) -> None:
+        # 在持有锁时调用：按优先级和虚拟完成时间放行排队的请求，直到名额用完
+        limit = self.limits.get(provider, self.default_limit)
+        while state["in_flight"] < limit:
+            priority = next((p for p in self.PRIORITIES if state["queues"][p]), None)
+            if priority is None:
+                return
+            queue = state["queues"][priority]
+            _, _, start, waiter = heapq.heappop(queue)
+            state["virtual_time"][priority] = max(state["virtual_time"][priority], start)
+            if not queue:
+                # 该优先级空闲后重新开始计算虚拟时间
+                state["virtual_time"][priority] = 0.0
+                state["finish"][priority].clear()
+            state["in_flight"] += 1
+            waiter.set()
+    
+    def acquire(self, provider: str, priority: str = 'normal', caller: str = 'default', cost: float = 1.0) -> float:
+        """
+        为一次API调用申请名额，没有空闲名额时阻塞排队
+        
+        Args:
+            provider: 提供商名称
+            priority: 优先级类别
+            caller: 调用方标识
+            cost: 请求在公平队列中的代价
+            
+        Returns:
+            float: 排队等待的秒数
+        """
+        waiter = threading.Event()
+        enqueued = time.monotonic()
+        with self._lock:
+            state = self._state(provider)
+            start = max(state["virtual_time"][priority], state["finish"][priority].get(caller, 0.0))
+            finish = start + cost / self.weights.get(caller, 1.0)
+            state["finish"][priority][caller] = finish
+            self._sequence += 1
+            heapq.heappush(state["queues"][priority], (finish, self._sequence, start, waiter))
+            self._dispatch(provider, state)
+        waiter.wait()
+        
+        wait = time.monotonic() - enqueued
+        with self._lock:
+            stats = self._providers[provider]["stats"][priority]
+            stats["requests"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            stats["waits"].append(wait)
+        return wait
+    
+    def release(self, provider: str) -> None:
+        """API调用结束后归还名额，并放行下一个排队的请求"""
+        with self._lock:
+            state = self._providers[provider]
+            state["in_flight"] -= 1
+            self._dispatch(provider, state)
+    
+    @contextlib.contextmanager
+    def slot(self, provider: str, priority: str = 'normal', caller: str = 'default', cost: float = 1.0):
+        """申请名额的上下文管理器，退出时自动归还"""
+        self.acquire(provider, priority, caller, cost)
+        try:
+            yield
+        finally:
+            self.release(provider)
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        获取调度统计信息
+        
+        Returns:
+            Dict: 以提供商名称为键，包含上限、进行中的请求数，以及每个优先级的排队数、请求数和排队等待时间
+                  （平均、最大、P50、P95，单位为秒）
+        """
+        result = {}
+        with self._lock:
+            for provider, state in self._providers.items():
+                priorities = {}
+                for priority in self.PRIORITIES:
+                    stats = state["stats"][priority]
+                    waits = sorted(stats["waits"])
+                    priorities[priority] = {
+                        "queued": len(state["queues"][priority]),
+                        "requests": stats["requests"],
+                        "avg_wait": stats["total_wait"] / stats["requests"] if stats["requests"] else 0.0,
+                        "max_wait": stats["max_wait"],
+                        "p50_wait": waits[int(0.50 * (len(waits) - 1))] if waits else 0.0,
+                        "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0
+                    }
+                result[provider] = {
+                    "limit": self.limits.get(provider, self.default_limit),
+                    "in_flight": state["in_flight"],
+                    "priorities": priorities
+                }
+        return result
 
 
 class BaseProvider:
     """AI模型提供商的基类，定义通用接口和共享功能"""
     
+    provider_name = None  # 配置文件中使用的提供商名称，用于调度器按提供商限制并发
+    embedding_url = None  # 向量接口地址，为None表示提供商不提供向量接口
+    embedding_model = None  # 默认的向量模型
+    embedding_batch_size = 1  # 向量接口单次请求最多包含的文本条数
+    embedding_batch_tokens = None  # 向量接口单次请求的Token上限，为None表示不限制
+    chat_options = {}  # _make_api_call支持的生成参数：OpenAI兼容的参数名 -> 提供商接口中的参数名
+    
     def __init__(self, config_manager: ConfigManager = None):
         """
         初始化基类
@@ -150,7 +1103,80 @@ class BaseProvider:
         self.dialogue_id = None  # 当前对话的唯一ID
         self.dialogue_history = []  # 对话历史记录，用于连续对话模式
         self.dialogue_file_path = None  # 当前对话的历史记录文件路径
+        self.last_usage = None  # 最近一次调用的token使用统计（含缓存命中Token数）
+        self.response_cache = None  # 可选的近似重复响应缓存，仅对标记为cache_reuse的提示词生效
+        self.transport = RequestsTransport()  # HTTP传输层，可替换为连接池、HTTP/2或内存中的假实现
+        self.scheduler = None  # 可选的请求调度器，启用后按优先级和调用方排队并限制同时进行的请求数
+        self.embedding_cache = EmbeddingCache()  # 向量缓存，通过AICaller创建时由各提供商共享
+        self.cassette = None  # 可选的录制/回放磁带，启用后按归一化的请求录制或回放API响应
+        
+    def use_connection_pool(self, pool_size: int = 10) -> None:
+        """
+        启用HTTP连接池，后续API调用复用到上游的TCP/TLS连接，适合高并发场景
+        
+        Args:
+            pool_size: 连接池中每个主机保持的最大连接数
+        """
+        self.transport = RequestsTransport(pool_size)
+    
+    def _http_post(self, url: str, **kwargs) -> Union[requests.Response, TransportResponse]:
+        """
+        通过传输层发送POST请求
+        
+        Args:
+            url: 请求地址
+            **kwargs: 透传给传输层的参数，如headers、json、params、timeout
+            
+        Returns:
+            requests.Response或TransportResponse: HTTP响应
+        """
+        return self.transport.post(url, **kwargs)
+    
+    def _call_api(self, model_type: str, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Dict:
+        """
+        调用_make_api_call，启用调度器时先按当前上下文的优先级和调用方排队申请名额，启用磁带时录制或回放响应
+        
+        Args:
+            model_type: AI模型型号
+            messages: 消息列表
+            options: 可选的生成参数，使用OpenAI兼容的参数名
+            
+        Returns:
+            Dict: API响应
+            
+        Raises:
+            AICallerInputError: 提供商不支持options中的参数
+        """
+        # 没有生成参数时按原来的签名调用，兼容只实现了(model_type, messages)的自定义提供商
+        call = (lambda: self._make_api_call(model_type, messages, options=options)) if options else \
+            (lambda: self._make_api_call(model_type, messages))
+        with self._scheduled():
+            if self.cassette is None:
+                return call()
+            return self.cassette.play(self.provider_name or type(self).__name__, model_type, messages, call, options)
+    
+    def _chat_parameters(self, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        把OpenAI兼容的生成参数转换为提供商接口中的参数名
         
+        Raises:
+            AICallerInputError: 提供商不支持其中的参数
+        """
+        if not options:
+            return {}
+        unsupported = sorted(set(options) - set(self.chat_options))
+        if unsupported:
+            raise AICallerInputError(f"{type(self).__name__}不支持参数: {', '.join(unsupported)}")
+        return {self.chat_options[name]: value for name, value in options.items()}
+    
+    def _scheduled(self):
+        """启用调度器时按当前上下文的优先级和调用方申请名额的上下文管理器，否则不做任何事"""
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        context = _request_context.get() or {}
+        return self.scheduler.slot(self.provider_name or type(self).__name__, context.get('priority', 'normal'),
+                                   context.get('caller', 'default'), context.get('cost', 1.0))
+    
     def _format_prompt(self, prompt_id: str, data: Union[str, List, Dict]) -> str:
         """
         根据提示词ID和数据，格式化完整的提示词
@@ -233,6 +1259,141 @@ class BaseProvider:
         # 默认返回原始文本
         return output_content
     
+    def _estimate_tokens(self, text: str) -> int:
+        """
+        粗略估算文本的Token数，用于分块时控制每块大小
+        
+        中日韩字符按每字1个Token计算，其余字符按每4个字符1个Token计算
+        
+        Args:
+            text: 需要估算的文本
+            
+        Returns:
+            int: 估算的Token数
+        """
+        cjk_count = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af' or '\uff00' <= ch <= '\uffef')
+        return cjk_count + (len(text) - cjk_count + 3) // 4
+    
+    def _split_into_chunks(self, prompt_id: str, data: Union[List, Dict], max_chunk_tokens: int) -> List[Union[List, Dict]]:
+        """
+        按Token上限将列表或字典切分为多个块，保持原有顺序
+        
+        Args:
+            prompt_id: 提示词ID，模板本身占用的Token会从上限中扣除
+            data: 需要切分的列表或字典
+            max_chunk_tokens: 每个块（含模板）允许的最大Token数
+            
+        Returns:
+            List: 切分后的块列表，类型与输入一致；单个元素超过上限时独占一块
+        """
+        template_tokens = self._estimate_tokens(self.config_manager.get_prompt_template(prompt_id).replace('{data}', ''))
+        budget = max(max_chunk_tokens - template_tokens, 1)
+        
+        items = list(data.items()) if isinstance(data, dict) else list(data)
+        chunks = []
+        current = []
+        current_tokens = 0
+        
+        for item in items:
+            # 每个元素按其JSON序列化后的长度估算，额外加1计入分隔符
+            item_tokens = self._estimate_tokens(json.dumps(item, ensure_ascii=False)) + 1
+            if current and current_tokens + item_tokens > budget:
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += item_tokens
+        
+        if current:
+            chunks.append(current)
+        
+        if isinstance(data, dict):
+            return [dict(chunk) for chunk in chunks]
+        return chunks
+    
+    def invoke_chunked(self, model_type: str, prompt_id: str, data: Union[str, List, Dict], max_chunk_tokens: int = 2000,
+                       max_workers: int = 4, max_retries: int = 2, prefix_cache: bool = False) -> Tuple[Union[str, List, Dict], str, int]:
+        """
+        分块并行调用：将超大的列表或字典按Token上限切分，并行调用模型后按输入顺序合并结果
+        
+        每个块以'single_response'模式独立调用，若某个块调用失败、返回类型与输入不一致、列表的条数不同或字典的键不同，
+        只重试该块本身，其余块的结果保持不变，保证合并后的结果与输入逐项对应。字符串输入不做切分，直接调用invoke。
+        
+        Args:
+            model_type: AI模型型号
+            prompt_id: 提示词ID
+            data: 需要处理的数据，列表或字典会被切分
+            max_chunk_tokens: 每个块（含模板）允许的最大Token数
+            max_workers: 并行调用的最大线程数
+            max_retries: 每个块失败后的最大重试次数
+            prefix_cache: 是否使用前缀缓存友好的消息布局，各块共享同一模板前缀时收益明显
+            
+        Returns:
+            Tuple: (合并后的数据, 调用ID, 所有块消耗的Token总数)
+            
+        Raises:
+            AICallerAPIError: 某个块在重试后仍然失败
+        """
+        if isinstance(data, str):
+            return self.invoke(model_type, prompt_id, 'single_response', data, prefix_cache=prefix_cache)
+        if not isinstance(data, (list, dict)):
+            raise AICallerInputError(f"不支持的数据类型: {type(data)}，仅支持字符串、列表或字典")
+        
+        chunks = self._split_into_chunks(prompt_id, data, max_chunk_tokens)
+        request = _request_context.get()
+        
+        def run_chunk(index: int) -> Tuple[Union[List, Dict], int]:
+            # 线程池中的线程不继承调用方上下文中的调度属性
+            _request_context.set(request)
+            chunk = chunks[index]
+            tokens_spent = 0
+            last_error = None
+            for attempt in range(max_retries + 1):
+                try:
+                    output, _, tokens_used = self.invoke(model_type, prompt_id, 'single_response', chunk, prefix_cache=prefix_cache)
+                    # 部分提供商返回token统计字典，统一取总数
+                    tokens_spent += tokens_used.get('total_tokens', 0) if isinstance(tokens_used, dict) else tokens_used
+                    last_error = self._chunk_mismatch(chunk, output)
+                    if last_error is None:
+                        return output, tokens_spent
+                except (AICallerAPIError, KeyError) as e:
+                    last_error = str(e)
+                if attempt < max_retries:
+                    print(f"第{index + 1}/{len(chunks)}块处理失败，正在进行第{attempt + 1}次重试...")
+            raise AICallerAPIError(f"第{index + 1}/{len(chunks)}块在重试{max_retries}次后仍然失败: {last_error}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            results = list(executor.map(run_chunk, range(len(chunks))))
+        
+        # 按输入顺序合并各块结果
+        total_tokens = sum(tokens for _, tokens in results)
+        if isinstance(data, dict):
+            merged = {}
+            for output, _ in results:
+                merged.update(output)
+        else:
+            merged = []
+            for output, _ in results:
+                merged.extend(output)
+        
+        return merged, str(uuid.uuid4()), total_tokens
+    
+    @staticmethod
+    def _chunk_mismatch(chunk: Union[List, Dict], output: Any) -> Union[str, None]:
+        """检查一个块的输出能否与输入逐项对应，不能时返回原因"""
+        if not isinstance(output, type(chunk)):
+            return f"返回类型{type(output).__name__}与输入类型{type(chunk).__name__}不一致"
+        if isinstance(chunk, list) and len(output) != len(chunk):
+            return f"返回{len(output)}项，输入为{len(chunk)}项"
+        # 非字符串的键经过JSON往返后会变成字符串，按字符串比较
+        if isinstance(chunk, dict) and {str(key) for key in output} != {str(key) for key in chunk}:
+            output_keys = {str(key) for key in output}
+            chunk_keys = {str(key) for key in chunk}
+            missing = [key for key in chunk_keys if key not in output_keys]
+            extra = [key for key in output_keys if key not in chunk_keys]
+            return f"返回的键与输入不一致，缺少{missing[:5]}，多出{extra[:5]}"
+        return None
+    
     def _init_dialogue(self, prompt_id: str) -> None:
         """
         初始化一个新的对话，设置唯一ID和创建历史记录文件
@@ -303,9 +1464,169 @@ class BaseProvider:
         self.dialogue_history = []
         self.dialogue_file_path = None
         
-        print("对话已结束")
+        print("对话已结束")
+    
+    def _build_prefix_messages(self, prompt_id: str, data: Union[str, List, Dict]) -> List[Dict[str, str]]:
+        """
+        构建对前缀缓存友好的消息：模板作为固定的system消息，数据单独作为user消息
+        
+        模板中的{data}占位符被替换为固定说明文字，保证不同数据下system消息完全一致，
+        从而成为可被提供商缓存的稳定前缀（如DeepSeek上下文缓存、OpenAI缓存输入Token）
+        
+        Args:
+            prompt_id: 提示词模板ID
+            data: 需要处理的数据
+            
+        Returns:
+            List[Dict[str, str]]: [system消息, user消息]
+            
+        Raises:
+            AICallerInputError: 数据格式不支持
+        """
+        prompt_template = self.config_manager.get_prompt_template(prompt_id)
+        system_content = prompt_template.replace('{data}', '（待处理的数据见下一条消息）')
+        
+        if isinstance(data, str):
+            user_content = data
+        elif isinstance(data, (list, dict)):
+            user_content = json.dumps(data, ensure_ascii=False)
+        else:
+            raise AICallerInputError(f"不支持的数据类型: {type(data)}，仅支持字符串、列表或字典")
+        
+        return [{"role": "system", "content": system_content}, {"role": "user", "content": user_content}]
+    
+    def _extract_output_content(self, response: Dict) -> str:
+        """从OpenAI兼容格式的API响应中提取模型输出文本，格式不同的提供商需重写"""
+        return response['choices'][0]['message']['content']
+    
+    def _extract_usage(self, response: Dict) -> Dict[str, int]:
+        """
+        从API响应中提取token使用统计，包括提供商前缀缓存命中的Token数
+        
+        缓存命中字段因提供商而异：
+        - OpenAI / 智谱AI / 阿里千问: usage.prompt_tokens_details.cached_tokens
+        - DeepSeek: usage.prompt_cache_hit_tokens
+        
+        Args:
+            response: API响应
+            
+        Returns:
+            Dict[str, int]: 包含prompt_tokens、completion_tokens、total_tokens、cached_tokens的字典
+        """
+        usage = response.get('usage') or {}
+        # 阿里千问原生接口使用input_tokens/output_tokens命名
+        prompt_tokens = usage.get('prompt_tokens', usage.get('input_tokens', 0))
+        completion_tokens = usage.get('completion_tokens', usage.get('output_tokens', 0))
+        
+        details = usage.get('prompt_tokens_details') or {}
+        cached_tokens = usage.get('prompt_cache_hit_tokens', details.get('cached_tokens', 0))
+        
+        return {
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "total_tokens": usage.get('total_tokens', (prompt_tokens or 0) + (completion_tokens or 0)),
+            "cached_tokens": cached_tokens or 0
+        }
+    
+    def _invoke_chat(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+                     prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
+        """
+        各提供商invoke方法共用的调用流程
+        
+        Args:
+            model_type: AI模型型号
+            prompt_id: 提示词ID
+            call_mode: 调用模式，'single_response'或'continuous_dialogue'
+            data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否使用前缀缓存友好的消息布局
+            detailed_usage: 是否返回token使用统计字典
+            
+        Returns:
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
+            
+        Raises:
+            AICallerInputError: 无效的调用模式
+            AICallerAPIError: API调用失败
+        """
+        # 验证调用模式
+        if call_mode not in ['single_response', 'continuous_dialogue']:
+            raise AICallerInputError(f"无效的调用模式: {call_mode}，仅支持'single_response'或'continuous_dialogue'")
+        
+        # 格式化提示词
+        if prefix_cache:
+            system_message, user_message = self._build_prefix_messages(prompt_id, data)
+        else:
+            system_message, user_message = None, {"role": "user", "content": self._format_prompt(prompt_id, data)}
+        
+        # 根据调用模式处理请求
+        if call_mode == 'single_response':
+            # 单次响应模式
+            messages = [system_message, user_message] if system_message else [user_message]
+            
+            # 查询近似缓存，命中且未被抽中审计时直接返回缓存的响应
+            cache_hit = None
+            use_cache = self.response_cache is not None and self.config_manager.is_prompt_reusable(prompt_id)
+            if use_cache:
+                cache_namespace = f"{type(self).__name__}:{model_type}:{prompt_id}"
+                structured = not isinstance(data, str)
+                cache_text = json.dumps(data, ensure_ascii=False, sort_keys=True) if structured else data
+                cache_hit = self.response_cache.lookup(cache_namespace, cache_text, structured)
+                if cache_hit is not None and not cache_hit['audit']:
+                    self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+                    tokens_used = self.last_usage if detailed_usage else 0
+                    return self._get_output_with_matching_type(cache_hit['content'], data), str(uuid.uuid4()), tokens_used
+            
+            # 调用API
+            response = self._call_api(model_type, messages)
+            
+            # 提取响应内容
+            output_content = self._extract_output_content(response)
+            
+            if use_cache:
+                if cache_hit is not None:
+                    self.response_cache.record_audit(cache_hit, output_content)
+                else:
+                    self.response_cache.store(cache_namespace, cache_text, output_content, structured)
+            
+            # 生成唯一ID用于此次调用
+            dialogue_id = str(uuid.uuid4())
+            
+        else:  # continuous_dialogue模式
+            # 如果是新对话，初始化对话状态
+            if not self.dialogue_id:
+                self._init_dialogue(prompt_id)
+                # 前缀缓存模式下，模板只在对话开头作为system消息出现一次
+                if system_message:
+                    self.dialogue_history.append(system_message)
+                    self._update_dialogue_history('system', system_message['content'])
+            
+            # 更新对话历史(用户输入)
+            self.dialogue_history.append(user_message)
+            self._update_dialogue_history('user', user_message['content'])
+            
+            # 调用API
+            response = self._call_api(model_type, self.dialogue_history)
+            
+            # 提取响应内容
+            output_content = self._extract_output_content(response)
+            
+            # 更新对话历史(AI响应)
+            self.dialogue_history.append({"role": "assistant", "content": output_content})
+            self._update_dialogue_history('assistant', output_content)
+            
+            dialogue_id = self.dialogue_id
+        
+        # 提取Token使用信息
+        self.last_usage = self._extract_usage(response)
+        tokens_used = self.last_usage if detailed_usage else self.last_usage['total_tokens']
+        
+        # 根据输入类型处理输出
+        processed_output = self._get_output_with_matching_type(output_content, data)
+        
+        return processed_output, dialogue_id, tokens_used
     
-    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict]) -> Tuple[Union[str, List, Dict], str, int]:
+    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+               prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
         """
         调用AI模型处理数据 (需要子类实现)
         
@@ -314,19 +1635,161 @@ class BaseProvider:
             prompt_id: 提示词ID
             call_mode: 调用模式，'single_response'或'continuous_dialogue'
             data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否将提示词模板作为固定的system消息发送，以命中提供商的前缀缓存
+            detailed_usage: 是否返回包含缓存命中Token数的token使用统计字典
             
         Returns:
-            Tuple: (处理后的数据, 对话ID, 消耗的Token数)
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
             
         Raises:
             NotImplementedError: 此方法需要由子类实现
         """
         raise NotImplementedError("子类必须实现invoke方法")
+    
+    def _build_embedding_payload(self, model: str, texts: List[str]) -> Dict:
+        """构建OpenAI兼容格式的向量请求体，格式不同的提供商需重写"""
+        return {"model": model, "input": texts}
+    
+    def _extract_embeddings(self, response: Dict) -> List[List[float]]:
+        """从OpenAI兼容格式的向量响应中按输入顺序提取向量，格式不同的提供商需重写"""
+        return [item['embedding'] for item in sorted(response['data'], key=lambda item: item['index'])]
+    
+    def _make_embedding_call(self, model: str, texts: List[str], max_retries: int = 3) -> List[List[float]]:
+        """
+        调用向量接口
+        
+        Args:
+            model: 向量模型
+            texts: 一个批次的文本列表
+            max_retries: 最大重试次数
+            
+        Returns:
+            List[List[float]]: 与texts顺序一致的向量列表
+            
+        Raises:
+            AICallerAPIError: API调用失败或响应格式错误
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        payload = self._build_embedding_payload(model, texts)
+        
+        retries = 0
+        while True:
+            try:
+                response = self._http_post(self.embedding_url, headers=headers, json=payload, timeout=60)
+                response.raise_for_status()
+                vectors = self._extract_embeddings(response.json())
+                break
+            except requests.RequestException as e:
+                retries += 1
+                status_code = e.response.status_code if getattr(e, 'response', None) is not None else None
+                # 速率限制、服务端错误和网络错误重试，其他4xx错误直接放弃
+                if retries > max_retries or (status_code is not None and status_code != 429 and status_code < 500):
+                    error_message = f"HTTP错误 {status_code}: {e.response.text}" if status_code is not None else str(e)
+                    raise AICallerAPIError(f"{type(self).__name__}向量接口调用失败: {error_message}")
+                wait_time = 2 ** retries
+                print(f"向量接口调用失败，等待{wait_time}秒后重试...")
+                time.sleep(wait_time)
+            except (KeyError, TypeError, ValueError) as e:
+                raise AICallerAPIError(f"{type(self).__name__}向量接口响应格式错误: {str(e)}")
+        
+        if len(vectors) != len(texts):
+            raise AICallerAPIError(f"向量接口返回了{len(vectors)}条向量，请求了{len(texts)}条")
+        return vectors
+    
+    def _split_embedding_batches(self, texts: List[str], batch_size: int) -> List[List[str]]:
+        # 按条数上限分批，提供商限制单次请求的总Token数时同时按估算的Token数分批
+        batches = []
+        current = []
+        current_tokens = 0
+        for text in texts:
+            tokens = self._estimate_tokens(text) if self.embedding_batch_tokens else 0
+            if current and (len(current) >= batch_size or
+                            (self.embedding_batch_tokens and current_tokens + tokens > self.embedding_batch_tokens)):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def embed(self, texts: List[str], model: str = None, max_workers: int = 4, batch_size: int = None):
+        """
+        批量获取文本向量
+        
+        按提供商单次请求的上限自动分批，多个批次并行请求。向量以(提供商, 模型, 文本)的哈希缓存，
+        输入中重复的文本和已缓存的文本都不会再次请求。需要安装numpy。
+        
+        Args:
+            texts: 非空字符串组成的列表
+            model: 向量模型，为None时使用提供商的默认向量模型
+            max_workers: 并行请求的最大线程数
+            batch_size: 每个请求的文本条数，为None时使用提供商的上限
+            
+        Returns:
+            numpy.ndarray: 形状为(len(texts), 向量维度)的连续float32矩阵，行顺序与输入一致
+            
+        Raises:
+            AICallerInputError: 提供商不支持向量接口，或输入不是非空字符串列表
+            AICallerConfigError: 未安装numpy
+            AICallerAPIError: API调用失败
+        """
+        if self.embedding_url is None:
+            raise AICallerInputError(f"{type(self).__name__}不支持向量接口")
+        try:
+            import numpy
+        except ImportError:
+            raise AICallerConfigError("embed需要安装numpy: pip install numpy")
+        if not isinstance(texts, list) or not all(isinstance(text, str) and text for text in texts):
+            raise AICallerInputError("texts必须是非空字符串组成的列表")
+        if not texts:
+            return numpy.zeros((0, 0), dtype=numpy.float32)
+        
+        model = model or self.embedding_model
+        namespace = f"{self.provider_name or type(self).__name__}:{model}"
+        
+        # 去重后查询缓存，只请求缺失的文本
+        unique = list(dict.fromkeys(texts))
+        vectors = dict(zip(unique, self.embedding_cache.get_many([EmbeddingCache.key(namespace, text) for text in unique])))
+        missing = [text for text in unique if vectors[text] is None]
+        batches = self._split_embedding_batches(missing, batch_size or self.embedding_batch_size)
+        request = _request_context.get()
+        
+        def run_batch(batch: List[str]) -> List[List[float]]:
+            # 线程池中的线程不继承调用方上下文中的调度属性
+            _request_context.set(request)
+            with self._scheduled():
+                return self._make_embedding_call(model, batch)
+        
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+                for batch, result in zip(batches, executor.map(run_batch, batches)):
+                    encoded = [numpy.asarray(vector, dtype=numpy.float32).tobytes() for vector in result]
+                    vectors.update(zip(batch, encoded))
+                    self.embedding_cache.put_many([EmbeddingCache.key(namespace, text) for text in batch], encoded)
+        
+        row_size = len(vectors[texts[0]])
+        if any(len(vector) != row_size for vector in vectors.values()):
+            raise AICallerAPIError("向量接口返回的向量维度不一致")
+        # 按输入顺序拼接为一块连续内存，直接作为矩阵的缓冲区
+        buffer = bytearray().join(vectors[text] for text in texts)
+        return numpy.frombuffer(buffer, dtype=numpy.float32).reshape(len(texts), row_size // 4)
 
 
 class OpenAIProvider(BaseProvider):
     """OpenAI模型提供商的实现类"""
     
+    provider_name = 'openai'
+    chat_options = {name: name for name in ('temperature', 'top_p', 'max_tokens', 'stop', 'presence_penalty', 'frequency_penalty', 'seed')}
+    embedding_url = "https://api.openai.com/v1/embeddings"
+    embedding_model = 'text-embedding-3-small'
+    embedding_batch_size = 2048
+    embedding_batch_tokens = 300000
+    
     def __init__(self, config_manager: ConfigManager = None):
         """初始化OpenAI提供商"""
         super().__init__(config_manager)
@@ -336,7 +1799,8 @@ class OpenAIProvider(BaseProvider):
         except AICallerConfigError as e:
             raise AICallerConfigError(f"OpenAI初始化失败: {str(e)}")
     
-    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3) -> Dict:
+    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3,
+                       options: Dict[str, Any] = None) -> Dict:
         """
         调用OpenAI API
         
@@ -344,6 +1808,7 @@ class OpenAIProvider(BaseProvider):
             model_type: OpenAI模型型号，如'gpt-4o'
             messages: 消息列表
             max_retries: 最大重试次数
+            options: 可选的生成参数，使用OpenAI兼容的参数名，如temperature、max_tokens
             
         Returns:
             Dict: API响应
@@ -360,12 +1825,13 @@ class OpenAIProvider(BaseProvider):
             "model": model_type,
             "messages": messages
         }
+        payload.update(self._chat_parameters(options))
         
         retries = 0
         
         while retries <= max_retries:
             try:
-                response = requests.post(url, headers=headers, json=payload)
+                response = self._http_post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 return response.json()
             
@@ -394,7 +1860,8 @@ class OpenAIProvider(BaseProvider):
                     time.sleep(wait_time)
                     continue
     
-    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict]) -> Tuple[Union[str, List, Dict], str, int]:
+    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+               prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
         """
         调用OpenAI模型处理数据
         
@@ -403,74 +1870,28 @@ class OpenAIProvider(BaseProvider):
             prompt_id: 提示词ID
             call_mode: 调用模式，'single_response'或'continuous_dialogue' 
             data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否将提示词模板作为固定的system消息发送，数据放在其后的user消息中，以命中提供商的前缀缓存
+            detailed_usage: 是否返回包含缓存命中Token数的token使用统计字典，而不是总Token数
             
         Returns:
-            Tuple: (处理后的数据, 对话ID, 消耗的Token数)
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
             
         Raises:
             AICallerInputError: 无效的调用模式
             AICallerAPIError: API调用失败
         """
-        # 验证调用模式
-        if call_mode not in ['single_response', 'continuous_dialogue']:
-            raise AICallerInputError(f"无效的调用模式: {call_mode}，仅支持'single_response'或'continuous_dialogue'")
-            
-        # 格式化提示词
-        formatted_prompt = self._format_prompt(prompt_id, data)
-        
-        # 根据调用模式处理请求
-        if call_mode == 'single_response':
-            # 单次响应模式
-            messages = [{"role": "user", "content": formatted_prompt}]
-            
-            # 调用API
-            response = self._make_api_call(model_type, messages)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 生成唯一ID用于此次调用
-            call_id = str(uuid.uuid4())
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, call_id, tokens_used
-            
-        else:  # continuous_dialogue模式
-            # 如果是新对话，初始化对话状态
-            if not self.dialogue_id:
-                self._init_dialogue(prompt_id)
-            
-            # 更新对话历史(用户输入)
-            self.dialogue_history.append({"role": "user", "content": formatted_prompt})
-            self._update_dialogue_history('user', formatted_prompt)
-            
-            # 调用API
-            response = self._make_api_call(model_type, self.dialogue_history)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 更新对话历史(AI响应)
-            self.dialogue_history.append({"role": "assistant", "content": output_content})
-            self._update_dialogue_history('assistant', output_content)
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, self.dialogue_id, tokens_used
+        return self._invoke_chat(model_type, prompt_id, call_mode, data, prefix_cache, detailed_usage)
 
 
 class ZhipuAIProvider(BaseProvider):
     """智谱AI（ZhipuAI）模型提供商的实现类"""
     
+    provider_name = 'zhipuai'
+    chat_options = {name: name for name in ('temperature', 'top_p', 'max_tokens', 'stop')}
+    embedding_url = "https://open.bigmodel.cn/api/paas/v4/embeddings"
+    embedding_model = 'embedding-3'
+    embedding_batch_size = 64
+    
     def __init__(self, config_manager: ConfigManager = None):
         """初始化智谱AI提供商"""
         super().__init__(config_manager)
@@ -480,7 +1901,8 @@ class ZhipuAIProvider(BaseProvider):
         except AICallerConfigError as e:
             raise AICallerConfigError(f"ZhipuAI初始化失败: {str(e)}")
     
-    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3) -> Dict:
+    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3,
+                       options: Dict[str, Any] = None) -> Dict:
         """
         调用智谱AI API
         
@@ -488,6 +1910,7 @@ class ZhipuAIProvider(BaseProvider):
             model_type: 智谱AI模型型号，如'glm-4'
             messages: 消息列表
             max_retries: 最大重试次数
+            options: 可选的生成参数，使用OpenAI兼容的参数名，如temperature、max_tokens
             
         Returns:
             Dict: API响应
@@ -506,12 +1929,13 @@ class ZhipuAIProvider(BaseProvider):
             "temperature": 0.7,
             "top_p": 0.7
         }
+        payload.update(self._chat_parameters(options))
         
         retries = 0
         
         while retries <= max_retries:
             try:
-                response = requests.post(url, headers=headers, json=payload)
+                response = self._http_post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 return response.json()
             
@@ -539,7 +1963,8 @@ class ZhipuAIProvider(BaseProvider):
                     time.sleep(wait_time)
                     continue
     
-    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict]) -> Tuple[Union[str, List, Dict], str, int]:
+    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+               prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
         """
         调用智谱AI模型处理数据
         
@@ -548,74 +1973,25 @@ class ZhipuAIProvider(BaseProvider):
             prompt_id: 提示词ID
             call_mode: 调用模式，'single_response'或'continuous_dialogue' 
             data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否将提示词模板作为固定的system消息发送，数据放在其后的user消息中，以命中提供商的前缀缓存
+            detailed_usage: 是否返回包含缓存命中Token数的token使用统计字典，而不是总Token数
             
         Returns:
-            Tuple: (处理后的数据, 对话ID, 消耗的Token数)
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
             
         Raises:
             AICallerInputError: 无效的调用模式
             AICallerAPIError: API调用失败
         """
-        # 验证调用模式
-        if call_mode not in ['single_response', 'continuous_dialogue']:
-            raise AICallerInputError(f"无效的调用模式: {call_mode}，仅支持'single_response'或'continuous_dialogue'")
-            
-        # 格式化提示词
-        formatted_prompt = self._format_prompt(prompt_id, data)
-        
-        # 根据调用模式处理请求
-        if call_mode == 'single_response':
-            # 单次响应模式
-            messages = [{"role": "user", "content": formatted_prompt}]
-            
-            # 调用API
-            response = self._make_api_call(model_type, messages)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 生成唯一ID用于此次调用
-            call_id = str(uuid.uuid4())
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, call_id, tokens_used
-            
-        else:  # continuous_dialogue模式
-            # 如果是新对话，初始化对话状态
-            if not self.dialogue_id:
-                self._init_dialogue(prompt_id)
-            
-            # 更新对话历史(用户输入)
-            self.dialogue_history.append({"role": "user", "content": formatted_prompt})
-            self._update_dialogue_history('user', formatted_prompt)
-            
-            # 调用API
-            response = self._make_api_call(model_type, self.dialogue_history)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 更新对话历史(AI响应)
-            self.dialogue_history.append({"role": "assistant", "content": output_content})
-            self._update_dialogue_history('assistant', output_content)
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, self.dialogue_id, tokens_used
+        return self._invoke_chat(model_type, prompt_id, call_mode, data, prefix_cache, detailed_usage)
 
 
 class DeepSeekProvider(BaseProvider):
     """DeepSeek模型提供商的实现类"""
     
+    provider_name = 'deepseek'
+    chat_options = {name: name for name in ('temperature', 'top_p', 'max_tokens', 'stop', 'presence_penalty', 'frequency_penalty', 'seed')}
+    
     def __init__(self, config_manager: ConfigManager = None):
         """初始化DeepSeek提供商"""
         super().__init__(config_manager)
@@ -625,7 +2001,8 @@ class DeepSeekProvider(BaseProvider):
         except AICallerConfigError as e:
             raise AICallerConfigError(f"DeepSeek初始化失败: {str(e)}")
     
-    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3) -> Dict:
+    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3,
+                       options: Dict[str, Any] = None) -> Dict:
         """
         调用DeepSeek API
         
@@ -633,6 +2010,7 @@ class DeepSeekProvider(BaseProvider):
             model_type: DeepSeek模型型号，如'deepseek-chat'
             messages: 消息列表
             max_retries: 最大重试次数
+            options: 可选的生成参数，使用OpenAI兼容的参数名，如temperature、max_tokens
             
         Returns:
             Dict: API响应
@@ -651,12 +2029,13 @@ class DeepSeekProvider(BaseProvider):
             "temperature": 0.7,
             "max_tokens": 1000
         }
+        payload.update(self._chat_parameters(options))
         
         retries = 0
         
         while retries <= max_retries:
             try:
-                response = requests.post(url, headers=headers, json=payload)
+                response = self._http_post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 return response.json()
             
@@ -684,7 +2063,8 @@ class DeepSeekProvider(BaseProvider):
                     time.sleep(wait_time)
                     continue
     
-    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict]) -> Tuple[Union[str, List, Dict], str, int]:
+    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+               prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
         """
         调用DeepSeek模型处理数据
         
@@ -693,74 +2073,25 @@ class DeepSeekProvider(BaseProvider):
             prompt_id: 提示词ID
             call_mode: 调用模式，'single_response'或'continuous_dialogue' 
             data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否将提示词模板作为固定的system消息发送，数据放在其后的user消息中，以命中提供商的前缀缓存
+            detailed_usage: 是否返回包含缓存命中Token数的token使用统计字典，而不是总Token数
             
         Returns:
-            Tuple: (处理后的数据, 对话ID, 消耗的Token数)
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
             
         Raises:
             AICallerInputError: 无效的调用模式
             AICallerAPIError: API调用失败
         """
-        # 验证调用模式
-        if call_mode not in ['single_response', 'continuous_dialogue']:
-            raise AICallerInputError(f"无效的调用模式: {call_mode}，仅支持'single_response'或'continuous_dialogue'")
-            
-        # 格式化提示词
-        formatted_prompt = self._format_prompt(prompt_id, data)
-        
-        # 根据调用模式处理请求
-        if call_mode == 'single_response':
-            # 单次响应模式
-            messages = [{"role": "user", "content": formatted_prompt}]
-            
-            # 调用API
-            response = self._make_api_call(model_type, messages)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 生成唯一ID用于此次调用
-            call_id = str(uuid.uuid4())
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, call_id, tokens_used
-            
-        else:  # continuous_dialogue模式
-            # 如果是新对话，初始化对话状态
-            if not self.dialogue_id:
-                self._init_dialogue(prompt_id)
-            
-            # 更新对话历史(用户输入)
-            self.dialogue_history.append({"role": "user", "content": formatted_prompt})
-            self._update_dialogue_history('user', formatted_prompt)
-            
-            # 调用API
-            response = self._make_api_call(model_type, self.dialogue_history)
-            
-            # 提取响应内容
-            output_content = response['choices'][0]['message']['content']
-            
-            # 更新对话历史(AI响应)
-            self.dialogue_history.append({"role": "assistant", "content": output_content})
-            self._update_dialogue_history('assistant', output_content)
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, self.dialogue_id, tokens_used
+        return self._invoke_chat(model_type, prompt_id, call_mode, data, prefix_cache, detailed_usage)
 
 
 class BaiduQianfanProvider(BaseProvider):
     """百度千帆大模型提供商实现类"""
     
+    provider_name = 'qianfan'
+    chat_options = {'temperature': 'temperature', 'top_p': 'top_p', 'max_tokens': 'max_output_tokens', 'stop': 'stop'}
+    
     def __init__(self, config_manager: ConfigManager = None):
         """初始化百度千帆提供商"""
         super().__init__(config_manager)
@@ -797,7 +2128,7 @@ class BaiduQianfanProvider(BaseProvider):
         }
         
         try:
-            response = requests.post(url, params=params)
+            response = self._http_post(url, params=params)
             response.raise_for_status()
             result = response.json()
             if "access_token" not in result:
@@ -810,7 +2141,8 @@ class BaiduQianfanProvider(BaseProvider):
         except requests.RequestException as e:
             raise AICallerAPIError(f"百度千帆获取access_token网络错误: {str(e)}")
     
-    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3) -> Dict:
+    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3,
+                       options: Dict[str, Any] = None) -> Dict:
         """
         调用百度千帆API
         
@@ -818,6 +2150,7 @@ class BaiduQianfanProvider(BaseProvider):
             model_type: 模型类型，如'ernie-bot-4'
             messages: 消息列表
             max_retries: 最大重试次数
+            options: 可选的生成参数，使用OpenAI兼容的参数名，如temperature、max_tokens
             
         Returns:
             Dict: API响应
@@ -841,13 +2174,14 @@ class BaiduQianfanProvider(BaseProvider):
             "temperature": 0.7,
             "top_p": 0.9
         }
+        payload.update(self._chat_parameters(options))
         
         retries = 0
         last_error = None
         
         while retries <= max_retries:
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self._http_post(url, headers=headers, json=payload, timeout=30)
                 response.raise_for_status()
                 return response.json()
             except requests.RequestException as e:
@@ -908,7 +2242,7 @@ class BaiduQianfanProvider(BaseProvider):
         messages.append({"role": "user", "content": content})
         
         # 调用API
-        response = self._make_api_call(model_type, messages)
+        response = self._call_api(model_type, messages)
         
         # 处理响应
         if "error_code" in response:
@@ -933,6 +2267,12 @@ class BaiduQianfanProvider(BaseProvider):
 class AliQwenProvider(BaseProvider):
     """阿里千问大模型提供商实现类"""
     
+    provider_name = 'aliqwen'
+    chat_options = {name: name for name in ('temperature', 'top_p', 'max_tokens', 'stop', 'presence_penalty', 'seed')}
+    embedding_url = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
+    embedding_model = 'text-embedding-v3'
+    embedding_batch_size = 10
+    
     def __init__(self, config_manager: ConfigManager = None):
         """初始化阿里千问提供商"""
         super().__init__(config_manager)
@@ -942,7 +2282,8 @@ class AliQwenProvider(BaseProvider):
         except AICallerConfigError as e:
             raise AICallerConfigError(f"阿里千问初始化失败: {str(e)}")
     
-    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3) -> Dict:
+    def _make_api_call(self, model_type: str, messages: List[Dict[str, str]], max_retries: int = 3,
+                       options: Dict[str, Any] = None) -> Dict:
         """
         调用阿里千问API
         
@@ -950,6 +2291,7 @@ class AliQwenProvider(BaseProvider):
             model_type: 模型类型，如'qwen-turbo-latest'
             messages: 消息列表
             max_retries: 最大重试次数
+            options: 可选的生成参数，使用OpenAI兼容的参数名，如temperature、max_tokens
             
         Returns:
             Dict: API响应
@@ -976,13 +2318,14 @@ class AliQwenProvider(BaseProvider):
                 "result_format": "message"
             }
         }
+        payload["parameters"].update(self._chat_parameters(options))
         
         retries = 0
         last_error = None
         
         while retries <= max_retries:
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self._http_post(url, headers=headers, json=payload, timeout=30)
                 response.raise_for_status()
                 return response.json()
             except requests.RequestException as e:
@@ -1010,7 +2353,20 @@ class AliQwenProvider(BaseProvider):
                 
         raise AICallerAPIError(f"阿里千问API调用失败，已重试{max_retries}次: {error_message}")
     
-    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict]) -> Tuple[Union[str, List, Dict], str, int]:
+    def _extract_output_content(self, response: Dict) -> str:
+        """从阿里千问API响应中提取模型输出文本"""
+        return response['output']['choices'][0]['message']['content']
+    
+    def _build_embedding_payload(self, model: str, texts: List[str]) -> Dict:
+        """构建阿里千问原生向量接口的请求体"""
+        return {"model": model, "input": {"texts": texts}}
+    
+    def _extract_embeddings(self, response: Dict) -> List[List[float]]:
+        """从阿里千问原生向量接口的响应中按输入顺序提取向量"""
+        return [item['embedding'] for item in sorted(response['output']['embeddings'], key=lambda item: item['text_index'])]
+    
+    def invoke(self, model_type: str, prompt_id: str, call_mode: str, data: Union[str, List, Dict],
+               prefix_cache: bool = False, detailed_usage: bool = False) -> Tuple[Union[str, List, Dict], str, Union[int, Dict]]:
         """
         调用阿里千问模型处理数据
         
@@ -1019,69 +2375,17 @@ class AliQwenProvider(BaseProvider):
             prompt_id: 提示词ID
             call_mode: 调用模式，'single_response'或'continuous_dialogue' 
             data: 需要处理的数据，可以是字符串、列表或字典
+            prefix_cache: 是否将提示词模板作为固定的system消息发送，数据放在其后的user消息中，以命中提供商的前缀缓存
+            detailed_usage: 是否返回包含缓存命中Token数的token使用统计字典，而不是总Token数
             
         Returns:
-            Tuple: (处理后的数据, 对话ID, 消耗的Token数)
+            Tuple: (处理后的数据, 对话ID, 消耗的Token数或token使用统计)
             
         Raises:
             AICallerInputError: 无效的调用模式
             AICallerAPIError: API调用失败
         """
-        # 验证调用模式
-        if call_mode not in ['single_response', 'continuous_dialogue']:
-            raise AICallerInputError(f"无效的调用模式: {call_mode}，仅支持'single_response'或'continuous_dialogue'")
-            
-        # 格式化提示词
-        formatted_prompt = self._format_prompt(prompt_id, data)
-        
-        # 根据调用模式处理请求
-        if call_mode == 'single_response':
-            # 单次响应模式
-            messages = [{"role": "user", "content": formatted_prompt}]
-            
-            # 调用API
-            response = self._make_api_call(model_type, messages)
-            
-            # 提取响应内容
-            output_content = response['output']['choices'][0]['message']['content']
-            
-            # 生成唯一ID用于此次调用
-            call_id = str(uuid.uuid4())
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, call_id, tokens_used
-            
-        else:  # continuous_dialogue模式
-            # 如果是新对话，初始化对话状态
-            if not self.dialogue_id:
-                self._init_dialogue(prompt_id)
-            
-            # 更新对话历史(用户输入)
-            self.dialogue_history.append({"role": "user", "content": formatted_prompt})
-            self._update_dialogue_history('user', formatted_prompt)
-            
-            # 调用API
-            response = self._make_api_call(model_type, self.dialogue_history)
-            
-            # 提取响应内容
-            output_content = response['output']['choices'][0]['message']['content']
-            
-            # 更新对话历史(AI响应)
-            self.dialogue_history.append({"role": "assistant", "content": output_content})
-            self._update_dialogue_history('assistant', output_content)
-            
-            # 提取Token使用信息
-            tokens_used = response['usage']['total_tokens']
-            
-            # 根据输入类型处理输出
-            processed_output = self._get_output_with_matching_type(output_content, data)
-            
-            return processed_output, self.dialogue_id, tokens_used
+        return self._invoke_chat(model_type, prompt_id, call_mode, data, prefix_cache, detailed_usage)
 
 
 class PackageUtils:
@@ -1109,6 +2413,98 @@ class PackageUtils:
         """
         return self.config_manager.list_available_prompt_ids()
     
+    def validate_output(self, output: Any, input_data: Union[str, List, Dict], schema: Dict = None) -> Tuple[bool, str]:
+        """
+        校验模型输出是否可用：类型需与输入匹配，指定schema时还需符合该JSON Schema
+        
+        schema只支持常用的子集：type、enum、properties、required、additionalProperties、items、minItems、maxItems
+        
+        Args:
+            output: 经_get_output_with_matching_type处理后的模型输出
+            input_data: 原始输入数据
+            schema: 可选的JSON Schema字典
+            
+        Returns:
+            Tuple[bool, str]: (是否有效, 无效原因)
+        """
+        # 列表或字典输入时，输出未能解析为相同类型即视为无效
+        if isinstance(input_data, (list, dict)) and not isinstance(output, type(input_data)):
+            return False, f"输出类型{type(output).__name__}与输入类型{type(input_data).__name__}不一致"
+        
+        if schema is None:
+            return True, ""
+        
+        # 字符串输入时，输出需先解析为JSON才能按schema校验
+        if isinstance(output, str):
+            try:
+                output = json.loads(output)
+            except json.JSONDecodeError:
+                return False, "输出不是有效的JSON"
+        
+        return self._check_schema(output, schema, "$")
+    
+    def _check_schema(self, value: Any, schema: Dict, path: str) -> Tuple[bool, str]:
+        """
+        递归校验value是否符合schema
+        
+        Args:
+            value: 待校验的值
+            schema: JSON Schema字典
+            path: 当前值在整体输出中的路径，用于错误信息
+            
+        Returns:
+            Tuple[bool, str]: (是否有效, 无效原因)
+        """
+        type_map = {
+            'object': dict,
+            'array': list,
+            'string': str,
+            'integer': int,
+            'number': (int, float),
+            'boolean': bool,
+            'null': type(None)
+        }
+        
+        expected_type = schema.get('type')
+        if expected_type:
+            expected_types = expected_type if isinstance(expected_type, list) else [expected_type]
+            # bool是int的子类，数字类型校验时需要排除
+            matched = any(
+                isinstance(value, type_map[t]) and not (t in ('integer', 'number') and isinstance(value, bool))
+                for t in expected_types if t in type_map
+            )
+            if not matched:
+                return False, f"{path}: 期望类型{expected_type}，实际为{type(value).__name__}"
+        
+        if 'enum' in schema and value not in schema['enum']:
+            return False, f"{path}: 值{value!r}不在允许的取值范围内"
+        
+        if isinstance(value, dict):
+            for key in schema.get('required', []):
+                if key not in value:
+                    return False, f"{path}: 缺少必需字段'{key}'"
+            properties = schema.get('properties', {})
+            for key, item in value.items():
+                if key in properties:
+                    valid, reason = self._check_schema(item, properties[key], f"{path}.{key}")
+                    if not valid:
+                        return False, reason
+                elif schema.get('additionalProperties') is False:
+                    return False, f"{path}: 不允许的字段'{key}'"
+        
+        if isinstance(value, list):
+            if 'minItems' in schema and len(value) < schema['minItems']:
+                return False, f"{path}: 元素数量{len(value)}少于{schema['minItems']}"
+            if 'maxItems' in schema and len(value) > schema['maxItems']:
+                return False, f"{path}: 元素数量{len(value)}多于{schema['maxItems']}"
+            if isinstance(schema.get('items'), dict):
+                for index, item in enumerate(value):
+                    valid, reason = self._check_schema(item, schema['items'], f"{path}[{index}]")
+                    if not valid:
+                        return False, reason
+        
+        return True, ""
+    
     def test_api_connectivity(self, provider_name: str, model_type: str = None, max_retries: int = 3) -> Tuple[bool, str]:
         """
         测试与指定提供商API的连接性，最多重试三次
@@ -1225,6 +2621,59 @@ class AICaller:
         self.config_manager = ConfigManager(config_path)
         self.utils = PackageUtils(self.config_manager)
         self._providers = {}  # 缓存已创建的提供商实例
+        
+        # 配置文件中启用near_dup_cache时，所有提供商共享同一个近似缓存
+        self.response_cache = None
+        cache_config = self.config_manager.config.get('near_dup_cache') or {}
+        if cache_config.get('enabled', False):
+            self.response_cache = NearDuplicateCache(
+                threshold=cache_config.get('threshold', 1.0),
+                max_entries=cache_config.get('max_entries', 10000),
+                audit_rate=cache_config.get('audit_rate', 0.0),
+                ignore_patterns=cache_config.get('ignore_patterns')
+            )
+        
+        # 配置文件中启用scheduler时，所有提供商共享同一个请求调度器
+        self.scheduler = None
+        scheduler_config = self.config_manager.config.get('scheduler') or {}
+        if scheduler_config.get('enabled', False):
+            self.scheduler = RequestScheduler(
+                max_in_flight=scheduler_config.get('max_in_flight', 8),
+                weights=scheduler_config.get('weights')
+            )
+        
+        # 所有提供商共享同一个向量缓存
+        embedding_config = self.config_manager.config.get('embedding_cache') or {}
+        self.embedding_cache = EmbeddingCache(max_entries=embedding_config.get('max_entries', 100000))
+        
+        # 配置文件中指定cassette时，所有提供商共享同一个录制/回放磁带
+        self.cassette = None
+        cassette_config = self.config_manager.config.get('cassette') or {}
+        if cassette_config.get('path'):
+            self.cassette = Cassette(
+                cassette_config['path'],
+                mode=cassette_config.get('mode', 'replay'),
+                simulate_latency=cassette_config.get('simulate_latency', False),
+                latency_scale=cassette_config.get('latency_scale', 1.0),
+                ignore_patterns=cassette_config.get('ignore_patterns')
+            )
+        
+        # 配置文件中指定transport时，所有提供商共享同一个传输层，否则各自使用默认的requests传输层
+        transport_config = self.config_manager.config.get('transport')
+        self.transport = create_transport(transport_config) if transport_config else None
+    
+    def _get_or_create(self, name: str, provider_class: type) -> BaseProvider:
+        """创建提供商实例并挂载共享的近似缓存、调度器、磁带和传输层，之后直接返回缓存的实例"""
+        if name not in self._providers:
+            provider = provider_class(self.config_manager)
+            provider.response_cache = self.response_cache
+            provider.scheduler = self.scheduler
+            provider.embedding_cache = self.embedding_cache
+            provider.cassette = self.cassette
+            if self.transport is not None:
+                provider.transport = self.transport
+            self._providers[name] = provider
+        return self._providers[name]
     
     def openai(self) -> OpenAIProvider:
         """
@@ -1233,9 +2682,7 @@ class AICaller:
         Returns:
             OpenAIProvider: OpenAI提供商实例
         """
-        if 'openai' not in self._providers:
-            self._providers['openai'] = OpenAIProvider(self.config_manager)
-        return self._providers['openai']
+        return self._get_or_create('openai', OpenAIProvider)
     
     def zhipuai(self) -> ZhipuAIProvider:
         """
@@ -1244,9 +2691,7 @@ class AICaller:
         Returns:
             ZhipuAIProvider: 智谱AI提供商实例
         """
-        if 'zhipuai' not in self._providers:
-            self._providers['zhipuai'] = ZhipuAIProvider(self.config_manager)
-        return self._providers['zhipuai']
+        return self._get_or_create('zhipuai', ZhipuAIProvider)
     
     def deepseek(self) -> DeepSeekProvider:
         """
@@ -1255,9 +2700,7 @@ class AICaller:
         Returns:
             DeepSeekProvider: DeepSeek提供商实例
         """
-        if 'deepseek' not in self._providers:
-            self._providers['deepseek'] = DeepSeekProvider(self.config_manager)
-        return self._providers['deepseek']
+        return self._get_or_create('deepseek', DeepSeekProvider)
     
     def aliqwen(self) -> AliQwenProvider:
         """
@@ -1266,9 +2709,7 @@ class AICaller:
         Returns:
             AliQwenProvider: 阿里千问提供商实例
         """
-        if 'aliqwen' not in self._providers:
-            self._providers['aliqwen'] = AliQwenProvider(self.config_manager)
-        return self._providers['aliqwen']
+        return self._get_or_create('aliqwen', AliQwenProvider)
     
     def check_config(self) -> bool:
         """检查配置有效性"""
@@ -1293,6 +2734,134 @@ class AICaller:
             List[str]: 模型列表
         """
         return self.config_manager.get_models(provider_name)
+    
+    def cache_stats(self) -> Dict[str, Union[int, float]]:
+        """
+        获取近似缓存的命中率和审计统计
+        
+        Returns:
+            Dict: 缓存统计信息，未启用近似缓存时返回空字典
+        """
+        return self.response_cache.get_stats() if self.response_cache else {}
+    
+    def scheduler_stats(self) -> Dict[str, Dict]:
+        """
+        获取请求调度器的排队统计
+        
+        Returns:
+            Dict: 每个提供商各优先级的排队数与排队等待时间，未启用调度器时返回空字典
+        """
+        return self.scheduler.get_stats() if self.scheduler else {}
+    
+    def cassette_stats(self) -> Dict[str, int]:
+        """
+        获取录制/回放磁带的统计
+        
+        Returns:
+            Dict: 回放、录制和未命中次数，未启用磁带时返回空字典
+        """
+        return self.cassette.get_stats() if self.cassette else {}
+    
+    def close(self) -> None:
+        """保存磁带索引并关闭共享的传输层"""
+        if self.cassette is not None:
+            self.cassette.close()
+        if self.transport is not None:
+            self.transport.close()
+    
+    def get_provider(self, provider_name: str) -> BaseProvider:
+        """
+        按名称获取提供商实例
+        
+        Args:
+            provider_name: 提供商名称，如'openai'、'deepseek'
+            
+        Returns:
+            BaseProvider: 对应的提供商实例
+            
+        Raises:
+            AICallerInputError: 不支持的提供商名称
+        """
+        getters = {
+            'openai': self.openai,
+            'zhipuai': self.zhipuai,
+            'deepseek': self.deepseek,
+            'aliqwen': self.aliqwen,
+            'qwen': self.aliqwen
+        }
+        if provider_name.lower() not in getters:
+            raise AICallerInputError(f"不支持的提供商: {provider_name}")
+        return getters[provider_name.lower()]()
+    
+    def invoke_cascade(self, prompt_id: str, data: Union[str, List, Dict], tiers: List[Tuple[str, str]] = None,
+                       schema: Dict = None, prefix_cache: bool = False) -> Tuple[Union[str, List, Dict], str, Dict]:
+        """
+        模型级联调用：按顺序尝试多个(提供商, 模型)，输出校验失败时才升级到下一级
+        
+        先用便宜的小模型处理，只有当输出类型与输入不匹配、不符合schema或调用出错时，
+        才改用下一级模型，从而在多数请求上节省延迟和费用。
+        
+        Args:
+            prompt_id: 提示词ID
+            data: 需要处理的数据，可以是字符串、列表或字典
+            tiers: 按升级顺序排列的(提供商名称, 模型型号)列表，为None时读取配置文件中的cascade字段
+            schema: 可选的JSON Schema，输出需符合该schema才算有效
+            prefix_cache: 是否使用前缀缓存友好的消息布局
+            
+        Returns:
+            Tuple: (处理后的数据, 调用ID, 级联统计)，级联统计包含应答的tier序号、provider、model、
+                   所有尝试累计的total_tokens，以及每次尝试的明细attempts
+            
+        Raises:
+            AICallerConfigError: 未指定tiers且配置文件中没有cascade字段，或有级别的提供商无法创建（名称未知、缺少API密钥）
+            AICallerAPIError: 所有级别都未能返回有效输出
+        """
+        if tiers is None:
+            tiers = [(tier['provider'], tier['model']) for tier in self.config_manager.config.get('cascade', [])]
+            if not tiers:
+                raise AICallerConfigError("未指定tiers，且配置文件中缺少'cascade'字段")
+        
+        # 先创建所有级别的提供商，配置错误不应等到前面的级别失败后才暴露
+        providers = []
+        config_errors = []
+        for index, (provider_name, model_type) in enumerate(tiers):
+            try:
+                providers.append(self.get_provider(provider_name))
+            except (AICallerConfigError, AICallerInputError) as e:
+                config_errors.append(f"第{index}级 {provider_name}/{model_type}: {e}")
+        if config_errors:
+            raise AICallerConfigError(f"级联调用的配置有误: {'; '.join(config_errors)}")
+        
+        attempts = []
+        total_tokens = 0
+        
+        for index, ((provider_name, model_type), provider) in enumerate(zip(tiers, providers)):
+            attempt = {"tier": index, "provider": provider_name, "model": model_type, "total_tokens": 0}
+            attempts.append(attempt)
+            try:
+                output, call_id, usage = provider.invoke(
+                    model_type, prompt_id, 'single_response', data, prefix_cache=prefix_cache, detailed_usage=True
+                )
+            except (AICallerAPIError, KeyError) as e:
+                attempt["error"] = str(e)
+                continue
+            
+            attempt["total_tokens"] = usage['total_tokens']
+            total_tokens += usage['total_tokens']
+            
+            valid, reason = self.utils.validate_output(output, data, schema)
+            if valid:
+                return output, call_id, {
+                    "tier": index,
+                    "provider": provider_name,
+                    "model": model_type,
+                    "total_tokens": total_tokens,
+                    "attempts": attempts
+                }
+            attempt["error"] = reason
+        
+        details = "; ".join(f"{a['provider']}/{a['model']}: {a.get('error', '')}" for a in attempts)
+        raise AICallerAPIError(f"级联调用的所有级别都未能返回有效输出: {details}")
 
 
 def create_provider(provider_name: str, config_path: str = None) -> BaseProvider:
@@ -0,0 +1,538 @@
+"""
+OpenAI兼容的本地代理服务器
+
+在AICaller的各个提供商之前提供统一的 /v1/chat/completions 与 /v1/models 接口，
+编辑器、SDK等客户端只需指向这一个本地地址。代理负责：
+
+- 按配置文件models字段把模型名映射到提供商，同一模型配置在多个提供商下时按顺序故障转移
+- 复用到上游的HTTP连接池
+- 确定性请求（temperature为0或指定了seed）的响应缓存（LRU）
+- 按客户端的令牌桶限流
+- SSE流式响应（stream=true）
+
+用法:
+    python ai_proxy_server.py --port 8000
+    python ai_proxy_server.py --port 8000 --echo   # 不调用上游，直接回显，用于压测代理本身
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+try:
+    from .ai_caller import AICaller, AICallerAPIError, AICallerConfigError, BaseProvider
+except ImportError:
+    from ai_caller import AICaller, AICallerAPIError, AICallerConfigError, BaseProvider
+
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway'
+}
+
+
+class ProxyHTTPError(Exception):
+    """需要以HTTP错误响应返回给客户端的错误"""
+    
+    def __init__(self, status: int, message: str, error_type: str = 'invalid_request_error'):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+
+
+class TokenBucket:
+    """令牌桶限流器，按固定速率补充令牌，允许一定的突发"""
+    
+    def __init__(self, rate: float, capacity: int):
+        """
+        初始化令牌桶
+        
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量，即允许的最大突发请求数
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+    
+    def allow(self) -> bool:
+        """
+        尝试取出一个令牌
+        
+        Returns:
+            bool: 是否允许本次请求
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def is_full(self, now: float) -> bool:
+        """
+        判断到某一时刻令牌桶是否已经补满，补满的桶与新建的桶等价，可以直接丢弃
+        
+        Args:
+            now: time.monotonic()的时间
+            
+        Returns:
+            bool: 是否已补满
+        """
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class ProxyServer:
+    """基于asyncio的OpenAI兼容代理服务器"""
+    
+    MAX_BODY_SIZE = 10 * 1024 * 1024
+    SSE_CHUNK_SIZE = 32
+    # 转发给上游的生成参数；不影响响应内容的字段直接忽略，其余参数（如tools、n>1）代理无法实现，返回400
+    FORWARDED_OPTIONS = ('temperature', 'top_p', 'max_tokens', 'stop', 'presence_penalty', 'frequency_penalty', 'seed')
+    IGNORED_FIELDS = ('model', 'messages', 'stream', 'stream_options', 'user')
+    # 最多保留的客户端令牌桶数，超出时淘汰最久未请求的客户端
+    MAX_RATE_LIMIT_CLIENTS = 10000
+    
+    def __init__(self, caller: AICaller, rate_limit: float = 20.0, burst: int = 40, cache_size: int = 1024,
+                 max_upstream: int = 64, api_key: str = None, echo: bool = False):
+        """
+        初始化代理服务器
+        
+        Args:
+            caller: AICaller实例，提供配置和各提供商
+            rate_limit: 每个客户端每秒允许的请求数，0表示不限流
+            burst: 每个客户端允许的突发请求数
+            cache_size: 响应缓存条数，0表示不缓存；只缓存temperature为0或指定了seed的请求
+            max_upstream: 同时进行的上游请求数，同时也是每个提供商连接池的大小
+            api_key: 客户端访问代理时需要携带的密钥，为None时不校验
+            echo: 回显模式，不调用上游，直接返回最后一条消息内容，用于压测代理本身
+        """
+        self.caller = caller
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.cache_size = cache_size
+        self.api_key = api_key
+        self.echo = echo
+        
+        self.executor = ThreadPoolExecutor(max_workers=max_upstream)
+        self.model_routes = self._build_model_routes(max_upstream)
+        self._buckets = OrderedDict()  # 客户端标识的SHA256 -> TokenBucket，按最近请求时间排序
+        self._cache = OrderedDict()  # 请求摘要 -> 上游响应(OpenAI格式)
+        self.stats = {"requests": 0, "cache_hits": 0, "failovers": 0, "rate_limited": 0, "upstream_errors": 0}
+    
+    def _build_model_routes(self, pool_size: int) -> Dict[str, List[str]]:
+        """
+        根据配置文件的models字段构建模型到提供商的路由表
+        
+        配置文件中指定了transport时各提供商使用共享的传输层，不再替换为连接池；否则为每个提供商启用连接池
+        
+        Args:
+            pool_size: 未指定transport时每个提供商连接池的大小
+            
+        Returns:
+            Dict[str, List[str]]: 模型名 -> 按故障转移顺序排列的提供商名称列表
+        """
+        routes = {}
+        for provider_name, models in (self.caller.config_manager.config.get('models') or {}).items():
+            try:
+                provider = self.caller.get_provider(provider_name)
+            except Exception as e:
+                # 未配置API密钥或不支持的提供商不参与路由
+                print(f"跳过提供商{provider_name}: {e}")
+                continue
+            if self.caller.transport is None:
+                provider.use_connection_pool(pool_size)
+            for model in models or []:
+                routes.setdefault(model, []).append(provider_name)
+        return routes
+    
+    async def start(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.AbstractServer:
+        """
+        启动服务器
+        
+        Args:
+            host: 监听地址
+            port: 监听端口
+            
+        Returns:
+            asyncio.AbstractServer: 服务器对象
+        """
+        return await asyncio.start_server(self._handle_connection, host, port, limit=64 * 1024, backlog=1024)
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个客户端连接，支持HTTP/1.1 keep-alive"""
+        peer = writer.get_extra_info('peername')
+        client_host = peer[0] if peer else 'unknown'
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ProxyHTTPError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                    
+                method, path, headers, body, keep_alive = request
+                try:
+                    await self._dispatch(writer, method, path, headers, body, keep_alive, client_host)
+                except ProxyHTTPError as e:
+                    await self._send_error(writer, e, keep_alive)
+                except Exception as e:
+                    await self._send_error(writer, ProxyHTTPError(500, f"代理内部错误: {e}", 'server_error'), keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Union[Tuple[str, str, Dict[str, str], bytes, bool], None]:
+        """
+        读取并解析一个HTTP请求
+        
+        Returns:
+            Tuple: (方法, 路径, 请求头, 请求体, 是否保持连接)，连接已关闭时返回None
+            
+        Raises:
+            ProxyHTTPError: 请求格式错误或请求体过大
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise ProxyHTTPError(400, "请求头过大")
+            
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise ProxyHTTPError(400, "无效的请求行")
+            
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+                
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise ProxyHTTPError(400, "不支持分块编码的请求体，请提供Content-Length")
+            
+        try:
+            length = int(headers.get('content-length', '0') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ProxyHTTPError(400, "无效的Content-Length")
+        if length > self.MAX_BODY_SIZE:
+            raise ProxyHTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b''
+        
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method.upper(), target.split('?', 1)[0], headers, body, keep_alive
+    
+    async def _dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, headers: Dict[str, str],
+                        body: bytes, keep_alive: bool, client_host: str) -> None:
+        """根据路径分发请求"""
+        self.stats["requests"] += 1
+        
+        if self.api_key is not None and headers.get('authorization', '') != f"Bearer {self.api_key}":
+            raise ProxyHTTPError(401, "无效的API密钥", 'authentication_error')
+            
+        if path == '/v1/models':
+            if method != 'GET':
+                raise ProxyHTTPError(405, "仅支持GET方法")
+            await self._send_json(writer, 200, self._list_models(), keep_alive)
+        elif path == '/v1/chat/completions':
+            if method != 'POST':
+                raise ProxyHTTPError(405, "仅支持POST方法")
+            self._check_rate_limit(headers.get('authorization') or client_host)
+            await self._chat_completions(writer, body, keep_alive)
+        else:
+            raise ProxyHTTPError(404, f"未知的路径: {path}")
+    
+    def _check_rate_limit(self, client_id: str) -> None:
+        """
+        按客户端限流
+        
+        客户端标识可能是API密钥，只以其SHA256作为键保存。已经补满的令牌桶与新建的等价，
+        每次请求时从最久未请求的一端开始丢弃，总数也不超过MAX_RATE_LIMIT_CLIENTS
+        
+        Args:
+            client_id: 客户端标识（Authorization头或客户端地址）
+        
+        Raises:
+            ProxyHTTPError: 超出限流
+        """
+        if not self.rate_limit:
+            return
+        key = hashlib.sha256(client_id.encode('utf-8')).hexdigest()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate_limit, self.burst)
+        else:
+            self._buckets.move_to_end(key)
+        allowed = bucket.allow()
+        
+        now = time.monotonic()
+        while len(self._buckets) > 1:
+            oldest_key, oldest = next(iter(self._buckets.items()))
+            if oldest_key == key or (len(self._buckets) <= self.MAX_RATE_LIMIT_CLIENTS and not oldest.is_full(now)):
+                break
+            del self._buckets[oldest_key]
+            
+        if not allowed:
+            self.stats["rate_limited"] += 1
+            raise ProxyHTTPError(429, "请求过于频繁，请稍后重试", 'rate_limit_error')
+    
+    def _list_models(self) -> Dict:
+        """构建 /v1/models 响应"""
+        return {
+            "object": "list",
+            "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": providers[0]}
+                for model, providers in self.model_routes.items()
+            ]
+        }
+    
+    async def _chat_completions(self, writer: asyncio.StreamWriter, body: bytes, keep_alive: bool) -> None:
+        """处理 /v1/chat/completions 请求"""
+        try:
+            request = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            raise ProxyHTTPError(400, "请求体不是有效的JSON")
+            
+        model = request.get('model')
+        messages = request.get('messages')
+        if not model or not isinstance(messages, list) or not messages:
+            raise ProxyHTTPError(400, "请求缺少model或messages字段")
+        if not self.echo and model not in self.model_routes:
+            raise ProxyHTTPError(404, f"未配置的模型: {model}", 'model_not_found')
+        options = self._parse_options(request)
+            
+        completion = await self._get_completion(model, messages, options)
+        if request.get('stream'):
+            await self._send_sse(writer, completion, keep_alive)
+        else:
+            await self._send_json(writer, 200, completion, keep_alive)
+    
+    def _parse_options(self, request: Dict) -> Dict[str, Any]:
+        """
+        取出需要转发给上游的生成参数
+        
+        Returns:
+            Dict: OpenAI兼容的参数名 -> 值
+            
+        Raises:
+            ProxyHTTPError: 请求包含代理不支持的参数
+        """
+        options = {name: request[name] for name in self.FORWARDED_OPTIONS if request.get(name) is not None}
+        if request.get('max_completion_tokens') is not None:
+            options.setdefault('max_tokens', request['max_completion_tokens'])
+        unsupported = sorted(
+            name for name, value in request.items()
+            if name not in self.FORWARDED_OPTIONS and name not in self.IGNORED_FIELDS and name != 'max_completion_tokens'
+            and value is not None and not (name == 'n' and value == 1)
+        )
+        if unsupported:
+            raise ProxyHTTPError(400, f"不支持的参数: {', '.join(unsupported)}")
+        return options
+    
+    async def _get_completion(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Dict:
+        """
+        获取补全结果：先查缓存，未命中时按路由顺序调用上游并在失败时故障转移
+        
+        只有确定性的请求（temperature为0或指定了seed）才读写缓存，其余请求每次的结果本就应当不同
+        
+        Returns:
+            Dict: OpenAI格式的chat.completion响应
+            
+        Raises:
+            ProxyHTTPError: 所有上游提供商都调用失败，或没有提供商支持请求的生成参数
+        """
+        options = options or {}
+        cacheable = bool(self.cache_size) and (options.get('temperature') == 0 or options.get('seed') is not None)
+        cache_key = hashlib.sha256(json.dumps([model, messages, options], ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        if cacheable and cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            self.stats["cache_hits"] += 1
+            return self._new_completion_id(self._cache[cache_key])
+            
+        if self.echo:
+            completion = self._echo_completion(model, messages)
+        else:
+            completion = await self._call_upstream(model, messages, options)
+            
+        if cacheable:
+            self._cache[cache_key] = completion
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return completion
+    
+    async def _call_upstream(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict:
+        """按路由顺序调用支持所请求生成参数的上游提供商，失败时切换到下一个"""
+        loop = asyncio.get_running_loop()
+        errors = []
+        providers = [self.caller.get_provider(name) for name in self.model_routes[model]]
+        providers = [provider for provider in providers if set(options) <= set(provider.chat_options)]
+        if not providers:
+            raise ProxyHTTPError(400, f"模型{model}的提供商不支持参数: {', '.join(sorted(options))}")
+        for index, provider in enumerate(providers):
+            provider_name = provider.provider_name or type(provider).__name__
+            if index > 0:
+                self.stats["failovers"] += 1
+            try:
+                # 上游调用是同步的，放到线程池中执行，避免阻塞事件循环；经过_call_api以使用调度器和磁带
+                response = await loop.run_in_executor(self.executor, provider._call_api, model, messages, options)
+                return self._to_openai_completion(provider, model, response)
+            except (AICallerAPIError, AICallerConfigError, KeyError) as e:
+                self.stats["upstream_errors"] += 1
+                errors.append(f"{provider_name}: {e}")
+        raise ProxyHTTPError(502, "所有上游提供商均调用失败: " + "; ".join(errors), 'upstream_error')
+    
+    def _to_openai_completion(self, provider: BaseProvider, model: str, response: Dict) -> Dict:
+        """将各提供商的响应统一转换为OpenAI的chat.completion格式"""
+        usage = provider._extract_usage(response)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": provider._extract_output_content(response)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": usage['prompt_tokens'],
+                "completion_tokens": usage['completion_tokens'],
+                "total_tokens": usage['total_tokens'],
+                "prompt_tokens_details": {"cached_tokens": usage['cached_tokens']}
+            }
+        }
+    
+    def _echo_completion(self, model: str, messages: List[Dict[str, str]]) -> Dict:
+        """回显模式下构造的补全结果"""
+        content = str(messages[-1].get('content', ''))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "prompt_tokens_details": {"cached_tokens": 0}}
+        }
+    
+    def _new_completion_id(self, completion: Dict) -> Dict:
+        """缓存命中时复制响应并生成新的ID"""
+        completion = dict(completion)
+        completion["id"] = f"chatcmpl-{uuid.uuid4().hex}"
+        completion["created"] = int(time.time())
+        return completion
+    
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool) -> None:
+        """发送JSON响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+    
+    async def _send_error(self, writer: asyncio.StreamWriter, error: ProxyHTTPError, keep_alive: bool) -> None:
+        """发送OpenAI格式的错误响应"""
+        payload = {"error": {"message": error.message, "type": error.error_type, "code": error.status}}
+        await self._send_json(writer, error.status, payload, keep_alive)
+    
+    async def _send_sse(self, writer: asyncio.StreamWriter, completion: Dict, keep_alive: bool) -> None:
+        """
+        以SSE流式发送补全结果
+        
+        上游提供商的调用是非流式的，这里把完整结果按chat.completion.chunk分片后以SSE格式发送，
+        使依赖流式接口的客户端可以直接使用
+        """
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/event-stream; charset=utf-8\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1'))
+        
+        content = completion["choices"][0]["message"]["content"] or ''
+        pieces = [content[i:i + self.SSE_CHUNK_SIZE] for i in range(0, len(content), self.SSE_CHUNK_SIZE)] or ['']
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ''}, "finish_reason": None}])]
+        events += [dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]) for piece in pieces]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=completion.get("usage")))
+        
+        for event in events:
+            self._write_chunk(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+            await writer.drain()
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    
+    def _write_chunk(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        """按HTTP分块编码写出一块数据"""
+        writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """按命令行参数启动代理服务器并持续运行"""
+    caller = AICaller(args.config)
+    proxy_config = caller.config_manager.config.get('proxy') or {}
+    server = ProxyServer(
+        caller,
+        rate_limit=args.rate_limit if args.rate_limit is not None else proxy_config.get('rate_limit', 20.0),
+        burst=args.burst if args.burst is not None else proxy_config.get('burst', 40),
+        cache_size=args.cache_size if args.cache_size is not None else proxy_config.get('cache_size', 1024),
+        max_upstream=args.max_upstream if args.max_upstream is not None else proxy_config.get('max_upstream', 64),
+        api_key=proxy_config.get('api_key'),
+        echo=args.echo
+    )
+    host = args.host or proxy_config.get('host', '127.0.0.1')
+    port = args.port or proxy_config.get('port', 8000)
+    
+    listener = await server.start(host, port)
+    print(f"代理服务器已启动: http://{host}:{port}/v1 ，可用模型: {', '.join(server.model_routes) or '(回显模式)'}")
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地代理服务器")
+    parser.add_argument('--config', type=str, default=None, help="配置文件路径，默认使用ai_caller_config.yaml")
+    parser.add_argument('--host', type=str, default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--rate-limit', type=float, default=None, help="每个客户端每秒允许的请求数，0表示不限流")
+    parser.add_argument('--burst', type=int, default=None, help="每个客户端允许的突发请求数")
+    parser.add_argument('--cache-size', type=int, default=None, help="响应缓存条数，0表示不缓存")
+    parser.add_argument('--max-upstream', type=int, default=None, help="同时进行的上游请求数")
+    parser.add_argument('--echo', action='store_true', help="回显模式，不调用上游，用于压测代理本身")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("代理服务器已停止")
@@ -0,0 +1,119 @@
+"""
+代理服务器压测脚本
+
+使用多个keep-alive连接并发请求 /v1/chat/completions，统计吞吐量与延迟分位数。
+压测代理本身的开销时，可以先以回显模式启动代理，避免消耗上游Token：
+
+    python ai_proxy_server.py --port 8000 --echo --rate-limit 0 --cache-size 0
+    python proxy_load_test.py --url http://127.0.0.1:8000 --concurrency 200 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+from urllib.parse import urlparse
+
+
+async def worker(host: str, port: int, path: str, payload: bytes, count: int, latencies: List[float], errors: Dict[str, int]) -> None:
+    """
+    在一个keep-alive连接上顺序发送count个请求
+    
+    Args:
+        host: 代理主机
+        port: 代理端口
+        path: 请求路径
+        payload: 请求体
+        count: 本连接发送的请求数
+        latencies: 收集每个请求的延迟（秒）
+        errors: 按错误类型统计错误次数
+    """
+    request = (
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n"
+    ).encode('latin-1') + payload
+    
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            
+            head = await reader.readuntil(b'\r\n\r\n')
+            status_line, *header_lines = head.decode('latin-1').split('\r\n')
+            headers = {}
+            for line in header_lines:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get('content-length', '0')))
+            latencies.append(time.perf_counter() - start)
+            
+            status = status_line.split(' ')[1]
+            if status != '200':
+                errors[status] = errors.get(status, 0) + 1
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    """计算已排序数据的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    """执行压测并返回统计结果"""
+    url = urlparse(args.url)
+    payload = json.dumps({
+        "model": args.model,
+        "messages": [{"role": "user", "content": args.message}],
+        "stream": False
+    }).encode('utf-8')
+    
+    # 把总请求数尽量平均分配到各个连接
+    per_worker = [args.requests // args.concurrency + (1 if i < args.requests % args.concurrency else 0) for i in range(args.concurrency)]
+    latencies = []
+    errors = {}
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(url.hostname, url.port or 80, '/v1/chat/completions', payload, count, latencies, errors)
+        for count in per_worker if count
+    ))
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90": round(percentile(latencies, 0.90) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0
+        },
+        "errors": errors
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="代理服务器压测")
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8000')
+    parser.add_argument('--model', type=str, default='gpt-3.5-turbo')
+    parser.add_argument('--message', type=str, default='Hello, this is a load test.')
+    parser.add_argument('--concurrency', type=int, default=100, help="并发连接数")
+    parser.add_argument('--requests', type=int, default=10000, help="总请求数")
+    print(json.dumps(asyncio.run(run(parser.parse_args())), ensure_ascii=False, indent=2))